@@ -5,7 +5,12 @@ import datetime
 import numpy as np
 from utils import (
     format_number, calculate_percentage_delta, calculate_business_metrics,
-    load_data_for_period, TAXA_ADWORK_PERCENT, get_usd_to_brl_rate
+    TAXA_ADWORK_PERCENT, get_usd_to_brl_rate,
+    safe_ratio, calculate_roi, calculate_roas,
+    get_filtered_period_data, get_kpi_cube, get_kpi_dimension_index, ADMANAGER_SOURCES,
+    render_paginated_table, style_table, sign_color_css, render_export_controls,
+    render_number_table, iter_frame_chunks, get_utm_children, UTM_TREE_LEVELS, UTM_TREE_LABELS,
+    top_n_with_others, top_n_selector
 )
 
 # --- Configuração da Página ---
@@ -13,8 +18,9 @@ st.set_page_config(layout="wide", page_title="Dashboard de Mídia - Gerenciament
 
 st.title("Gerenciamento de Sites")
 
-# --- FILTROS NO CORPO DA PÁGINA ---
-col_date_start, col_date_end, col_domain_filter, col_network_code_filter = st.columns([1, 1, 1.5, 1.5])
+# --- FILTROS DE PERÍODO ---
+# Ficam fora dos fragmentos: mudar as datas recarrega os períodos e reexecuta a página inteira.
+col_date_start, col_date_end = st.columns(2)
 
 with col_date_start:
     today = datetime.date.today()
@@ -43,499 +49,395 @@ duration = (end_date - start_date).days + 1
 prev_start_date = start_date - datetime.timedelta(days=duration)
 prev_end_date = end_date - datetime.timedelta(days=duration)
 
-# Carrega os dados BRUTOS (sem filtro de domínio ainda) para o período atual e anterior
-df_raw_current = load_data_for_period(start_date, end_date)
-df_raw_previous = load_data_for_period(prev_start_date, prev_end_date)
 
-# --- Filtro de Domínio (Agora na mesma linha das datas) ---
-with col_domain_filter:
-    st.write("Filtrar por Domínio (Admanager)")
-
-    multiselect_key = 'ms_domains_site'
-    checkbox_key = 'cb_all_domains_site'
-
-    available_domains_list = list(df_raw_current[
-        (df_raw_current['source'] == 'Admanager (UTM)') | (df_raw_current['source'] == 'Admanager (UTM) & Meta Ads') & (df_raw_current['dominio'].notna())
-    ]['dominio'].unique())
-    available_domains_list.sort()
-
-    if multiselect_key not in st.session_state:
-        st.session_state[multiselect_key] = available_domains_list
-
-    current_selected_valid = [d for d in st.session_state[multiselect_key] if d in available_domains_list]
-    if set(current_selected_valid) != set(st.session_state[multiselect_key]):
-        st.session_state[multiselect_key] = current_selected_valid
-    
-    def on_checkbox_change_site():
-        if st.session_state[checkbox_key]:
-            st.session_state[multiselect_key] = available_domains_list
-        else:
-            st.session_state[multiselect_key] = []
-
-    initial_checkbox_value = (set(st.session_state[multiselect_key]) == set(available_domains_list) and len(available_domains_list) > 0)
-    
-    st.checkbox(
-        "Selecionar Todos",
-        value=initial_checkbox_value,
-        key=checkbox_key,
-        on_change=on_checkbox_change_site
-    )
-
-    def on_multiselect_change_site():
-        if set(st.session_state[multiselect_key]) == set(available_domains_list) and len(available_domains_list) > 0:
-            st.session_state[checkbox_key] = True
-        else:
-            st.session_state[checkbox_key] = False
-
-    selected_domains = st.multiselect(
-        "Selecione os domínios:",
-        options=available_domains_list,
-        key=multiselect_key,
-        label_visibility="collapsed",
-        on_change=on_multiselect_change_site
-    )
-    if not available_domains_list:
-        selected_domains = []
-
-# Adição do filtro de Network Code
-with col_network_code_filter:
-    st.write("Filtrar por Network Code (Admanager)")
-
-    multiselect_key_nc = 'ms_network_code_site'
-    checkbox_key_nc = 'cb_all_network_code_site'
-
-    available_network_codes_list = list(df_raw_current[
-        ((df_raw_current['source'] == 'Admanager (UTM)') | (df_raw_current['source'] == 'Admanager (UTM) & Meta Ads')) & (df_raw_current['network_code'].notna())
-    ]['network_code'].unique())
-    available_network_codes_list.sort()
-
-    if multiselect_key_nc not in st.session_state:
-        st.session_state[multiselect_key_nc] = available_network_codes_list
-
-    current_selected_valid_nc = [nc for nc in st.session_state[multiselect_key_nc] if nc in available_network_codes_list]
-    if set(current_selected_valid_nc) != set(st.session_state[multiselect_key_nc]):
-        st.session_state[multiselect_key_nc] = current_selected_valid_nc
-
-    def on_checkbox_change_network_code_site():
-        if st.session_state[checkbox_key_nc]:
-            st.session_state[multiselect_key_nc] = available_network_codes_list
-        else:
-            st.session_state[multiselect_key_nc] = []
-
-    def on_multiselect_change_network_code_site():
-        if set(st.session_state[multiselect_key_nc]) == set(available_network_codes_list) and len(available_network_codes_list) > 0:
-            st.session_state[checkbox_key_nc] = True
-        else:
-            st.session_state[checkbox_key_nc] = False
-
-    initial_checkbox_value_nc = (set(st.session_state[multiselect_key_nc]) == set(available_network_codes_list) and len(available_network_codes_list) > 0)
-
-    st.checkbox(
-        "Selecionar Todos",
-        value=initial_checkbox_value_nc,
-        key=checkbox_key_nc,
-        on_change=on_checkbox_change_network_code_site
-    )
-
-    selected_network_codes = st.multiselect(
-        "Selecione os Network Codes:",
-        options=available_network_codes_list,
-        key=multiselect_key_nc,
-        label_visibility="collapsed",
-        on_change=on_multiselect_change_network_code_site
-    )
-    if not available_network_codes_list:
-        selected_network_codes = []
-
-# Lógica de aplicação dos filtros
-df_data_current_filtered = df_raw_current.copy()
-df_data_previous_filtered = df_raw_previous.copy()
-
-is_admanager_current = (df_data_current_filtered['source'] == 'Admanager (UTM)') | (df_data_current_filtered['source'] == 'Admanager (UTM) & Meta Ads')
-is_admanager_previous = (df_data_previous_filtered['source'] == 'Admanager (UTM)') | (df_data_previous_filtered['source'] == 'Admanager (UTM) & Meta Ads')
-
-if selected_domains:
-    domain_filter_current = df_data_current_filtered['dominio'].isin(selected_domains)
-    domain_filter_previous = df_data_previous_filtered['dominio'].isin(selected_domains)
-    is_admanager_current = is_admanager_current & domain_filter_current
-    is_admanager_previous = is_admanager_previous & domain_filter_previous
-else:
-    st.warning("Nenhum domínio do Admanager selecionado. Os dados de Admanager (UTM) e combinados não serão exibidos.")
-    is_admanager_current = False
-    is_admanager_previous = False
-
-if selected_network_codes:
-    network_filter_current = df_data_current_filtered['network_code'].isin(selected_network_codes)
-    network_filter_previous = df_data_previous_filtered['network_code'].isin(selected_network_codes)
-    is_admanager_current = is_admanager_current & network_filter_current
-    is_admanager_previous = is_admanager_previous & network_filter_previous
-else:
-    if selected_domains:
-         st.warning("Nenhum Network Code do Admanager selecionado. Os dados de Admanager (UTM) e combinados não serão exibidos.")
-    is_admanager_current = False
-    is_admanager_previous = False
-
-df_data_current_filtered = df_data_current_filtered[
-    (~ ((df_data_current_filtered['source'] == 'Admanager (UTM)') | (df_data_current_filtered['source'] == 'Admanager (UTM) & Meta Ads'))) | is_admanager_current
-].copy()
-df_data_previous_filtered = df_data_previous_filtered[
-    (~ ((df_data_previous_filtered['source'] == 'Admanager (UTM)') | (df_data_previous_filtered['source'] == 'Admanager (UTM) & Meta Ads'))) | is_admanager_previous
-].copy()
-
-
-st.markdown("--- ")
-
-if df_data_current_filtered.empty and df_data_previous_filtered.empty:
-    st.warning("Nenhum dado encontrado para o período selecionado e/ou domínios filtrados. Ajuste os filtros ou verifique as fontes de dados.")
-    st.stop()
-
-current_metrics = calculate_business_metrics(df_data_current_filtered)
-previous_metrics = calculate_business_metrics(df_data_previous_filtered)
-
-usd_to_brl_rate = get_usd_to_brl_rate()
-
-current_total_revenue_usd = current_metrics['total_receita'] / usd_to_brl_rate if usd_to_brl_rate != 0 else 0
-previous_total_revenue_usd = previous_metrics['total_receita'] / usd_to_brl_rate if usd_to_brl_rate != 0 else 0
-
-
-# --- Big Numbers (Visão Geral) ---
-st.subheader("Métricas Gerais do Período")
-col_nl, col_roi, col_roas, col_receita_usd, col_receita_brl = st.columns(5)
-
-with col_nl:
-    delta = calculate_percentage_delta(current_metrics['lucro_liquido'], previous_metrics['lucro_liquido'])
-    st.metric(
-        label="Lucro Líquido",
-        value=format_number(current_metrics['lucro_liquido'], currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_roi:
-    delta = calculate_percentage_delta(current_metrics['roi'], previous_metrics['roi'])
-    st.metric(
-        label="ROI",
-        value=format_number(current_metrics['roi'], percentage=True, decimal_places=2),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_roas:
-    delta = calculate_percentage_delta(current_metrics['roas'], previous_metrics['roas'])
-    st.metric(
-        label="ROAS",
-        value=format_number(current_metrics['roas'], decimal_places=2),
-        delta=f"{delta:,.2f}" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_receita_usd:
-    delta = calculate_percentage_delta(current_total_revenue_usd, previous_total_revenue_usd)
-    st.metric(
-        label="Receita Total (USD)",
-        value=f"${current_total_revenue_usd:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_receita_brl:
-    delta = calculate_percentage_delta(current_metrics['total_receita'], previous_metrics['total_receita'])
-    st.metric(
-        label="Receita Total (BRL)",
-        value=format_number(current_metrics['total_receita'], currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-
-st.markdown("---")
-
-# --- ESTATÍSTICAS ADMANAGER ---
-st.subheader("Estatísticas Admanager")
-
-df_admanager_current = df_data_current_filtered[
-    (df_data_current_filtered['source'].str.contains('Admanager')) &
-    (df_data_current_filtered['dominio'].notna())
-].copy()
-df_admanager_previous = df_data_previous_filtered[
-    (df_data_previous_filtered['source'].str.contains('Admanager')) &
-    (df_data_previous_filtered['dominio'].notna())
-].copy()
-
-admanager_current_revenue_brl = df_admanager_current['total_receita'].sum()
-admanager_current_impressions = df_admanager_current['total_impressoes'].sum()
-admanager_current_clicks = df_admanager_current['total_cliques'].sum()
-
-admanager_previous_revenue_brl = df_admanager_previous['total_receita'].sum()
-admanager_previous_impressions = df_admanager_previous['total_impressoes'].sum()
-admanager_previous_clicks = df_admanager_previous['total_cliques'].sum()
-
-admanager_current_revenue_usd = admanager_current_revenue_brl / usd_to_brl_rate if usd_to_brl_rate else 0
-admanager_previous_revenue_usd = admanager_previous_revenue_brl / usd_to_brl_rate if usd_to_brl_rate else 0
-
-admanager_current_ecpm = (admanager_current_revenue_usd / admanager_current_impressions * 1000) if admanager_current_impressions else 0
-admanager_previous_ecpm = (admanager_previous_revenue_usd / admanager_previous_impressions * 1000) if admanager_previous_impressions else 0
-
-
-col_usd, col_brl, col_imp, col_ecpm, col_cli = st.columns(5)
-
-with col_usd:
-    delta = calculate_percentage_delta(admanager_current_revenue_usd, admanager_previous_revenue_usd)
-    st.metric(
-        label="Ganhos (USD)",
-        value=f"${admanager_current_revenue_usd:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_brl:
-    delta = calculate_percentage_delta(admanager_current_revenue_brl, admanager_previous_revenue_brl)
-    st.metric(
-        label="Ganhos (BRL)",
-        value=format_number(admanager_current_revenue_brl, currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_imp:
-    delta = calculate_percentage_delta(admanager_current_impressions, admanager_previous_impressions)
-    st.metric(
-        label="Impressões",
-        value=format_number(admanager_current_impressions),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_ecpm:
-    delta = calculate_percentage_delta(admanager_current_ecpm, admanager_previous_ecpm)
-    st.metric(
-        label="eCPM (USD)",
-        value=f"${admanager_current_ecpm:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_cli:
-    delta = calculate_percentage_delta(admanager_current_clicks, admanager_previous_clicks)
-    st.metric(
-        label="Cliques",
-        value=format_number(admanager_current_clicks),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-
-st.markdown("---")
-
-# --- ESTATÍSTICAS META ADS ---
-st.subheader("Estatísticas Meta Ads")
-
-df_meta_ads_current = df_data_current_filtered[df_data_current_filtered['source'] == 'Meta Ads'].copy()
-df_meta_ads_previous = df_data_previous_filtered[df_data_previous_filtered['source'] == 'Meta Ads'].copy()
-
-meta_ads_current_cost = df_meta_ads_current['total_custo'].sum()
-meta_ads_current_leads = df_meta_ads_current['total_leads'].sum() + df_meta_ads_current['total_mensagens'].sum()
-meta_ads_current_impressions = df_meta_ads_current['total_impressoes'].sum()
-meta_ads_current_clicks = df_meta_ads_current['total_cliques'].sum()
-
-meta_ads_previous_cost = df_meta_ads_previous['total_custo'].sum()
-meta_ads_previous_leads = df_meta_ads_previous['total_leads'].sum() + df_meta_ads_previous['total_mensagens'].sum()
-meta_ads_previous_impressions = df_meta_ads_previous['total_impressoes'].sum()
-meta_ads_previous_clicks = df_meta_ads_previous['total_cliques'].sum()
-
-meta_ads_current_cpl = meta_ads_current_cost / meta_ads_current_leads if meta_ads_current_leads else 0
-meta_ads_current_ctr = (meta_ads_current_clicks / meta_ads_current_impressions * 100) if meta_ads_current_impressions else 0
-meta_ads_current_cpm = (meta_ads_current_cost / meta_ads_current_impressions * 1000) if meta_ads_current_impressions else 0
-meta_ads_current_cpc = meta_ads_current_cost / meta_ads_current_clicks if meta_ads_current_clicks else 0
-
-meta_ads_previous_cpl = meta_ads_previous_cost / meta_ads_previous_leads if meta_ads_previous_leads else 0
-meta_ads_previous_ctr = (meta_ads_previous_clicks / meta_ads_previous_impressions * 100) if meta_ads_previous_impressions else 0
-meta_ads_previous_cpm = (meta_ads_previous_cost / meta_ads_previous_impressions * 1000) if meta_ads_previous_impressions else 0
-meta_ads_previous_cpc = meta_ads_previous_cost / meta_ads_previous_clicks if meta_ads_previous_clicks else 0
-
-
-col_gasto, col_leads, col_cpl, col_imp_meta, col_cli_meta = st.columns(5)
-col_ctr, col_cpm, col_cpc = st.columns(3)
-
-with col_gasto:
-    delta = calculate_percentage_delta(meta_ads_current_cost, meta_ads_previous_cost)
-    st.metric(
-        label="Gasto",
-        value=format_number(meta_ads_current_cost, currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="inverse"
-    )
-with col_leads:
-    delta = calculate_percentage_delta(meta_ads_current_leads, meta_ads_previous_leads)
-    st.metric(
-        label="Leads + Mensagens",
-        value=format_number(meta_ads_current_leads),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_cpl:
-    delta = calculate_percentage_delta(meta_ads_current_cpl, meta_ads_previous_cpl)
-    st.metric(
-        label="CPL (Leads+Msg)",
-        value=format_number(meta_ads_current_cpl, currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="inverse"
-    )
-with col_imp_meta:
-    delta = calculate_percentage_delta(meta_ads_current_impressions, meta_ads_previous_impressions)
-    st.metric(
-        label="Impressões",
-        value=format_number(meta_ads_current_impressions),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_cli_meta:
-    delta = calculate_percentage_delta(meta_ads_current_clicks, meta_ads_previous_clicks)
-    st.metric(
-        label="Cliques",
-        value=format_number(meta_ads_current_clicks),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-
-with col_ctr:
-    delta = calculate_percentage_delta(meta_ads_current_ctr, meta_ads_previous_ctr)
-    st.metric(
-        label="CTR",
-        value=format_number(meta_ads_current_ctr, percentage=True, decimal_places=2),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="normal"
-    )
-with col_cpm:
-    delta = calculate_percentage_delta(meta_ads_current_cpm, meta_ads_previous_cpm)
-    st.metric(
-        label="CPM",
-        value=format_number(meta_ads_current_cpm, currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="inverse"
-    )
-with col_cpc:
-    delta = calculate_percentage_delta(meta_ads_current_cpc, meta_ads_previous_cpc)
-    st.metric(
-        label="CPC",
-        value=format_number(meta_ads_current_cpc, currency=True),
-        delta=f"{delta:,.2f}%" if delta is not None else None,
-        delta_color="inverse"
-    )
-
-st.markdown("---")
-
-# --- TABELA: FATURAMENTO POR SITE ---
-st.subheader("Visão Detalhada por Site")
-
-df_admanager_domains = df_data_current_filtered[
-    (df_data_current_filtered['source'].str.contains('Admanager')) & (df_data_current_filtered['dominio'].notna())
-].copy()
-
-if not df_admanager_domains.empty:
-    df_admanager_domains['total_receita'] = df_admanager_domains['total_receita'].fillna(0).astype(float)
-    df_admanager_domains['total_custo'] = df_admanager_domains['total_custo'].fillna(0).astype(float)
-
-    df_domain_summary = df_admanager_domains.groupby('dominio').agg(
-        total_receita=('total_receita', 'sum'),
-        total_custo=('total_custo', 'sum')
-    ).reset_index()
-
-    total_revenue_domains = df_domain_summary['total_receita'].sum()
-    st.markdown(f"**Faturamento Bruto (Sites Selecionados):** {format_number(total_revenue_domains, currency=True)}")
-
-    df_domain_summary['custo_taxa_adwork'] = df_domain_summary['total_receita'] * TAXA_ADWORK_PERCENT
-    df_domain_summary['receita_liquida'] = df_domain_summary['total_receita'] - df_domain_summary['total_custo'] - df_domain_summary['custo_taxa_adwork']
-
-    def calculate_roi_domain(row):
-        if row['total_custo'] == 0:
-            return 0 if row['total_receita'] == 0 else float('inf')
-        return ((row['total_receita'] - row['total_custo']) / row['total_custo']) * 100
-
-    def calculate_roas_domain(row):
-        if row['total_custo'] == 0:
-            return 0 if row['total_receita'] == 0 else float('inf')
-        return row['total_receita'] / row['total_custo']
-
-    df_domain_summary['roi'] = df_domain_summary.apply(calculate_roi_domain, axis=1)
-    df_domain_summary['roas'] = df_domain_summary.apply(calculate_roas_domain, axis=1)
-
-    total_revenue_overall_domains = df_domain_summary['total_receita'].sum()
-    df_domain_summary['participacao'] = (df_domain_summary['total_receita'] / total_revenue_overall_domains * 100).fillna(0) if total_revenue_overall_domains != 0 else 0
-
-    df_display = df_domain_summary[[
-        'dominio', 'total_receita', 'total_custo',
-        'receita_liquida', 'roi', 'roas', 'participacao'
-    ]].copy()
-
-    df_display.rename(columns={
-        'dominio': 'NOME',
-        'total_receita': 'RECEITA (BRL)',
-        'total_custo': 'GASTO (BRL)',
-        'receita_liquida': 'RECEITA LÍQUIDA (BRL)',
-        'roi': 'ROI (%)',
-        'roas': 'ROAS',
-        'participacao': 'PARTICIPAÇÃO (%)'
-    }, inplace=True)
-
-    df_display['RECEITA (BRL)'] = df_display['RECEITA (BRL)'].apply(lambda x: format_number(x, currency=True))
-    df_display['GASTO (BRL)'] = df_display['GASTO (BRL)'].apply(lambda x: format_number(x, currency=True))
-    df_display['RECEITA LÍQUIDA (BRL)'] = df_display['RECEITA LÍQUIDA (BRL)'].apply(lambda x: format_number(x, currency=True))
-    
-    df_display['ROI (%)'] = df_display['ROI (%)'].apply(lambda x: format_number(x, percentage=True, decimal_places=2))
-    df_display['ROAS'] = df_display['ROAS'].apply(lambda x: format_number(x, decimal_places=2))
-    df_display['PARTICIPAÇÃO (%)'] = df_display['PARTICIPAÇÃO (%)'].apply(lambda x: format_number(x, percentage=True, decimal_places=2))
-
-    df_display['AÇÕES'] = 'Abrir Blog'
-
-    def color_metrics(val, is_currency=False):
-        if isinstance(val, str) and ("Inf" in val or "N/A" in val):
-            return ''
-        
-        clean_val = val.replace('R$', '').replace('.', '').replace(',', '.') if is_currency else val
-        try:
-            num_val = float(clean_val.replace('%', ''))
-        except (ValueError, TypeError):
-            return ''
-        
-        if num_val > 0:
-            return 'color: green'
-        elif num_val < 0:
-            return 'color: red'
-        return ''
-
-    def apply_row_colors(row):
-        styles = [''] * len(row)
-        if 'RECEITA LÍQUIDA (BRL)' in row.index:
-            styles[row.index.get_loc('RECEITA LÍQUIDA (BRL)')] = color_metrics(row['RECEITA LÍQUIDA (BRL)'], is_currency=True)
-        if 'ROI (%)' in row.index:
-            styles[row.index.get_loc('ROI (%)')] = color_metrics(row['ROI (%)'], is_currency=False)
-        return styles
-
-    st.dataframe(df_display.style.apply(apply_row_colors, axis=1), hide_index=True, use_container_width=True)
-
-    if df_domain_summary['total_custo'].sum() == 0 and not df_domain_summary.empty:
-        st.info("Nota: 'GASTO (BRL)' para sites do Admanager é exibido como zero, pois os custos não estão associados diretamente aos domínios na consulta atual do BigQuery. Ajustes na fonte de dados ou na query podem ser necessários para incluir custos por domínio.")
-
-else:
-    st.info("Nenhum dado do Admanager com domínio encontrado para o período selecionado ou filtrado para esta tabela.")
-
-st.markdown("---")
-st.subheader("Dados Brutos (Período Atual)")
-
-if not df_data_current_filtered.empty:
-    df_display_raw = df_data_current_filtered.copy()
-
-    # --- Pre-processing for calculations ---
-    # Garante que as colunas numéricas são float e trata NaNs para cálculo
-    numeric_for_calc_cols = ['total_receita', 'total_custo', 'total_impressoes', 'total_cliques', 'total_leads', 'total_mensagens']
-    for col in numeric_for_calc_cols:
-        if col in df_display_raw.columns:
-            df_display_raw[col] = pd.to_numeric(df_display_raw[col], errors='coerce').fillna(0)
-        else:
-            df_display_raw[col] = 0.0 # Garante que a coluna exista com 0 se estiver faltando
+# --- SEÇÕES DA PÁGINA (entradas declaradas nos argumentos) ---
+def render_site_kpis(current_metrics, previous_metrics, usd_to_brl_rate):
+    """Big numbers do período para a seleção atual."""
+    current_total_revenue_usd = current_metrics['total_receita'] / usd_to_brl_rate if usd_to_brl_rate != 0 else 0
+    previous_total_revenue_usd = previous_metrics['total_receita'] / usd_to_brl_rate if usd_to_brl_rate != 0 else 0
+
+
+    # --- Big Numbers (Visão Geral) ---
+    st.subheader("Métricas Gerais do Período")
+    col_nl, col_roi, col_roas, col_receita_usd, col_receita_brl = st.columns(5)
+
+    with col_nl:
+        delta = calculate_percentage_delta(current_metrics['lucro_liquido'], previous_metrics['lucro_liquido'])
+        st.metric(
+            label="Lucro Líquido",
+            value=format_number(current_metrics['lucro_liquido'], currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_roi:
+        delta = calculate_percentage_delta(current_metrics['roi'], previous_metrics['roi'])
+        st.metric(
+            label="ROI",
+            value=format_number(current_metrics['roi'], percentage=True, decimal_places=2),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_roas:
+        delta = calculate_percentage_delta(current_metrics['roas'], previous_metrics['roas'])
+        st.metric(
+            label="ROAS",
+            value=format_number(current_metrics['roas'], decimal_places=2),
+            delta=f"{delta:,.2f}" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_receita_usd:
+        delta = calculate_percentage_delta(current_total_revenue_usd, previous_total_revenue_usd)
+        st.metric(
+            label="Receita Total (USD)",
+            value=f"${current_total_revenue_usd:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_receita_brl:
+        delta = calculate_percentage_delta(current_metrics['total_receita'], previous_metrics['total_receita'])
+        st.metric(
+            label="Receita Total (BRL)",
+            value=format_number(current_metrics['total_receita'], currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+
+
+def render_admanager_stats(cube_current, cube_previous, usd_to_brl_rate):
+    """Cards do Admanager, respondidos pelos totais do cubo."""
+    # --- ESTATÍSTICAS ADMANAGER ---
+    st.subheader("Estatísticas Admanager")
+
+    # Totais por fatia de source, respondidos pelo cubo
+    admanager_current_totals = cube_current.totals({'source': ADMANAGER_SOURCES})
+    admanager_previous_totals = cube_previous.totals({'source': ADMANAGER_SOURCES})
+
+    admanager_current_revenue_brl = admanager_current_totals['total_receita']
+    admanager_current_impressions = admanager_current_totals['total_impressoes']
+    admanager_current_clicks = admanager_current_totals['total_cliques']
+
+    admanager_previous_revenue_brl = admanager_previous_totals['total_receita']
+    admanager_previous_impressions = admanager_previous_totals['total_impressoes']
+    admanager_previous_clicks = admanager_previous_totals['total_cliques']
+
+    admanager_current_revenue_usd = safe_ratio(admanager_current_revenue_brl, usd_to_brl_rate)
+    admanager_previous_revenue_usd = safe_ratio(admanager_previous_revenue_brl, usd_to_brl_rate)
+
+    admanager_current_ecpm = safe_ratio(admanager_current_revenue_usd, admanager_current_impressions, scale=1000)
+    admanager_previous_ecpm = safe_ratio(admanager_previous_revenue_usd, admanager_previous_impressions, scale=1000)
+
+
+    col_usd, col_brl, col_imp, col_ecpm, col_cli = st.columns(5)
+
+    with col_usd:
+        delta = calculate_percentage_delta(admanager_current_revenue_usd, admanager_previous_revenue_usd)
+        st.metric(
+            label="Ganhos (USD)",
+            value=f"${admanager_current_revenue_usd:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_brl:
+        delta = calculate_percentage_delta(admanager_current_revenue_brl, admanager_previous_revenue_brl)
+        st.metric(
+            label="Ganhos (BRL)",
+            value=format_number(admanager_current_revenue_brl, currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_imp:
+        delta = calculate_percentage_delta(admanager_current_impressions, admanager_previous_impressions)
+        st.metric(
+            label="Impressões",
+            value=format_number(admanager_current_impressions),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_ecpm:
+        delta = calculate_percentage_delta(admanager_current_ecpm, admanager_previous_ecpm)
+        st.metric(
+            label="eCPM (USD)",
+            value=f"${admanager_current_ecpm:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_cli:
+        delta = calculate_percentage_delta(admanager_current_clicks, admanager_previous_clicks)
+        st.metric(
+            label="Cliques",
+            value=format_number(admanager_current_clicks),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+
+
+def render_meta_ads_stats(cube_current, cube_previous):
+    """Cards do Meta Ads, respondidos pelos totais do cubo."""
+    # --- ESTATÍSTICAS META ADS ---
+    st.subheader("Estatísticas Meta Ads")
+
+    meta_ads_current_totals = cube_current.totals({'source': ['Meta Ads']})
+    meta_ads_previous_totals = cube_previous.totals({'source': ['Meta Ads']})
+
+    meta_ads_current_cost = meta_ads_current_totals['total_custo']
+    meta_ads_current_leads = meta_ads_current_totals['total_leads'] + meta_ads_current_totals['total_mensagens']
+    meta_ads_current_impressions = meta_ads_current_totals['total_impressoes']
+    meta_ads_current_clicks = meta_ads_current_totals['total_cliques']
+
+    meta_ads_previous_cost = meta_ads_previous_totals['total_custo']
+    meta_ads_previous_leads = meta_ads_previous_totals['total_leads'] + meta_ads_previous_totals['total_mensagens']
+    meta_ads_previous_impressions = meta_ads_previous_totals['total_impressoes']
+    meta_ads_previous_clicks = meta_ads_previous_totals['total_cliques']
+
+    meta_ads_current_cpl = safe_ratio(meta_ads_current_cost, meta_ads_current_leads)
+    meta_ads_current_ctr = safe_ratio(meta_ads_current_clicks, meta_ads_current_impressions, scale=100)
+    meta_ads_current_cpm = safe_ratio(meta_ads_current_cost, meta_ads_current_impressions, scale=1000)
+    meta_ads_current_cpc = safe_ratio(meta_ads_current_cost, meta_ads_current_clicks)
+
+    meta_ads_previous_cpl = safe_ratio(meta_ads_previous_cost, meta_ads_previous_leads)
+    meta_ads_previous_ctr = safe_ratio(meta_ads_previous_clicks, meta_ads_previous_impressions, scale=100)
+    meta_ads_previous_cpm = safe_ratio(meta_ads_previous_cost, meta_ads_previous_impressions, scale=1000)
+    meta_ads_previous_cpc = safe_ratio(meta_ads_previous_cost, meta_ads_previous_clicks)
+
+
+    col_gasto, col_leads, col_cpl, col_imp_meta, col_cli_meta = st.columns(5)
+    col_ctr, col_cpm, col_cpc = st.columns(3)
+
+    with col_gasto:
+        delta = calculate_percentage_delta(meta_ads_current_cost, meta_ads_previous_cost)
+        st.metric(
+            label="Gasto",
+            value=format_number(meta_ads_current_cost, currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="inverse"
+        )
+    with col_leads:
+        delta = calculate_percentage_delta(meta_ads_current_leads, meta_ads_previous_leads)
+        st.metric(
+            label="Leads + Mensagens",
+            value=format_number(meta_ads_current_leads),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_cpl:
+        delta = calculate_percentage_delta(meta_ads_current_cpl, meta_ads_previous_cpl)
+        st.metric(
+            label="CPL (Leads+Msg)",
+            value=format_number(meta_ads_current_cpl, currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="inverse"
+        )
+    with col_imp_meta:
+        delta = calculate_percentage_delta(meta_ads_current_impressions, meta_ads_previous_impressions)
+        st.metric(
+            label="Impressões",
+            value=format_number(meta_ads_current_impressions),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_cli_meta:
+        delta = calculate_percentage_delta(meta_ads_current_clicks, meta_ads_previous_clicks)
+        st.metric(
+            label="Cliques",
+            value=format_number(meta_ads_current_clicks),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+
+    with col_ctr:
+        delta = calculate_percentage_delta(meta_ads_current_ctr, meta_ads_previous_ctr)
+        st.metric(
+            label="CTR",
+            value=format_number(meta_ads_current_ctr, percentage=True, decimal_places=2),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="normal"
+        )
+    with col_cpm:
+        delta = calculate_percentage_delta(meta_ads_current_cpm, meta_ads_previous_cpm)
+        st.metric(
+            label="CPM",
+            value=format_number(meta_ads_current_cpm, currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="inverse"
+        )
+    with col_cpc:
+        delta = calculate_percentage_delta(meta_ads_current_cpc, meta_ads_previous_cpc)
+        st.metric(
+            label="CPC",
+            value=format_number(meta_ads_current_cpc, currency=True),
+            delta=f"{delta:,.2f}%" if delta is not None else None,
+            delta_color="inverse"
+        )
+
+
+# Formatos da tabela por site (opções de format_number), aplicados na exibição por render_number_table
+DOMAIN_TABLE_FORMATS = {
+    'RECEITA (BRL)': {'currency': True},
+    'GASTO (BRL)': {'currency': True},
+    'RECEITA LÍQUIDA (BRL)': {'currency': True},
+    'ROI (%)': {'percentage': True, 'decimal_places': 2},
+    'ROAS': {'decimal_places': 2},
+    'PARTICIPAÇÃO (%)': {'percentage': True, 'decimal_places': 2},
+}
+
+
+@st.fragment
+def render_domain_table(cube_current, start_date, end_date, data_version):
+    """Tabela de faturamento por site. A exportação reexecuta só este fragmento."""
+    # --- TABELA: FATURAMENTO POR SITE ---
+    st.subheader("Visão Detalhada por Site")
+
+    # Seleção de colunas sobre o roll-up do cubo: gera um novo frame antes das colunas calculadas
+    df_domain_summary = cube_current.rollup(['dominio'], {'source': ADMANAGER_SOURCES})[['dominio', 'total_receita', 'total_custo']]
+
+    if not df_domain_summary.empty:
+
+        total_revenue_domains = df_domain_summary['total_receita'].sum()
+        st.markdown(f"**Faturamento Bruto (Sites Selecionados):** {format_number(total_revenue_domains, currency=True)}")
+
+        df_domain_summary['custo_taxa_adwork'] = df_domain_summary['total_receita'] * TAXA_ADWORK_PERCENT
+        df_domain_summary['receita_liquida'] = df_domain_summary['total_receita'] - df_domain_summary['total_custo'] - df_domain_summary['custo_taxa_adwork']
+
+        # Sites sem custo associado aparecem com ROI/ROAS infinitos ("Inf")
+        df_domain_summary['roi'] = calculate_roi(df_domain_summary['total_receita'], df_domain_summary['total_custo'], zero_division=np.inf)
+        df_domain_summary['roas'] = calculate_roas(df_domain_summary['total_receita'], df_domain_summary['total_custo'], zero_division=np.inf)
+
+        total_revenue_overall_domains = df_domain_summary['total_receita'].sum()
+        df_domain_summary['participacao'] = safe_ratio(df_domain_summary['total_receita'], total_revenue_overall_domains, scale=100)
+
+        # Exibe só os N sites de maior receita; a cauda vira uma linha "Outros" (ROI/ROAS sobre as somas)
+        top_n = top_n_selector(key="site_domain_top_n")
+        df_domain_top = top_n_with_others(
+            df_domain_summary, 'dominio', 'total_receita', top_n,
+            sum_cols=['total_receita', 'total_custo', 'custo_taxa_adwork', 'receita_liquida', 'participacao']
+        )
+        df_domain_top['roi'] = calculate_roi(df_domain_top['total_receita'], df_domain_top['total_custo'], zero_division=np.inf)
+        df_domain_top['roas'] = calculate_roas(df_domain_top['total_receita'], df_domain_top['total_custo'], zero_division=np.inf)
+
+        df_display = df_domain_top[[
+            'dominio', 'total_receita', 'total_custo',
+            'receita_liquida', 'roi', 'roas', 'participacao'
+        ]].rename(columns={
+            'dominio': 'NOME',
+            'total_receita': 'RECEITA (BRL)',
+            'total_custo': 'GASTO (BRL)',
+            'receita_liquida': 'RECEITA LÍQUIDA (BRL)',
+            'roi': 'ROI (%)',
+            'roas': 'ROAS',
+            'participacao': 'PARTICIPAÇÃO (%)'
+        })
+
+        df_display['AÇÕES'] = 'Abrir Blog'
+
+        # Colunas numéricas (ordenáveis) com o texto pt-BR do render_number_table; o Styler também pinta
+        # verde/vermelho pelo sinal (Inf/N/A sem cor), montado de uma vez
+        domain_table_styles = {
+            'RECEITA LÍQUIDA (BRL)': sign_color_css(df_display['RECEITA LÍQUIDA (BRL)']),
+            'ROI (%)': sign_color_css(df_display['ROI (%)']),
+        }
+        render_number_table(
+            style_table(df_display, column_css=domain_table_styles),
+            DOMAIN_TABLE_FORMATS,
+            hide_index=True,
+            width='stretch'
+        )
+
+        # Exportação dos valores numéricos de todos os sites (sem "Outros" nem colunas em texto)
+        render_export_controls(
+            df_domain_summary[['dominio', 'total_receita', 'total_custo', 'receita_liquida', 'roi', 'roas', 'participacao']],
+            f"faturamento_por_site_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}",
+            key="site_domain_table",
+            data_version=data_version
+        )
+
+        if df_domain_summary['total_custo'].sum() == 0 and not df_domain_summary.empty:
+            st.info("Nota: 'GASTO (BRL)' para sites do Admanager é exibido como zero, pois os custos não estão associados diretamente aos domínios na consulta atual do BigQuery. Ajustes na fonte de dados ou na query podem ser necessários para incluir custos por domínio.")
+
+    else:
+        st.info("Nenhum dado do Admanager com domínio encontrado para o período selecionado ou filtrado para esta tabela.")
+
+
+# Formatos das tabelas do explorador de UTMs (opções de format_number)
+UTM_TREE_FORMATS = {
+    'receita': {'currency': True},
+    'custo': {'currency': True},
+    'lucro_liquido': {'currency': True},
+    'roi': {'percentage': True, 'decimal_places': 2},
+    'impressoes': {'decimal_places': 0},
+    'cliques': {'decimal_places': 0},
+    'Leads + Mensagens': {'decimal_places': 0},
+}
+
+
+@st.fragment
+def site_utm_explorer(start_date, end_date, selected_domains, selected_network_codes):
+    """
+    Explorador de UTMs em árvore (source → medium → campaign → content). Cada nível é
+    agregado no BigQuery só quando o nó pai é aberto (com cache por nó); selecionar uma
+    linha abre o nó e reexecuta só este fragmento.
+    """
+    st.subheader("Explorador de UTMs")
+    st.caption("Selecione uma linha para abrir o próximo nível (Source → Medium → Campaign → Content).")
+    # Cada nível traz só os N filhos de maior receita; a cauda chega somada (no BigQuery) em "Outros"
+    top_n = top_n_selector(key="site_utm_tree_top_n")
+
+    path = ()
+    for depth, level in enumerate(UTM_TREE_LEVELS):
+        with st.spinner(f"Carregando {UTM_TREE_LABELS[level]}..."):
+            df_children = get_utm_children(start_date, end_date, path, selected_domains, selected_network_codes, ADMANAGER_SOURCES, top_n)
+
+        breadcrumb = " › ".join(path) if path else "Todas as UTMs"
+        st.markdown(f"**{UTM_TREE_LABELS[level]}** · {breadcrumb}")
+        if df_children.empty:
+            st.info("Nenhum dado de UTM encontrado para este nível com os filtros atuais.")
+            return
+
+        # Mesmas métricas da tabela bruta, sobre as somas do nó
+        df_level = pd.DataFrame({
+            UTM_TREE_LABELS[level]: df_children['node'],
+            'receita': df_children['total_receita'],
+            'custo': df_children['total_custo'],
+            'lucro_liquido': df_children['total_receita'] - df_children['total_custo'] - df_children['total_receita'] * TAXA_ADWORK_PERCENT,
+            'roi': calculate_roi(df_children['total_receita'], df_children['total_custo'], zero_division=np.inf),
+            'impressoes': df_children['total_impressoes'],
+            'cliques': df_children['total_cliques'],
+            'Leads + Mensagens': df_children['total_leads'] + df_children['total_mensagens'],
+        })
+
+        # A chave inclui o caminho: trocar o nó pai limpa a seleção dos níveis abaixo
+        selection_event = render_number_table(
+            df_level,
+            UTM_TREE_FORMATS,
+            key=f"site_utm_tree_{depth}_{top_n}_{'|'.join(path)}",
+            on_select="rerun",
+            selection_mode="single-row",
+            hide_index=True,
+            width='stretch'
+        )
+        selected_rows = selection_event.selection.rows
+        if not selected_rows or depth == len(UTM_TREE_LEVELS) - 1:
+            return
+        if df_children['is_others'].iloc[selected_rows[0]]:
+            st.info('"Outros" reúne os valores fora do Top N; aumente o N para abri-los.')
+            return
+        path = path + (df_level[UTM_TREE_LABELS[level]].iloc[selected_rows[0]],)
+
+
+def build_site_raw_rows(df_period):
+    """
+    Linhas da tabela bruta (lucro, ROI e leads + mensagens por linha, colunas renomeadas e
+    reordenadas) a partir do recorte do período ou de um bloco dele. Não altera df_period.
+    """
+    # Cópia rasa: as colunas novas abaixo entram só na cópia; as de df_period não são alteradas
+    df_display_raw = df_period.copy(deep=False)
+
+    # As colunas numéricas já chegam como float64 sem NaNs (schema do carregamento)
 
     # Calcula lucro e ROI por linha ANTES de dropar/renomear colunas
     df_display_raw['custo_taxa_adwork'] = df_display_raw['total_receita'] * TAXA_ADWORK_PERCENT
     df_display_raw['lucro_liquido'] = df_display_raw['total_receita'] - df_display_raw['total_custo'] - df_display_raw['custo_taxa_adwork']
-    
-    def calculate_roi_for_raw_row(row):
-        receita = row['total_receita']
-        custo = row['total_custo']
-        if custo == 0:
-            return 0 if receita == 0 else np.inf # Usar np.inf para valores infinitos
-        return ((receita - custo) / custo) * 100
-    df_display_raw['roi'] = df_display_raw.apply(calculate_roi_for_raw_row, axis=1)
+
+    df_display_raw['roi'] = calculate_roi(df_display_raw['total_receita'], df_display_raw['total_custo'], zero_division=np.inf)
 
     # 1. Retirar a coluna de source (a original que indica 'Admanager (UTM)', 'Meta Ads')
     if 'source' in df_display_raw.columns:
@@ -569,10 +471,10 @@ if not df_data_current_filtered.empty:
     # 4. Reordenar colunas
     prefix_cols = ['data', 'pais', 'dominio']
     network_code_col = 'network_code'
-    
+
     # UTMs atualizadas (apenas Campaign e Source)
     utm_cols_display_names = ['Campaign', 'Source']
-    
+
     # Novas métricas incluindo lucro e ROI
     metric_cols_display_names = [
         'custo', 'receita', 'lucro_liquido', 'roi', # Usando as renomeadas e recém-calculadas
@@ -586,11 +488,11 @@ if not df_data_current_filtered.empty:
 
     if network_code_col in df_display_raw.columns:
         final_column_order.append(network_code_col)
-    
+
     for col in utm_cols_display_names:
         if col in df_display_raw.columns:
             final_column_order.append(col)
-            
+
     # Inserir Lucro Líquido e ROI na ordem desejada
     if 'lucro_liquido' in df_display_raw.columns:
         final_column_order.append('lucro_liquido')
@@ -604,48 +506,232 @@ if not df_data_current_filtered.empty:
 
     # Filtrar para garantir que apenas colunas existentes no DataFrame estejam na ordem final
     final_column_order_filtered = [col for col in final_column_order if col in df_display_raw.columns]
-    df_display_raw = df_display_raw[final_column_order_filtered]
+    return df_display_raw[final_column_order_filtered]
 
-    # --- Styling (Heatmap e Formatação) ---
-    columns_to_heatmap = [
-        'custo', 'receita', 'lucro_liquido', 'roi',
-        'impressoes', 'cliques', 'Leads + Mensagens'
-    ]
-    columns_to_heatmap_filtered = [col for col in columns_to_heatmap if col in df_display_raw.columns]
-
-    # Preparar DataFrame para styling (garantindo que os valores são numéricos para o gradient)
-    df_numeric_for_styling = df_display_raw.copy()
-    for col in columns_to_heatmap_filtered:
-        df_numeric_for_styling[col] = pd.to_numeric(df_numeric_for_styling[col], errors='coerce')
-        # Substituir inf por NaN para que não sejam coloridos e não distorçam a escala do gradient
-        df_numeric_for_styling[col] = df_numeric_for_styling[col].replace([np.inf, -np.inf], np.nan) 
+
+@st.fragment
+def site_raw_table(start_date, end_date, selected_domains, selected_network_codes):
+    """Tabela de dados brutos. Filtro, ordenação e paginação reexecutam só este fragmento."""
+    st.subheader("Dados Brutos (Período Atual)")
+
+    # A tabela bruta fica no grão UTM completo, então lê o recorte filtrado (em cache, somente leitura).
+    # É a única seção que espera a carga completa: os cards acima já estão na tela.
+    raw_table_placeholder = st.empty()
+    raw_table_placeholder.info("⏳ Carregando dados brutos do período...")
+    df_data_current_filtered = get_filtered_period_data(
+        start_date, end_date, tuple(sorted(selected_domains)), tuple(sorted(selected_network_codes)), ADMANAGER_SOURCES
+    )
+    raw_table_placeholder.empty()
+
+    if not df_data_current_filtered.empty:
+        df_display_raw = build_site_raw_rows(df_data_current_filtered)
+
+        # --- Tabela paginada no servidor (heatmap e formatação só na página visível) ---
+        columns_to_heatmap = [
+            'custo', 'receita', 'lucro_liquido', 'roi',
+            'impressoes', 'cliques', 'Leads + Mensagens'
+        ]
+        columns_to_heatmap_filtered = [col for col in columns_to_heatmap if col in df_display_raw.columns]
+
+        # Definir opções de formatação para cada coluna
+        cols_to_format_dict = {
+            'custo': {'currency': True},
+            'receita': {'currency': True},
+            'lucro_liquido': {'currency': True},
+            'roi': {'percentage': True, 'decimal_places': 2},
+            'impressoes': {'decimal_places': 0},
+            'cliques': {'decimal_places': 0},
+            'Leads + Mensagens': {'decimal_places': 0}
+        }
+
+        # Linha de totais calculada à parte sobre o recorte inteiro (ROI recalculado sobre as somas)
+        summed_cols = [col for col in columns_to_heatmap_filtered if col != 'roi']
+        total_row_data = {col: '' for col in df_display_raw.columns}
+        total_row_data.update(df_display_raw[summed_cols].sum().to_dict())
+        total_row_data['data'] = 'Total'
+        if 'roi' in df_display_raw.columns:
+            total_row_data['roi'] = calculate_roi(total_row_data['receita'], total_row_data['custo'], zero_division=np.inf)
+        df_total_row = pd.DataFrame([total_row_data], columns=df_display_raw.columns)
+
+        data_version = (start_date, end_date, tuple(sorted(selected_domains)), tuple(sorted(selected_network_codes)))
+        render_paginated_table(
+            df_display_raw,
+            cols_to_format_dict,
+            key="site_raw_table",
+            data_version=data_version,
+            totals_row=df_total_row,
+            default_sort='data',
+            default_ascending=True,
+            heatmap_columns=columns_to_heatmap_filtered,
+            hide_index=True,
+            width='stretch',
+            column_config={'data': st.column_config.DatetimeColumn("data", format="DD/MM/YYYY")}
+        )
+
+        # Exportação dos dados crus da tabela (sem formatação nem cores)
+        # O arquivo é montado bloco a bloco a partir do recorte do período, só ao clicar em "Gerar arquivo"
+        render_export_controls(
+            lambda: (build_site_raw_rows(chunk) for chunk in iter_frame_chunks(df_data_current_filtered)),
+            f"sites_dados_brutos_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}",
+            key="site_raw_table",
+            data_version=data_version
+        )
+    else:
+        st.info("Nenhum dado bruto encontrado para o período atual após a filtragem.")
+
+
+@st.fragment
+def site_filtered_sections(start_date, end_date, prev_start_date, prev_end_date):
+    """
+    Filtros de domínio e network code e tudo o que depende deles. Mudar um filtro
+    reexecuta só este fragmento; os períodos vêm do cache por (início, fim).
+    Cards e tabela por site saem do cubo leve (agregado no BigQuery); só a tabela
+    bruta espera a carga completa do período.
+    """
+    # Opções dos filtros a partir do cubo leve (fonte × domínio × network code), já ordenadas
+    dimension_index_current = get_kpi_dimension_index(start_date, end_date)
+
+    col_domain_filter, col_network_code_filter = st.columns(2)
+
+    # --- Filtro de Domínio ---
+    with col_domain_filter:
+        st.write("Filtrar por Domínio (Admanager)")
+
+        multiselect_key = 'ms_domains_site'
+        checkbox_key = 'cb_all_domains_site'
+
+        available_domains_list = dimension_index_current.options('dominio', ADMANAGER_SOURCES)
+
+        if multiselect_key not in st.session_state:
+            st.session_state[multiselect_key] = available_domains_list
+
+        current_selected_valid = [d for d in st.session_state[multiselect_key] if d in available_domains_list]
+        if set(current_selected_valid) != set(st.session_state[multiselect_key]):
+            st.session_state[multiselect_key] = current_selected_valid
+    
+        def on_checkbox_change_site():
+            if st.session_state[checkbox_key]:
+                st.session_state[multiselect_key] = available_domains_list
+            else:
+                st.session_state[multiselect_key] = []
+
+        initial_checkbox_value = (set(st.session_state[multiselect_key]) == set(available_domains_list) and len(available_domains_list) > 0)
     
-    styled_df = df_numeric_for_styling.style
-
-    # Definir opções de formatação para cada coluna
-    cols_to_format_dict = {
-        'custo': {'currency': True},
-        'receita': {'currency': True},
-        'lucro_liquido': {'currency': True},
-        'roi': {'percentage': True, 'decimal_places': 2},
-        'impressoes': {'decimal_places': 0},
-        'cliques': {'decimal_places': 0},
-        'Leads + Mensagens': {'decimal_places': 0}
-    }
-
-    for col in columns_to_heatmap_filtered:
-        # Aplicar background_gradient para as colunas numéricas válidas
-        # Evitar aplicar gradient se todos os valores forem NaN ou iguais
-        min_val = df_numeric_for_styling[col].min()
-        max_val = df_numeric_for_styling[col].max()
-        if pd.notna(min_val) and pd.notna(max_val) and min_val != max_val:
-            styled_df = styled_df.background_gradient(cmap='YlGn', subset=[col])
-        
-        # Aplicar formatação usando a função format_number
-        format_options = cols_to_format_dict.get(col, {})
-        # Usamos uma lambda para aplicar format_number mantendo os argumentos
-        styled_df = styled_df.format({col: lambda x, opts=format_options: format_number(x, **opts)})
-
-    st.dataframe(styled_df, hide_index=True, use_container_width=True)
-else:
-    st.info("Nenhum dado bruto encontrado para o período atual após a filtragem.")
\ No newline at end of file
+        st.checkbox(
+            "Selecionar Todos",
+            value=initial_checkbox_value,
+            key=checkbox_key,
+            on_change=on_checkbox_change_site
+        )
+
+        def on_multiselect_change_site():
+            if set(st.session_state[multiselect_key]) == set(available_domains_list) and len(available_domains_list) > 0:
+                st.session_state[checkbox_key] = True
+            else:
+                st.session_state[checkbox_key] = False
+
+        selected_domains = st.multiselect(
+            "Selecione os domínios:",
+            options=available_domains_list,
+            key=multiselect_key,
+            label_visibility="collapsed",
+            on_change=on_multiselect_change_site
+        )
+        if not available_domains_list:
+            selected_domains = []
+
+    # Adição do filtro de Network Code
+    with col_network_code_filter:
+        st.write("Filtrar por Network Code (Admanager)")
+
+        multiselect_key_nc = 'ms_network_code_site'
+        checkbox_key_nc = 'cb_all_network_code_site'
+
+        available_network_codes_list = dimension_index_current.options('network_code', ADMANAGER_SOURCES)
+
+        if multiselect_key_nc not in st.session_state:
+            st.session_state[multiselect_key_nc] = available_network_codes_list
+
+        current_selected_valid_nc = [nc for nc in st.session_state[multiselect_key_nc] if nc in available_network_codes_list]
+        if set(current_selected_valid_nc) != set(st.session_state[multiselect_key_nc]):
+            st.session_state[multiselect_key_nc] = current_selected_valid_nc
+
+        def on_checkbox_change_network_code_site():
+            if st.session_state[checkbox_key_nc]:
+                st.session_state[multiselect_key_nc] = available_network_codes_list
+            else:
+                st.session_state[multiselect_key_nc] = []
+
+        def on_multiselect_change_network_code_site():
+            if set(st.session_state[multiselect_key_nc]) == set(available_network_codes_list) and len(available_network_codes_list) > 0:
+                st.session_state[checkbox_key_nc] = True
+            else:
+                st.session_state[checkbox_key_nc] = False
+
+        initial_checkbox_value_nc = (set(st.session_state[multiselect_key_nc]) == set(available_network_codes_list) and len(available_network_codes_list) > 0)
+
+        st.checkbox(
+            "Selecionar Todos",
+            value=initial_checkbox_value_nc,
+            key=checkbox_key_nc,
+            on_change=on_checkbox_change_network_code_site
+        )
+
+        selected_network_codes = st.multiselect(
+            "Selecione os Network Codes:",
+            options=available_network_codes_list,
+            key=multiselect_key_nc,
+            label_visibility="collapsed",
+            on_change=on_multiselect_change_network_code_site
+        )
+        if not available_network_codes_list:
+            selected_network_codes = []
+
+    # Lógica de aplicação dos filtros
+    if not selected_domains:
+        st.warning("Nenhum domínio do Admanager selecionado. Os dados de Admanager (UTM) e combinados não serão exibidos.")
+    elif not selected_network_codes:
+        st.warning("Nenhum Network Code do Admanager selecionado. Os dados de Admanager (UTM) e combinados não serão exibidos.")
+
+    # Cubos leves do período atual e anterior já recortados pela seleção (somente leitura, em cache)
+    cube_current = get_kpi_cube(start_date, end_date).select(selected_domains, selected_network_codes, ADMANAGER_SOURCES)
+    cube_previous = get_kpi_cube(prev_start_date, prev_end_date).select(selected_domains, selected_network_codes, ADMANAGER_SOURCES)
+
+    st.markdown("--- ")
+
+    if cube_current.facts.empty and cube_previous.facts.empty:
+        st.warning("Nenhum dado encontrado para o período selecionado e/ou domínios filtrados. Ajuste os filtros ou verifique as fontes de dados.")
+        return
+
+    current_metrics = calculate_business_metrics(cube_current.facts)
+    previous_metrics = calculate_business_metrics(cube_previous.facts)
+
+    usd_to_brl_rate = get_usd_to_brl_rate()
+
+    render_site_kpis(current_metrics, previous_metrics, usd_to_brl_rate)
+
+    st.markdown("---")
+
+    render_admanager_stats(cube_current, cube_previous, usd_to_brl_rate)
+
+    st.markdown("---")
+
+    render_meta_ads_stats(cube_current, cube_previous)
+
+    st.markdown("---")
+
+    render_domain_table(
+        cube_current, start_date, end_date,
+        (start_date, end_date, tuple(sorted(selected_domains)), tuple(sorted(selected_network_codes)))
+    )
+
+    st.markdown("---")
+
+    site_utm_explorer(start_date, end_date, selected_domains, selected_network_codes)
+
+    st.markdown("---")
+
+    site_raw_table(start_date, end_date, selected_domains, selected_network_codes)
+
+
+site_filtered_sections(start_date, end_date, prev_start_date, prev_end_date)
@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 import numpy as np
 
 # Import the functions and constants from your utils.py
-from utils import load_data_for_period, get_previous_month_overall_faturamento, get_manager_ranking_data, format_number, COMISSAO_PERCENT
+from utils import get_previous_month_overall_faturamento, get_revenue_totals, get_manager_daily_store, get_manager_sheets_version, time_grain_selector, TIME_GRAIN_ADJECTIVES, format_number, COMISSAO_PERCENT, calculate_roi, calculate_roas, render_number_table, render_export_controls, finalize_manager_ranking, top_n_with_others, top_n_selector
 
 st.set_page_config(layout="wide", page_title="📊 Ranking de Gestores")
 
@@ -15,7 +15,7 @@ st.title("📊 Ranking de Gestores")
 
 # --- Filtros de Desempenho (na área principal) ---
 st.markdown("### Filtros de Desempenho")
-col_date_start, col_date_end, col_manager_filter = st.columns([1, 1, 2]) # Layout para os filtros
+col_date_start, col_date_end = st.columns(2) # Layout para os filtros de período
 
 today = datetime.now().date()
 default_start_date = today - timedelta(days=30)
@@ -31,44 +31,50 @@ if start_date > end_date:
     st.error("Erro: A data de início não pode ser maior que a data de fim.")
     st.stop() # Interrompe a execução se as datas forem inválidas
 
-# --- Carregar Dados Brutos de Performance (uma vez para todo o app) ---
-with st.spinner("Carregando dados de performance do BigQuery..."):
-    df_ad_performance_raw = load_data_for_period(start_date, end_date) # Carrega os dados brutos
 
-# --- Agrega dados por gestores (usando os dados brutos de performance) ---
-with st.spinner("Processando dados de gestores..."):
-    df_ranking_raw, df_daily_performance_with_managers_raw = get_manager_ranking_data(df_ad_performance_raw) # Obtém ambos os DataFrames
+# --- SEÇÕES DA PÁGINA (entradas declaradas nos argumentos) ---
+def render_monthly_goal(previous_month_faturamento, overall_faturamento_for_current_period_no_manager_filter, end_date):
+    """Meta mensal e progresso (faturamento geral, sem filtro de gestor)."""
+    # --- Calcular Meta de Faturamento Mensal ---
+    st.markdown("<h3 style='text-align: center; color: #3f51b5;'>🎯 Meta de Faturamento Mensal</h3>", unsafe_allow_html=True)
 
-if not df_ranking_raw.empty:
-    # Obter gestores únicos para o filtro, APÓS o carregamento dos dados
-    all_managers = sorted(df_ranking_raw['Gestor'].unique().tolist())
-    
-    with col_manager_filter: # Esta é a terceira coluna para filtros
-        selected_managers = st.multiselect(
-            "Filtrar por Gestor(es)",
-            options=all_managers,
-            default=all_managers # Por padrão, todos os gestores são selecionados
-        )
+    # A meta usa o faturamento total bruto (sem filtro de gestor), vindo da consulta agregada leve
+    GOAL_INCREASE_PERCENT = 0.10 # 10% de aumento sobre o faturamento do faturamento do mês anterior
+    current_month_goal = previous_month_faturamento * (1 + GOAL_INCREASE_PERCENT) if previous_month_faturamento > 0 else 0.0
 
-    # Aplicar filtro de gestores
-    if selected_managers:
-        df_ranking_filtered = df_ranking_raw[df_ranking_raw['Gestor'].isin(selected_managers)]
-        # Filtrar o DataFrame diário também pelos gestores selecionados
-        df_daily_performance_filtered = df_daily_performance_with_managers_raw[
-            df_daily_performance_with_managers_raw['Gestor'].isin(selected_managers)
-        ]
+    current_month_name = end_date.strftime('%B') # Nome do mês da data final do filtro
+
+    # Cards da meta
+    col_meta1, col_meta2 = st.columns(2)
+    with col_meta1:
+        st.markdown(f"**Faturamento Mês Anterior**")
+        st.markdown(f"<h3 style='color: #60a5fa;'>{format_number(previous_month_faturamento, currency=True)}</h3>", unsafe_allow_html=True)
+    with col_meta2:
+        st.markdown(f"**Meta do Mês ({current_month_name})**")
+        st.markdown(f"<h3 style='color: #4ade80;'>{format_number(current_month_goal, currency=True)}</h3>", unsafe_allow_html=True)
+
+    # Progresso da meta
+    st.write("---")
+    if current_month_goal > 0:
+        progress_percent = (overall_faturamento_for_current_period_no_manager_filter / current_month_goal * 100)
+        faltam_para_o_mes = current_month_goal - overall_faturamento_for_current_period_no_manager_filter
+        st.markdown(f"**Progresso do Mês ({current_month_name}):**")
+        st.progress(min(float(progress_percent / 100), 1.0), text=f"{progress_percent:.2f}%")
+
+        col_progress1, col_progress2 = st.columns(2)
+        with col_progress1:
+            st.markdown(f"**Atual do Mês**")
+            st.markdown(f"<h3 style='color: #60a5fa;'>{format_number(overall_faturamento_for_current_period_no_manager_filter, currency=True)}</h3>", unsafe_allow_html=True)
+        with col_progress2:
+            st.markdown(f"**Faltam para o Mês**")
+            st.markdown(f"<h3 style='color: #f87171;'>{format_number(faltam_para_o_mes, currency=True)}</h3>", unsafe_allow_html=True)
     else:
-        df_ranking_filtered = df_ranking_raw.copy() # Se nenhum gestor for selecionado, mostra todos
-        df_daily_performance_filtered = df_daily_performance_with_managers_raw.copy()
-        st.warning("Nenhum gestor selecionado. Exibindo dados de todos os gestores.")
-    
-    # Se, após o filtro, o DataFrame de ranking estiver vazio, exibir mensagem e parar
-    if df_ranking_filtered.empty:
-        st.info("Nenhum dado encontrado para os gestores e período selecionados.")
-        st.stop()
+        st.info("Não foi possível calcular a meta mensal, pois o faturamento do mês anterior é zero ou não disponível.")
+    st.write("---")
 
-    st.markdown("---") # Separador visual
 
+def render_ranking_summary(df_ranking_filtered):
+    """Cards do período e tabela de resumo para os gestores filtrados."""
     # --- Calcular e Exibir Métricas de Resumo Geral (Cards) ---
     st.markdown("<h3 style='text-align: center; color: #3f51b5;'>Resumo do Período (Gestores Selecionados)</h3>", unsafe_allow_html=True)
     st.write("---")
@@ -80,10 +86,10 @@ if not df_ranking_raw.empty:
     overall_comissao = df_ranking_filtered['Comissao'].sum()
     overall_fundo_reserva = df_ranking_filtered['Fundo_Reserva'].sum()
     overall_lucro_liquido_final = df_ranking_filtered['Lucro_Liquido_Final'].sum()
-    
+
     # Calcular ROI geral com base nos totais
-    overall_roi_percentual = (overall_lucro_bruto_dbl / overall_investimento * 100) if overall_investimento != 0 else np.nan
-    overall_roas = (overall_faturamento / overall_investimento) if overall_investimento != 0 else np.nan
+    overall_roi_percentual = calculate_roi(overall_faturamento, overall_investimento, zero_division=np.nan)
+    overall_roas = calculate_roas(overall_faturamento, overall_investimento, zero_division=np.nan)
 
 
     # Primeira linha de cards (4 colunas)
@@ -121,51 +127,8 @@ if not df_ranking_raw.empty:
         st.markdown(f"##### ⚡ Comissão")
         st.markdown(f"<h2 style='color: #fbbf24;'>{format_number(overall_comissao, currency=True)}</h2>", unsafe_allow_html=True)
         st.markdown(f"<p style='color: gray; font-size: 0.8em;'>3% - Comissão padrão</p>", unsafe_allow_html=True)
-    
-    st.write("---") 
-
-    # --- Calcular Meta de Faturamento Mensal ---
-    st.markdown("<h3 style='text-align: center; color: #3f51b5;'>🎯 Meta de Faturamento Mensal</h3>", unsafe_allow_html=True)
-
-    # Usar o faturamento total bruto (sem filtro de gestor, para a meta geral)
-    # df_ad_performance_raw já é o dataframe não filtrado por gestor, mas filtrado por data
-    overall_faturamento_for_current_period_no_manager_filter = df_ad_performance_raw['total_receita'].sum()
-
-    with st.spinner("Calculando faturamento do mês anterior para meta..."):
-        previous_month_faturamento = get_previous_month_overall_faturamento(start_date)
-
-    GOAL_INCREASE_PERCENT = 0.10 # 10% de aumento sobre o faturamento do faturamento do mês anterior
-    current_month_goal = previous_month_faturamento * (1 + GOAL_INCREASE_PERCENT) if previous_month_faturamento > 0 else 0.0
-
-    current_month_name = end_date.strftime('%B') # Nome do mês da data final do filtro
-
-    # Cards da meta
-    col_meta1, col_meta2 = st.columns(2)
-    with col_meta1:
-        st.markdown(f"**Faturamento Mês Anterior**")
-        st.markdown(f"<h3 style='color: #60a5fa;'>{format_number(previous_month_faturamento, currency=True)}</h3>", unsafe_allow_html=True)
-    with col_meta2:
-        st.markdown(f"**Meta do Mês ({current_month_name})**")
-        st.markdown(f"<h3 style='color: #4ade80;'>{format_number(current_month_goal, currency=True)}</h3>", unsafe_allow_html=True)
-
-    # Progresso da meta
-    st.write("---")
-    if current_month_goal > 0:
-        progress_percent = (overall_faturamento_for_current_period_no_manager_filter / current_month_goal * 100)
-        faltam_para_o_mes = current_month_goal - overall_faturamento_for_current_period_no_manager_filter
-        st.markdown(f"**Progresso do Mês ({current_month_name}):**")
-        st.progress(min(float(progress_percent / 100), 1.0), text=f"{progress_percent:.2f}%")
 
-        col_progress1, col_progress2 = st.columns(2)
-        with col_progress1:
-            st.markdown(f"**Atual do Mês**")
-            st.markdown(f"<h3 style='color: #60a5fa;'>{format_number(overall_faturamento_for_current_period_no_manager_filter, currency=True)}</h3>", unsafe_allow_html=True)
-        with col_progress2:
-            st.markdown(f"**Faltam para o Mês**")
-            st.markdown(f"<h3 style='color: #f87171;'>{format_number(faltam_para_o_mes, currency=True)}</h3>", unsafe_allow_html=True)
-    else:
-        st.info("Não foi possível calcular a meta mensal, pois o faturamento do mês anterior é zero ou não disponível.")
-    st.write("---")
+    st.write("---") 
 
     # --- Métricas Adicionais do Período (Tabela de Resumo) ---
     st.markdown("<h3 style='text-align: center; color: #3f51b5;'>Métricas Adicionais do Período</h3>", unsafe_allow_html=True)
@@ -198,30 +161,30 @@ if not df_ranking_raw.empty:
     st.dataframe(df_summary_table, hide_index=True, width='stretch')
 
     st.write("---") 
-    
+
+
+@st.fragment
+def ranking_roi_chart(manager_store, start_date, end_date, manager_filter):
+    """Gráfico de evolução do ROI. Trocar o grão reexecuta só este fragmento."""
     # --- Evolução do ROI (Média por Dia) ---
     st.markdown("<h3 style='text-align: center; color: #3f51b5;'>Evolução do ROI (Média por Dia)</h3>", unsafe_allow_html=True)
     st.write("---")
 
-    if not df_daily_performance_filtered.empty:
-        # Agrupar por dia para calcular o ROI diário consolidado para os gestores selecionados
-        df_daily_roi = df_daily_performance_filtered.groupby('data').agg(
-            total_receita=('total_receita', 'sum'),
-            total_custo=('total_custo', 'sum')
-        ).reset_index()
+    # Série do gráfico no grão escolhido (dia/semana/mês), somada no store antes do ROI
+    chart_grain = time_grain_selector(start_date, end_date, key="ranking_chart_grain")
+    df_daily_roi = manager_store.daily_series(start_date, end_date, manager_filter, grain=chart_grain)
 
+    if not df_daily_roi.empty:
         df_daily_roi['Lucro_Bruto'] = df_daily_roi['total_receita'] - df_daily_roi['total_custo']
-        
-        # Evitar divisão por zero no ROI
-        df_daily_roi['ROI_Percentual'] = (
-            (df_daily_roi['Lucro_Bruto'] / df_daily_roi['total_custo']) * 100
-        ).replace([np.inf, -np.inf], np.nan).fillna(0) # Substitui infinitos por 0 ou NaN se preferir
+
+        # Evitar divisão por zero no ROI (dias sem custo ficam com 0)
+        df_daily_roi['ROI_Percentual'] = calculate_roi(df_daily_roi['total_receita'], df_daily_roi['total_custo'], zero_division=0.0)
 
         fig_roi = px.line(
             df_daily_roi,
             x='data',
             y='ROI_Percentual',
-            title='Evolução do ROI (Média por Dia)',
+            title=f'Evolução do ROI ({TIME_GRAIN_ADJECTIVES[chart_grain]})',
             labels={'data': 'Data', 'ROI_Percentual': 'ROI (%)'},
             markers=True 
         )
@@ -231,8 +194,20 @@ if not df_ranking_raw.empty:
     else:
         st.info("Nenhum dado diário de performance encontrado para calcular o ROI para os gestores selecionados.")
 
-    st.write("---") 
 
+# Formatos da tabela diária (opções de format_number), aplicados na exibição por render_number_table
+DAILY_ROI_TABLE_FORMATS = {
+    'Investimento': {'currency': True},
+    'Receita R\$': {'currency': True},
+    'Lucro': {'currency': True},
+    'Comissao': {'currency': True},
+    'ROI': {'percentage': True, 'decimal_places': 1}, # 1 casa decimal para ROI
+    'ROAS': {'x_suffix': True, 'decimal_places': 1}, # ROAS com sufixo 'x'
+}
+
+
+def render_daily_roi_table(df_daily_performance_filtered):
+    """Tabela diária consolidada (sempre no grão de dia)."""
     # --- Tabela de Desempenho Diário Consolidado (Tabela do Print) ---
     st.markdown("<h3 style='text-align: center; color: #3f51b5;'>ROI Dia a Dia - Tabela Detalhada</h3>", unsafe_allow_html=True)
     st.write("---")
@@ -240,11 +215,10 @@ if not df_ranking_raw.empty:
     if not df_daily_performance_filtered.empty:
         # --- CORREÇÃO AQUI: Duas etapas para agregação e renomeação ---
         # Etapa 1: Agrupar por 'data' e somar as colunas originais
-        df_daily_consolidated_full_temp = df_daily_performance_filtered.groupby('data').agg({
-            'total_custo': 'sum',
-            'total_receita': 'sum',
-            'Lucro_Bruto': 'sum'
-        }).reset_index()
+        df_daily_consolidated_full_temp = df_daily_performance_filtered[['data', 'total_custo', 'total_receita']]
+        df_daily_consolidated_full_temp = df_daily_consolidated_full_temp.assign(
+            Lucro_Bruto=df_daily_consolidated_full_temp['total_receita'] - df_daily_consolidated_full_temp['total_custo']
+        )
 
         # Etapa 2: Renomear as colunas para os nomes desejados
         df_daily_consolidated_full = df_daily_consolidated_full_temp.rename(columns={
@@ -256,26 +230,23 @@ if not df_ranking_raw.empty:
 
         # Calcular as métricas adicionais por dia
         df_daily_consolidated_full['Comissao'] = df_daily_consolidated_full['Receita_R$'] * COMISSAO_PERCENT
-        df_daily_consolidated_full['ROI'] = (df_daily_consolidated_full['Lucro'] / df_daily_consolidated_full['Investimento'] * 100).replace([np.inf, -np.inf], np.nan).fillna(0)
-        df_daily_consolidated_full['ROAS'] = (df_daily_consolidated_full['Receita_R$'] / df_daily_consolidated_full['Investimento']).replace([np.inf, -np.inf], np.nan).fillna(0)
-        df_daily_consolidated_full['Status'] = df_daily_consolidated_full['Lucro'].apply(lambda x: 'Positivo' if x >= 0 else 'Negativo')
+        df_daily_consolidated_full['ROI'] = calculate_roi(df_daily_consolidated_full['Receita_R$'], df_daily_consolidated_full['Investimento'], zero_division=0.0)
+        df_daily_consolidated_full['ROAS'] = calculate_roas(df_daily_consolidated_full['Receita_R$'], df_daily_consolidated_full['Investimento'], zero_division=0.0)
+        df_daily_consolidated_full['Status'] = np.select([df_daily_consolidated_full['Lucro'] >= 0], ['Positivo'], default='Negativo')
 
         # Selecionar e renomear colunas para a exibição na tabela, na ordem exata do print
+        # ('Receita_R$' vira 'Receita R\$' só para exibição; os valores seguem numéricos)
         df_table_display_print = df_daily_consolidated_full[[
             'data', 'Investimento', 'Receita_R$', 'Lucro', 'Comissao', 'ROI', 'ROAS', 'Status'
-        ]].copy()
-        
-        # Renomear 'Receita_R$' para 'Receita R\$' (apenas para exibição)
-        df_table_display_print.rename(columns={'Receita_R$': 'Receita R\$'}, inplace=True)
-
-        # Formatar colunas para exibição
-        df_table_display_print['data'] = df_table_display_print['data'].dt.strftime('%d/%m/%Y')
-        for col in ['Investimento', 'Receita R\$', 'Lucro', 'Comissao']:
-            df_table_display_print[col] = df_table_display_print[col].apply(lambda x: format_number(x, currency=True))
-        df_table_display_print['ROI'] = df_table_display_print['ROI'].apply(lambda x: format_number(x, percentage=True, decimal_places=1)) # 1 casa decimal para ROI
-        df_table_display_print['ROAS'] = df_table_display_print['ROAS'].apply(lambda x: format_number(x, x_suffix=True, decimal_places=1)) # ROAS com sufixo 'x'
-
-        st.dataframe(df_table_display_print, hide_index=True, width='stretch')
+        ]].rename(columns={'Receita_R$': 'Receita R\$'})
+
+        render_number_table(
+            df_table_display_print,
+            DAILY_ROI_TABLE_FORMATS,
+            hide_index=True,
+            width='stretch',
+            column_config={'data': st.column_config.DatetimeColumn("data", format="DD/MM/YYYY")}
+        )
         st.markdown(
             "***Nota:** A coluna 'Receita $' do print original não é incluída diretamente aqui, pois toda a receita é convertida para R\$ no carregamento de dados. A coluna 'Receita R\$' representa o faturamento total em reais.*"
         )
@@ -284,6 +255,10 @@ if not df_ranking_raw.empty:
 
     st.write("---")
 
+
+@st.fragment
+def ranking_by_metric(manager_store, df_ranking_filtered, start_date, end_date, manager_filter):
+    """Ranking individual. Trocar a métrica reexecuta só este fragmento."""
     # --- Manager Ranking Selection and Display ---
     st.subheader("Ranking Individual de Gestores")
     metricas_ranking = {
@@ -308,22 +283,27 @@ if not df_ranking_raw.empty:
     df_ranking_sorted = df_ranking_filtered.sort_values(by=selected_metric_column, ascending=False).reset_index(drop=True)
 
     st.write("### Tabela de Ranking Detalhada")
-    display_df = df_ranking_sorted.copy()
-    
-    for col in ['Total_Faturamento', 'Total_Custo', 'Lucro_Bruto', 'Comissao', 'Fundo_Reserva', 'Lucro_Liquido_Final']:
-        if col in display_df.columns:
-            display_df[col] = display_df[col].apply(lambda x: format_number(x, currency=True))
-    
-    if 'ROI_Percentual' in display_df.columns:
-        display_df['ROI_Percentual'] = display_df['ROI_Percentual'].apply(lambda x: format_number(x, percentage=True, decimal_places=2))
-    if 'ROAS' in display_df.columns:
-        display_df['ROAS'] = display_df['ROAS'].apply(lambda x: format_number(x, x_suffix=True, decimal_places=1)) # ROAS com sufixo 'x'
-    if 'Total_Impressoes' in display_df.columns:
-        display_df['Total_Impressoes'] = display_df['Total_Impressoes'].apply(lambda x: format_number(x, decimal_places=0))
-    if 'Total_Cliques' in display_df.columns:
-        display_df['Total_Cliques'] = display_df['Total_Cliques'].apply(lambda x: format_number(x, decimal_places=0))
-
-    st.dataframe(display_df, width='stretch')
+    # Os números seguem crus para o widget (ordenáveis); apenas o formato de exibição é informado
+    ranking_column_formats = {
+        col: {'currency': True, 'decimal_places': 2}
+        for col in ['Total_Faturamento', 'Total_Custo', 'Lucro_Bruto', 'Comissao', 'Fundo_Reserva', 'Lucro_Liquido_Final']
+    }
+    ranking_column_formats.update({
+        'ROI_Percentual': {'percentage': True, 'decimal_places': 2},
+        'ROAS': {'x_suffix': True, 'decimal_places': 1}, # ROAS com sufixo 'x'
+        'Total_Impressoes': {'decimal_places': 0},
+        'Total_Cliques': {'decimal_places': 0},
+        'Total_Projetos': {'decimal_places': 0},
+    })
+    render_number_table(df_ranking_sorted, ranking_column_formats, width='stretch')
+
+    # Exportação do ranking (números crus, na ordem da métrica escolhida)
+    render_export_controls(
+        df_ranking_sorted,
+        f"ranking_gestores_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}",
+        key="ranking_table",
+        data_version=(start_date, end_date, tuple(sorted(manager_filter or ())), selected_metric_column)
+    )
 
     st.write(f"### Gráfico de Ranking por {selected_metric_display}")
 
@@ -333,9 +313,23 @@ if not df_ranking_raw.empty:
         y_axis_prefix = "R\$ "
     elif selected_metric_column == 'ROI_Percentual':
         y_axis_suffix = "%"
-    
+
+    # Gráfico com os N gestores do topo e a cauda somada em "Outros" (razões recalculadas sobre as somas)
+    chart_top_n = top_n_selector(key="ranking_chart_top_n", label="Gestores no gráfico")
+    df_chart = top_n_with_others(
+        df_ranking_sorted, 'Gestor', selected_metric_column, chart_top_n,
+        sum_cols=['Total_Faturamento', 'Total_Custo', 'Lucro_Bruto', 'Total_Impressoes', 'Total_Cliques']
+    )
+    if chart_top_n is not None and len(df_ranking_sorted) > chart_top_n:
+        # Projetos distintos da cauda vêm do store: somar as contagens por gestor repetiria projetos
+        tail_managers = df_ranking_sorted.loc[~df_ranking_sorted['Gestor'].isin(df_chart['Gestor'].iloc[:-1]), 'Gestor']
+        df_chart.loc[len(df_chart) - 1, 'Total_Projetos'] = manager_store.distinct_projects(
+            start_date, end_date, managers=tail_managers.astype(object).tolist(), combined=True
+        )
+    df_chart = finalize_manager_ranking(df_chart)
+
     fig = px.bar(
-        df_ranking_sorted,
+        df_chart,
         x="Gestor",
         y=selected_metric_column,
         title=f"Ranking de Gestores por {selected_metric_display}",
@@ -346,9 +340,73 @@ if not df_ranking_raw.empty:
         color=selected_metric_column, 
         color_continuous_scale=px.colors.sequential.Greens 
     )
-    fig.update_layout(xaxis={'categoryorder':'total descending'}) 
+    fig.update_layout(xaxis={'categoryorder': 'array', 'categoryarray': df_chart['Gestor'].tolist()}) # "Outros" por último
     fig.update_yaxes(tickprefix=y_axis_prefix, ticksuffix=y_axis_suffix)
     st.plotly_chart(fig, use_container_width=True)
 
+
+@st.fragment
+def ranking_filtered_sections(manager_store, df_ranking_raw, start_date, end_date):
+    """
+    Filtro de gestores e as seções que dependem dele. Mudar a seleção reexecuta só
+    este fragmento; o store chega pronto por argumento.
+    """
+    # Obter gestores únicos para o filtro, APÓS o carregamento dos dados
+    all_managers = sorted(df_ranking_raw['Gestor'].unique().tolist())
+
+    selected_managers = st.multiselect(
+        "Filtrar por Gestor(es)",
+        options=all_managers,
+        default=all_managers # Por padrão, todos os gestores são selecionados
+    )
+
+    # Aplicar filtro de gestores
+    if selected_managers:
+        df_ranking_filtered = df_ranking_raw[df_ranking_raw['Gestor'].isin(selected_managers)]
+        # Série diária dos gestores selecionados, respondida pelo store diário
+        manager_filter = selected_managers
+    else:
+        df_ranking_filtered = df_ranking_raw # Se nenhum gestor for selecionado, mostra todos
+        manager_filter = None
+        st.warning("Nenhum gestor selecionado. Exibindo dados de todos os gestores.")
+
+
+    # Se, após o filtro, o DataFrame de ranking estiver vazio, exibir mensagem e parar
+    if df_ranking_filtered.empty:
+        st.info("Nenhum dado encontrado para os gestores e período selecionados.")
+        return
+
+    st.markdown("---") # Separador visual
+
+    render_ranking_summary(df_ranking_filtered)
+
+    ranking_roi_chart(manager_store, start_date, end_date, manager_filter)
+
+    st.write("---") 
+
+    # Série diária da janela (dias × gestores selecionados), montada a partir do store
+    df_daily_performance_filtered = manager_store.daily_series(start_date, end_date, manager_filter)
+    render_daily_roi_table(df_daily_performance_filtered)
+
+    ranking_by_metric(manager_store, df_ranking_filtered, start_date, end_date, manager_filter)
+
+
+# --- Fase 1: meta mensal a partir das consultas agregadas leves (não espera o store) ---
+# A meta usa o faturamento sem filtro de gestor: somado no BigQuery, poucas linhas por mês
+overall_faturamento_for_current_period_no_manager_filter = get_revenue_totals(start_date, end_date, grain='month')['total_receita'].sum()
+
+with st.spinner("Calculando faturamento do mês anterior para meta..."):
+    previous_month_faturamento = get_previous_month_overall_faturamento(start_date)
+
+render_monthly_goal(previous_month_faturamento, overall_faturamento_for_current_period_no_manager_filter, end_date)
+
+# --- Fase 2: agrega dados por gestores (carga completa do período) ---
+with st.spinner("Processando dados de gestores..."):
+    # Store diário por gestor (somas de prefixo): mudar a janela não reagrupa as linhas brutas
+    manager_store = get_manager_daily_store(start_date, end_date, get_manager_sheets_version())
+    df_ranking_raw = manager_store.ranking(start_date, end_date) if manager_store is not None else pd.DataFrame()
+
+if not df_ranking_raw.empty:
+    ranking_filtered_sections(manager_store, df_ranking_raw, start_date, end_date)
 else:
-    st.info("Nenhum dado de ranking de gestores encontrado para o período selecionado.")
\ No newline at end of file
+    st.info("Nenhum dado de ranking de gestores encontrado para o período selecionado.")
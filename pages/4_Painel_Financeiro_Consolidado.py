@@ -1,18 +1,34 @@
 import streamlit as st
 import datetime
 import pandas as pd
-import numpy as np
 import plotly.express as px
 
 from utils import (
     format_number,
     calculate_business_metrics,
-    load_data_for_period,
     TAXA_ADWORK_PERCENT,
     COMISSAO_PERCENT,
     FUNDO_RESERVA_PERCENT,
-    get_manager_ranking_data,
-    get_project_ranking_data # <<<<< Adicione esta nova importação
+    get_manager_daily_store,
+    get_manager_sheets_version,
+    get_project_ranking_data, # <<<<< Adicione esta nova importação
+    calculate_roi,
+    style_table,
+    render_export_controls,
+    time_grain_selector,
+    TIME_GRAIN_ADJECTIVES,
+    get_performance_cube,
+    get_kpi_cube,
+    ADMANAGER_SOURCES,
+    ADMANAGER_META_SOURCE,
+    render_paginated_table,
+    render_number_table,
+    TABLE_PAGE_SIZE_OPTIONS,
+    FULL_TABLE_SOURCES,
+    full_table_uses_local_store,
+    load_full_table_page,
+    top_n_with_others,
+    top_n_selector
 )
 
 st.set_page_config(layout="wide", page_title="Dashboard BCF Digital")
@@ -31,6 +47,30 @@ CARD_COLORS = {
     "chart_profit": "#3b82f6" # Cor para lucro no gráfico
 }
 
+# --- Formatos das tabelas de Análise Diária e Tabela Completa (opções de format_number) ---
+DAILY_TABLE_FORMATS = {
+    'Investimento': {'currency': True, 'decimal_places': 2},
+    'Receita': {'currency': True, 'decimal_places': 2},
+    'Lucro Bruto': {'currency': True, 'decimal_places': 2},
+    'Comissão': {'currency': True, 'decimal_places': 2},
+    'Fundo de Reserva': {'currency': True, 'decimal_places': 2},
+    'Lucro Final': {'currency': True, 'decimal_places': 2},
+    'ROI': {'percentage': True, 'decimal_places': 2},
+}
+FULL_TABLE_COLUMNS = [
+    'data', 'source', 'dominio', 'pais', 'network_code', 'utm_campaign_norm', 'utm_source', 'utm_medium',
+    'utm_content', 'utm_term', 'total_impressoes', 'total_cliques', 'total_custo', 'total_receita',
+    'total_leads', 'total_mensagens'
+]
+FULL_TABLE_FORMATS = {
+    'total_impressoes': {'decimal_places': 0},
+    'total_cliques': {'decimal_places': 0},
+    'total_custo': {'currency': True, 'decimal_places': 2},
+    'total_receita': {'currency': True, 'decimal_places': 2},
+    'total_leads': {'decimal_places': 0},
+    'total_mensagens': {'decimal_places': 0},
+}
+
 # --- Função para criar um card customizado (HTML/CSS inline) ---
 def custom_card(title, value, subtitle, background_color, text_color="white", icon=None):
     icon_html = f'<i class="{icon}" style="margin-right: 5px;"></i>' if icon else ''
@@ -128,46 +168,34 @@ if start_date > end_date:
     st.error("Erro: A data de início não pode ser posterior à data de fim.")
     st.stop()
 
-# --- Carregar e Processar os Dados Base (UMA VEZ) ---
-with st.spinner("Carregando e processando dados financeiros..."):
-    df_data_raw = load_data_for_period(start_date, end_date)
+# --- Fase 1: cubo leve do período (agregado no BigQuery) para cards e meta ---
+# A carga completa (grão de UTM) só acontece dentro das visualizações que precisam dela
+with st.spinner("Carregando totais financeiros..."):
+    kpi_cube = get_kpi_cube(start_date, end_date)
 
-if df_data_raw.empty:
+if kpi_cube.facts.empty:
     st.warning("Nenhum dado encontrado para o período selecionado.")
     st.stop()
 
-# --- Calcular métricas a nível de linha para reutilização ---
-# Cria uma cópia para adicionar as colunas processadas sem afetar o df_data_raw
-df_data_processed = df_data_raw.copy()
-df_data_processed['Lucro_Bruto'] = df_data_processed['total_receita'] - df_data_processed['total_custo']
-df_data_processed['Comissao'] = df_data_processed['total_receita'] * COMISSAO_PERCENT
-df_data_processed['Lucro_Liquido_Final'] = df_data_processed['Lucro_Bruto'] - df_data_processed['Comissao'] - (df_data_processed['Lucro_Bruto'] * FUNDO_RESERVA_PERCENT)
-df_data_processed['ROI_Percentual'] = (
-    (df_data_processed['Lucro_Bruto'] / df_data_processed['total_custo']) * 100
-).replace([np.inf, -np.inf], np.nan).fillna(0) # Trata divisão por zero
-
-
-# --- Calcular Métricas para os Cards (usando df_data_processed) ---
-# NOTE: calculate_business_metrics em utils.py retorna um dicionário de totais
-# e modificava o df. Agora ele DEVE ser ajustado para apenas retornar os totais
-# e não modificar df_data_processed.
-# Vou assumir que calculate_business_metrics foi ajustado em utils.py
-# para apenas retornar as métricas, ou que o cálculo abaixo é o que você precisa.
+
+# --- Calcular Métricas para os Cards (totais do cubo leve do período) ---
+# Lucro, comissão e reserva são lineares nas somas, então saem direto dos totais
+period_totals = kpi_cube.totals()
+lucro_bruto_total = period_totals['total_receita'] - period_totals['total_custo']
+comissao_total = period_totals['total_receita'] * COMISSAO_PERCENT
 overall_metrics = {
-    'total_receita': df_data_processed['total_receita'].sum(),
-    'total_custo': df_data_processed['total_custo'].sum(),
-    'lucro_bruto': df_data_processed['Lucro_Bruto'].sum(),
-    'comissao': df_data_processed['Comissao'].sum(),
-    'fundo_reserva': (df_data_processed['Lucro_Bruto'].sum() * FUNDO_RESERVA_PERCENT),
-    'lucro_liquido_final': df_data_processed['Lucro_Liquido_Final'].sum(),
-    'roi': (df_data_processed['Lucro_Bruto'].sum() / df_data_processed['total_custo'].sum()) * 100 if df_data_processed['total_custo'].sum() != 0 else 0
+    'total_receita': period_totals['total_receita'],
+    'total_custo': period_totals['total_custo'],
+    'lucro_bruto': lucro_bruto_total,
+    'comissao': comissao_total,
+    'fundo_reserva': lucro_bruto_total * FUNDO_RESERVA_PERCENT,
+    'lucro_liquido_final': lucro_bruto_total - comissao_total - (lucro_bruto_total * FUNDO_RESERVA_PERCENT),
+    'roi': calculate_roi(period_totals['total_receita'], period_totals['total_custo'], zero_division=0.0)
 }
 
-df_meta_ads = df_data_processed[df_data_processed['source'].str.contains('Meta Ads')]
-investimento_total_meta_ads = df_meta_ads['total_custo'].sum()
+investimento_total_meta_ads = kpi_cube.totals({'source': ['Meta Ads', ADMANAGER_META_SOURCE]})['total_custo']
 
-df_admanager = df_data_processed[df_data_processed['source'].str.contains('Admanager')]
-faturamento_admanager_brl = df_admanager['total_receita'].sum()
+faturamento_admanager_brl = kpi_cube.totals({'source': ADMANAGER_SOURCES})['total_receita']
 
 total_receita_overall = overall_metrics['total_receita']
 total_custo_overall = overall_metrics['total_custo']
@@ -273,72 +301,33 @@ st.markdown(
 st.markdown("---")
 
 
-# --- Definição das visualizações para os botões de navegação ---
-VIEWS = [
-    {"id": "overview", "label": "Visão Geral"},
-    {"id": "manager", "label": "Por Gestor"},
-    {"id": "project", "label": "Por Projeto"}, # <<<<< Este é o botão
-    {"id": "daily", "label": "Análise Diária"},
-    {"id": "full_table", "label": "Tabela Completa"},
-]
+# --- VISUALIZAÇÕES (cada aba declara o dado de que precisa e como desenhá-lo) ---
+# Os loaders recebem (início, fim) e ficam em cache por período; só a aba ativa
+# chama o seu loader, então trocar de aba não recalcula as demais.
 
 # Inicializa o estado da sessão para a visualização ativa
 if 'active_view' not in st.session_state:
     st.session_state.active_view = 'overview' # Define 'overview' como padrão
 
-# --- Renderiza os botões de navegação ---
-with st.container():
-    st.markdown(
-        """
-        <div style='
-            display: flex; 
-            gap: 10px; 
-            margin-bottom: 20px; 
-            flex-wrap: wrap; 
-            padding: 10px; 
-            border: 1px solid #e0e0e0; 
-            border-radius: 8px;
-            background-color: #f9f9f9;
-            justify-content: center; /* Centraliza os botões no container */
-        '>
-        """,
-        unsafe_allow_html=True
-    )
-    cols = st.columns(len(VIEWS)) # Cria colunas para cada botão
-
-    for i, view in enumerate(VIEWS):
-        is_active = (st.session_state.active_view == view['id'])
-        button_type = "primary" if is_active else "secondary"
-
-        with cols[i]:
-            if st.button( # Renderiza o botão dentro da coluna
-                label=view['label'],
-                key=f"tab_button_{view['id']}",
-                help=f"Ver {view['label']}",
-                type=button_type # Tipo do botão para destaque
-            ):
-                st.session_state.active_view = view['id']
-    st.markdown("</div>", unsafe_allow_html=True)
-
 
-st.markdown("---") # Separador para o conteúdo abaixo dos botões
+def set_active_view(view_id):
+    """Callback dos botões: troca a visualização antes do redesenho, então o destaque acompanha o clique."""
+    st.session_state.active_view = view_id
 
 
-# --- Conteúdo dinâmico baseado na visualização ativa ---
-if st.session_state.active_view == 'overview':
-    # --- Preparar dados diários para os gráficos (usando df_data_processed) ---
-    df_daily_agg = df_data_processed.groupby('data').agg(
-        total_receita=('total_receita', 'sum'),
-        total_custo=('total_custo', 'sum'),
-        lucro=('Lucro_Bruto', 'sum'), # Usa o lucro bruto pré-calculado
-        # O ROI diário é calculado aqui com base no lucro bruto e custo diários agregados.
-        # Poderíamos usar 'ROI_Percentual' do df_data_processed, mas a agregação de ROI percentual
-        # não é uma soma simples. Recalcular o ROI aqui é o mais correto.
-    ).reset_index()
+@st.fragment
+def render_overview_view(performance_cube, start_date, end_date):
+    """Gráficos da visão geral. Trocar o grão reexecuta só este fragmento."""
+    # --- Preparar a série dos gráficos no grão escolhido (dia/semana/mês, agregada no cubo) ---
+    # A seleção de colunas gera um novo frame; a série memorizada no cubo segue intacta.
+    # O ROI de cada período é recalculado sobre as somas (ROI percentual não se soma).
+    chart_grain = time_grain_selector(start_date, end_date, key="financeiro_chart_grain")
+    grain_adjective = TIME_GRAIN_ADJECTIVES[chart_grain]
+    chart_tickformat = "%m/%Y" if chart_grain == 'month' else "%d/%m" # Formato de data amigável
+    df_daily_agg = performance_cube.time_series(chart_grain)[['data', 'total_receita', 'total_custo']]
+    df_daily_agg['lucro'] = df_daily_agg['total_receita'] - df_daily_agg['total_custo']
 
-    df_daily_agg['roi'] = (
-        (df_daily_agg['lucro'] / df_daily_agg['total_custo']) * 100
-    ).replace([np.inf, -np.inf], np.nan).fillna(0)
+    df_daily_agg['roi'] = calculate_roi(df_daily_agg['total_receita'], df_daily_agg['total_custo'], zero_division=0.0)
 
 
     # --- Layout de Colunas para os Gráficos ---
@@ -346,7 +335,7 @@ if st.session_state.active_view == 'overview':
 
     with chart_col1:
         # --- Visualização 1: Desempenho Financeiro (Receita, Investimento, Lucro) ---
-        st.markdown("<h3 style='text-align: center; color: #3f51b5; font-size: 1.2em;'>Desempenho Financeiro Diário</h3>", unsafe_allow_html=True)
+        st.markdown(f"<h3 style='text-align: center; color: #3f51b5; font-size: 1.2em;'>Desempenho Financeiro {grain_adjective}</h3>", unsafe_allow_html=True)
 
         # Derreter o DataFrame para facilitar a plotagem de múltiplas barras agrupadas com Plotly Express
         df_melted_financial = df_daily_agg.melt(
@@ -385,19 +374,19 @@ if st.session_state.active_view == 'overview':
 
         fig_financial_perf.update_layout(hovermode="x unified", title_x=0.5) # Centraliza o título
         fig_financial_perf.update_yaxes(rangemode="tozero", tickprefix="R$ ")
-        fig_financial_perf.update_xaxes(tickformat="%d/%m") # Formato de data amigável
+        fig_financial_perf.update_xaxes(tickformat=chart_tickformat)
 
         st.plotly_chart(fig_financial_perf, use_container_width=True)
 
     with chart_col2:
         # --- Visualização 2: Evolução do ROI ---
-        st.markdown("<h3 style='text-align: center; color: #3f51b5; font-size: 1.2em;'>Evolução do ROI Diário</h3>", unsafe_allow_html=True)
+        st.markdown(f"<h3 style='text-align: center; color: #3f51b5; font-size: 1.2em;'>Evolução do ROI {grain_adjective}</h3>", unsafe_allow_html=True)
 
         fig_roi_evolution = px.line(
             df_daily_agg,
             x='data',
             y='roi',
-            title='ROI Diário ao Longo do Tempo', # Título mais conciso para dentro da coluna
+            title=f'ROI {grain_adjective} ao Longo do Tempo', # Título mais conciso para dentro da coluna
             labels={'data': 'Data', 'roi': 'ROI (%)'},
             markers=True,
             color_discrete_sequence=[CARD_COLORS['purple']] # Cor da linha
@@ -405,157 +394,392 @@ if st.session_state.active_view == 'overview':
 
         fig_roi_evolution.update_layout(hovermode="x unified", title_x=0.5) # Centraliza o título
         fig_roi_evolution.update_yaxes(rangemode="tozero", ticksuffix="%")
-        fig_roi_evolution.update_xaxes(tickformat="%d/%m") # Formato de data amigável
+        fig_roi_evolution.update_xaxes(tickformat=chart_tickformat)
 
         st.plotly_chart(fig_roi_evolution, use_container_width=True)
 
     st.markdown("---")
 
-elif st.session_state.active_view == 'manager':
-    st.markdown("<h2 style='text-align: center; color: #3f51b5;'>Desempenho por Gestor (Ordenado por Lucro)</h2>", unsafe_allow_html=True)
-
-    # Obter os dados de ranking de gestores (passando df_data_processed)
-    df_manager_ranking, _ = get_manager_ranking_data(df_data_processed) # Use df_data_processed
 
+@st.cache_resource(ttl=3600, max_entries=16)
+def _manager_view_table(start_date, end_date, sheets_version):
+    """Tabela da visão por gestor (ordenada por lucro, com linha de totais). Somente leitura."""
+    # Ranking de gestores da janela a partir do store diário (somas de prefixo por dia)
+    manager_store = get_manager_daily_store(start_date, end_date, sheets_version)
+    df_manager_ranking = manager_store.ranking(start_date, end_date) if manager_store is not None else pd.DataFrame()
     if df_manager_ranking.empty:
+        return df_manager_ranking
+
+    # Ordenar pelo Lucro Final (Lucro_Liquido_Final) decrescente
+    df_manager_ranking = df_manager_ranking.sort_values(by='Lucro_Liquido_Final', ascending=False).reset_index(drop=True)
+
+    # Preparar o DataFrame para exibição
+    df_display = df_manager_ranking[[
+        'Gestor', 'Total_Projetos', 'Total_Custo', 'Total_Faturamento',
+        'Lucro_Bruto', 'Comissao', 'Lucro_Liquido_Final', 'ROI_Percentual'
+    ]].copy()
+
+    # Renomear colunas para exibição
+    df_display.columns = [
+        'Gestor', 'Projetos', 'Investimento', 'Receita',
+        'Lucro Bruto', 'Comissão', 'Lucro Final', 'ROI'
+    ]
+
+    # --- Cálculo da linha de totalização ---
+    total_investimento = df_manager_ranking['Total_Custo'].sum()
+    total_receita = df_manager_ranking['Total_Faturamento'].sum()
+    df_totals = pd.DataFrame([{
+        'Gestor': f"{len(df_manager_ranking)} Gestores",
+        'Projetos': df_manager_ranking['Total_Projetos'].sum(),
+        'Investimento': total_investimento,
+        'Receita': total_receita,
+        'Lucro Bruto': df_manager_ranking['Lucro_Bruto'].sum(),
+        'Comissão': df_manager_ranking['Comissao'].sum(),
+        'Lucro Final': df_manager_ranking['Lucro_Liquido_Final'].sum(),
+        'ROI': calculate_roi(total_receita, total_investimento, zero_division=0.0)
+    }])
+
+    # Concatenar o DataFrame principal com a linha de totalização
+    return pd.concat([df_display, df_totals], ignore_index=True)
+
+
+def load_manager_view(start_date, end_date):
+    """Loader da aba 'Por Gestor' (a versão da planilha entra na chave do cache)."""
+    return _manager_view_table(start_date, end_date, get_manager_sheets_version())
+
+
+def render_manager_view(df_final_table, start_date, end_date):
+    """Tabela de desempenho por gestor."""
+    st.markdown("<h2 style='text-align: center; color: #3f51b5;'>Desempenho por Gestor (Ordenado por Lucro)</h2>", unsafe_allow_html=True)
+
+    if df_final_table.empty:
         st.warning("Nenhum dado de gestores encontrado para o período selecionado.")
-    else:
-        # Ordenar pelo Lucro Final (Lucro_Liquido_Final) decrescente
-        df_manager_ranking = df_manager_ranking.sort_values(by='Lucro_Liquido_Final', ascending=False).reset_index(drop=True)
-
-        # Preparar o DataFrame para exibição
-        df_display = df_manager_ranking[[
-            'Gestor', 'Total_Projetos', 'Total_Custo', 'Total_Faturamento',
-            'Lucro_Bruto', 'Comissao', 'Lucro_Liquido_Final', 'ROI_Percentual'
-        ]].copy()
-
-        # Renomear colunas para exibição
-        df_display.columns = [
-            'Gestor', 'Projetos', 'Investimento', 'Receita',
-            'Lucro Bruto', 'Comissão', 'Lucro Final', 'ROI'
-        ]
-        
-        # --- Cálculo da linha de totalização ---
-        total_projetos = df_manager_ranking['Total_Projetos'].sum()
-        total_investimento = df_manager_ranking['Total_Custo'].sum()
-        total_receita = df_manager_ranking['Total_Faturamento'].sum()
-        total_lucro_bruto = df_manager_ranking['Lucro_Bruto'].sum()
-        total_comissao = df_manager_ranking['Comissao'].sum()
-        total_lucro_final = df_manager_ranking['Lucro_Liquido_Final'].sum()
-        total_roi = (total_lucro_bruto / total_investimento) * 100 if total_investimento != 0 else 0
-
-        # DataFrame para a linha de totalização
-        df_totals = pd.DataFrame([{
-            'Gestor': f"{len(df_manager_ranking)} Gestores",
-            'Projetos': total_projetos,
-            'Investimento': total_investimento,
-            'Receita': total_receita,
-            'Lucro Bruto': total_lucro_bruto,
-            'Comissão': total_comissao,
-            'Lucro Final': total_lucro_final,
-            'ROI': total_roi
-        }])
-
-        # Concatenar o DataFrame principal com a linha de totalização
-        df_final_table = pd.concat([df_display, df_totals], ignore_index=True)
-
-        # Função de estilização para o DataFrame
-        def style_manager_table(df):
-            styled_df = df.style.format({
-                'Projetos': '{:.0f}',
-                'Investimento': 'R$ {:,.2f}',
-                'Receita': 'R$ {:,.2f}',
-                'Lucro Bruto': 'R$ {:,.2f}',
-                'Comissão': 'R$ {:,.2f}',
-                'Lucro Final': 'R$ {:,.2f}',
-                'ROI': '{:,.2f}%'
-            }).applymap(lambda x: f'color: {CARD_COLORS["red"]}; font-weight: bold;', 
-                        subset=pd.IndexSlice[df.index[:-1], ['Investimento']]) \
-              .applymap(lambda x: f'color: {CARD_COLORS["green"]}; font-weight: bold;', 
-                        subset=pd.IndexSlice[df.index[:-1], ['Receita', 'Lucro Final', 'ROI']]) \
-              .apply(lambda x: ['font-weight: bold; background-color: #f0f2f6;' for _ in x], axis=1, 
-                     subset=pd.IndexSlice[df.index[-1], :]) 
-            
-            styled_df = styled_df.applymap(lambda x: f'color: {CARD_COLORS["red"]}; font-weight: bold;', 
-                                            subset=pd.IndexSlice[df.index[-1], ['Investimento']]) \
-                                  .applymap(lambda x: f'color: {CARD_COLORS["green"]}; font-weight: bold;', 
-                                            subset=pd.IndexSlice[df.index[-1], ['Receita', 'Lucro Final', 'ROI']])
-            return styled_df
-
-        st.dataframe(style_manager_table(df_final_table), use_container_width=True, hide_index=True)
-
-elif st.session_state.active_view == 'project': # <<<<< NOVO BLOCO PARA 'POR PROJETO'
-    st.markdown("<h2 style='text-align: center; color: #3f51b5;'>Desempenho por Projeto (Ordenado por Lucro)</h2>", unsafe_allow_html=True)
+        return
+
+    # CSS de todas as células montado de uma vez (sem applymap célula a célula)
+    styled_df = style_table(
+        df_final_table,
+        column_css={
+            'Investimento': f'color: {CARD_COLORS["red"]}; font-weight: bold;',
+            'Receita': f'color: {CARD_COLORS["green"]}; font-weight: bold;',
+            'Lucro Final': f'color: {CARD_COLORS["green"]}; font-weight: bold;',
+            'ROI': f'color: {CARD_COLORS["green"]}; font-weight: bold;',
+        },
+        row_css={len(df_final_table) - 1: 'font-weight: bold; background-color: #f0f2f6;'},
+        max_rows=len(df_final_table)
+    ).format({
+        'Projetos': '{:.0f}',
+        'Investimento': 'R$ {:,.2f}',
+        'Receita': 'R$ {:,.2f}',
+        'Lucro Bruto': 'R$ {:,.2f}',
+        'Comissão': 'R$ {:,.2f}',
+        'Lucro Final': 'R$ {:,.2f}',
+        'ROI': '{:,.2f}%'
+    })
+    st.dataframe(styled_df, use_container_width=True, hide_index=True)
+
+    # Exportação das linhas de gestores (sem a linha de totais)
+    render_export_controls(
+        df_final_table.iloc[:-1],
+        f"financeiro_por_gestor_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}",
+        key="financeiro_manager_table",
+        data_version=(start_date, end_date, get_manager_sheets_version()) # Muda com o mapeamento de gestores
+    )
 
-    # Obter os dados de ranking de projetos
-    df_project_ranking = get_project_ranking_data(df_data_processed) # Use df_data_processed
 
+@st.cache_resource(ttl=3600, max_entries=16)
+def _project_view_table(start_date, end_date, sheets_version):
+    """Tabela da visão por projeto (ordenada por lucro, com linha de totais). Somente leitura."""
+    # Linhas dia × gestor × projeto da janela, fatiadas do store diário por gestor
+    manager_store = get_manager_daily_store(start_date, end_date, sheets_version)
+    df_project_ranking = get_project_ranking_data(manager_store.project_rows(start_date, end_date)) if manager_store is not None else pd.DataFrame()
     if df_project_ranking.empty:
+        return df_project_ranking
+
+    # Ordenar pelo Lucro_Liquido_Final decrescente
+    df_project_ranking = df_project_ranking.sort_values(by='Lucro_Liquido_Final', ascending=False).reset_index(drop=True)
+
+    # Preparar o DataFrame para exibição (renomear colunas para o display final)
+    df_display = df_project_ranking.rename(columns={
+        'Lucro_Bruto': 'Lucro Bruto',
+        'Comissao': 'Comissão',
+        'Lucro_Liquido_Final': 'Lucro Final',
+        'ROI_Percentual': 'ROI'
+    })
+
+    # --- Cálculo da linha de totalização ---
+    total_investimento = df_project_ranking['Investimento'].sum()
+    total_receita = df_project_ranking['Receita'].sum()
+    df_totals = pd.DataFrame([{
+        'Projeto': f"{len(df_project_ranking)} Projetos", # Conta o número de projetos distintos
+        'Gestor': 'Todos',
+        'Investimento': total_investimento,
+        'Receita': total_receita,
+        'Lucro Bruto': df_project_ranking['Lucro_Bruto'].sum(),
+        'Comissão': df_project_ranking['Comissao'].sum(),
+        'Lucro Final': df_project_ranking['Lucro_Liquido_Final'].sum(),
+        'ROI': calculate_roi(total_receita, total_investimento, zero_division=0.0)
+    }])
+
+    # Concatenar o DataFrame principal com a linha de totalização
+    return pd.concat([df_display, df_totals], ignore_index=True)
+
+
+def load_project_view(start_date, end_date):
+    """Loader da aba 'Por Projeto' (a versão da planilha entra na chave do cache)."""
+    return _project_view_table(start_date, end_date, get_manager_sheets_version())
+
+
+def render_project_view(df_final_table, start_date, end_date):
+    """Tabela de desempenho por projeto."""
+    st.markdown("<h2 style='text-align: center; color: #3f51b5;'>Desempenho por Projeto (Ordenado por Lucro)</h2>", unsafe_allow_html=True)
+
+    if df_final_table.empty:
         st.warning("Nenhum dado de projetos encontrado para o período selecionado.")
-    else:
-        # Ordenar pelo Lucro_Liquido_Final decrescente
-        df_project_ranking = df_project_ranking.sort_values(by='Lucro_Liquido_Final', ascending=False).reset_index(drop=True)
-
-        # Preparar o DataFrame para exibição (renomear colunas para o display final)
-        df_display = df_project_ranking.rename(columns={
-            'Lucro_Bruto': 'Lucro Bruto',
-            'Comissao': 'Comissão',
-            'Lucro_Liquido_Final': 'Lucro Final',
-            'ROI_Percentual': 'ROI'
-        }).copy()
-        
-        # --- Cálculo da linha de totalização ---
-        total_investimento = df_project_ranking['Investimento'].sum()
-        total_receita = df_project_ranking['Receita'].sum()
-        total_lucro_bruto = df_project_ranking['Lucro_Bruto'].sum()
-        total_comissao = df_project_ranking['Comissao'].sum()
-        total_lucro_final = df_project_ranking['Lucro_Liquido_Final'].sum()
-        total_roi = (total_lucro_bruto / total_investimento) * 100 if total_investimento != 0 else 0
-
-        # DataFrame para a linha de totalização
-        df_totals = pd.DataFrame([{
-            'Projeto': f"{len(df_project_ranking)} Projetos", # Conta o número de projetos distintos
-            'Gestor': 'Todos', # Ou pode deixar vazio ''
-            'Investimento': total_investimento,
-            'Receita': total_receita,
-            'Lucro Bruto': total_lucro_bruto,
-            'Comissão': total_comissao,
-            'Lucro Final': total_lucro_final,
-            'ROI': total_roi
-        }])
-
-        # Concatenar o DataFrame principal com a linha de totalização
-        df_final_table = pd.concat([df_display, df_totals], ignore_index=True)
-
-        # Função de estilização para o DataFrame (similar à do gestor)
-        def style_project_table(df):
-            styled_df = df.style.format({
-                'Investimento': 'R$ {:,.2f}',
-                'Receita': 'R$ {:,.2f}',
-                'Lucro Bruto': 'R$ {:,.2f}',
-                'Comissão': 'R$ {:,.2f}',
-                'Lucro Final': 'R$ {:,.2f}',
-                'ROI': '{:,.2f}%'
-            }).applymap(lambda x: f'color: {CARD_COLORS["red"]}; font-weight: bold;', 
-                        subset=pd.IndexSlice[df.index[:-1], ['Investimento']]) \
-              .applymap(lambda x: f'color: {CARD_COLORS["green"]}; font-weight: bold;', 
-                        subset=pd.IndexSlice[df.index[:-1], ['Receita', 'Lucro Final', 'ROI']]) \
-              .apply(lambda x: ['font-weight: bold; background-color: #f0f2f6;' for _ in x], axis=1, 
-                     subset=pd.IndexSlice[df.index[-1], :]) 
-            
-            styled_df = styled_df.applymap(lambda x: f'color: {CARD_COLORS["red"]}; font-weight: bold;', 
-                                            subset=pd.IndexSlice[df.index[-1], ['Investimento']]) \
-                                  .applymap(lambda x: f'color: {CARD_COLORS["green"]}; font-weight: bold;', 
-                                            subset=pd.IndexSlice[df.index[-1], ['Receita', 'Lucro Final', 'ROI']])
-            return styled_df
-
-        st.dataframe(style_project_table(df_final_table), use_container_width=True, hide_index=True)
-
-
-elif st.session_state.active_view == 'daily':
-    st.header("Conteúdo: Análise Diária")
-    st.write("Aqui você poderá analisar o desempenho financeiro diário com mais detalhes.")
-
-elif st.session_state.active_view == 'full_table':
-    st.header("Conteúdo: Tabela Completa")
-    st.write("Aqui você encontrará a tabela completa de todos os dados financeiros brutos.")
\ No newline at end of file
+        return
+
+    # Só os N projetos de maior lucro; a cauda vira "Outros" e a linha de totais segue cobrindo todos
+    top_n = top_n_selector(key="financeiro_project_top_n")
+    df_projects_top = top_n_with_others(
+        df_final_table.iloc[:-1], 'Projeto', 'Lucro Final', top_n,
+        sum_cols=['Investimento', 'Receita', 'Lucro Bruto', 'Comissão', 'Lucro Final']
+    )
+    df_projects_top['ROI'] = calculate_roi(df_projects_top['Receita'], df_projects_top['Investimento'], zero_division=0.0)
+    df_projects_top['Gestor'] = df_projects_top['Gestor'].astype(object).fillna('Vários')
+    df_display_table = pd.concat([df_projects_top, df_final_table.iloc[-1:]], ignore_index=True)
+
+    # CSS de todas as células montado de uma vez (sem applymap célula a célula)
+    styled_df = style_table(
+        df_display_table,
+        column_css={
+            'Investimento': f'color: {CARD_COLORS["red"]}; font-weight: bold;',
+            'Receita': f'color: {CARD_COLORS["green"]}; font-weight: bold;',
+            'Lucro Final': f'color: {CARD_COLORS["green"]}; font-weight: bold;',
+            'ROI': f'color: {CARD_COLORS["green"]}; font-weight: bold;',
+        },
+        row_css={len(df_display_table) - 1: 'font-weight: bold; background-color: #f0f2f6;'},
+        max_rows=len(df_display_table)
+    ).format({
+        'Investimento': 'R$ {:,.2f}',
+        'Receita': 'R$ {:,.2f}',
+        'Lucro Bruto': 'R$ {:,.2f}',
+        'Comissão': 'R$ {:,.2f}',
+        'Lucro Final': 'R$ {:,.2f}',
+        'ROI': '{:,.2f}%'
+    })
+    st.dataframe(styled_df, use_container_width=True, hide_index=True)
+
+    # Exportação das linhas de projetos (sem a linha de totais)
+    render_export_controls(
+        df_final_table.iloc[:-1],
+        f"financeiro_por_projeto_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}",
+        key="financeiro_project_table",
+        data_version=(start_date, end_date, get_manager_sheets_version()) # Muda com o mapeamento de gestores
+    )
+
+
+def render_daily_view(performance_cube, start_date, end_date):
+    """Tabela dia a dia do período (somas do roll-up diário do cubo), com linha de totais."""
+    st.markdown("<h2 style='text-align: center; color: #3f51b5;'>Análise Diária</h2>", unsafe_allow_html=True)
+
+    # A seleção de colunas gera um novo frame; o roll-up memorizado no cubo segue intacto
+    df_daily = performance_cube.time_series('day')[['data', 'total_custo', 'total_receita']]
+    if df_daily.empty:
+        st.warning("Nenhum dado diário encontrado para o período selecionado.")
+        return
+
+    # Lucro, comissão e reserva são lineares nas somas: calculados por dia e nos totais
+    df_daily['lucro_bruto'] = df_daily['total_receita'] - df_daily['total_custo']
+    df_daily['comissao'] = df_daily['total_receita'] * COMISSAO_PERCENT
+    df_daily['fundo_reserva'] = df_daily['lucro_bruto'] * FUNDO_RESERVA_PERCENT
+    df_daily['lucro_final'] = df_daily['lucro_bruto'] - df_daily['comissao'] - df_daily['fundo_reserva']
+    df_daily['roi'] = calculate_roi(df_daily['total_receita'], df_daily['total_custo'], zero_division=0.0)
+    df_daily.columns = [
+        'Data', 'Investimento', 'Receita', 'Lucro Bruto', 'Comissão', 'Fundo de Reserva', 'Lucro Final', 'ROI'
+    ]
+
+    # Linha de totais a partir das somas do período (ROI recalculado sobre as somas)
+    total_investimento = df_daily['Investimento'].sum()
+    total_receita = df_daily['Receita'].sum()
+    df_totals = pd.DataFrame([{
+        'Data': f"{len(df_daily)} Dias",
+        'Investimento': total_investimento,
+        'Receita': total_receita,
+        'Lucro Bruto': df_daily['Lucro Bruto'].sum(),
+        'Comissão': df_daily['Comissão'].sum(),
+        'Fundo de Reserva': df_daily['Fundo de Reserva'].sum(),
+        'Lucro Final': df_daily['Lucro Final'].sum(),
+        'ROI': calculate_roi(total_receita, total_investimento, zero_division=0.0)
+    }])
+
+    render_paginated_table(
+        df_daily,
+        DAILY_TABLE_FORMATS,
+        key="financeiro_daily_table",
+        data_version=(start_date, end_date),
+        totals_row=df_totals,
+        default_sort='Data',
+        default_ascending=True,
+        heatmap_columns=['Lucro Final', 'ROI'],
+        hide_index=True,
+        width='stretch',
+        column_config={'Data': st.column_config.DatetimeColumn("Data", format="DD/MM/YYYY")}
+    )
+
+    render_export_controls(
+        df_daily,
+        f"financeiro_diario_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}",
+        key="financeiro_daily_table",
+        data_version=(start_date, end_date)
+    )
+
+
+def _push_full_table_cursor(cursor):
+    """Callback do botão 'Próximo': empilha o cursor do bloco seguinte."""
+    st.session_state.financeiro_full_table_cursors[1].append(cursor)
+
+
+def _pop_full_table_cursor():
+    """Callback do botão 'Anterior': volta ao cursor do bloco anterior."""
+    st.session_state.financeiro_full_table_cursors[1].pop()
+
+
+@st.fragment
+def render_full_table_view(_, start_date, end_date):
+    """
+    Todas as linhas do período no grão de UTM, em blocos paginados por keyset
+    (frame do período em janelas curtas, BigQuery nas longas). Filtros e navegação
+    reexecutam só este fragmento e apenas o bloco visível fica em memória.
+    """
+    st.markdown("<h2 style='text-align: center; color: #3f51b5;'>Tabela Completa</h2>", unsafe_allow_html=True)
+
+    col_filter, col_sources, col_size = st.columns([3, 3, 1])
+    with col_filter:
+        text_query = st.text_input(
+            "Filtrar", key="financeiro_full_table_filter",
+            placeholder="Buscar em domínio, país, network code ou campanha"
+        )
+    with col_sources:
+        sources = st.multiselect("Fontes", FULL_TABLE_SOURCES, default=FULL_TABLE_SOURCES, key="financeiro_full_table_sources")
+    with col_size:
+        page_size = st.selectbox("Linhas", TABLE_PAGE_SIZE_OPTIONS, index=len(TABLE_PAGE_SIZE_OPTIONS) - 1, key="financeiro_full_table_page_size")
+
+    if not sources:
+        st.info("Selecione ao menos uma fonte.")
+        return
+
+    # Pilha de cursores (início de cada bloco visitado); reinicia quando período ou filtros mudam
+    scan_token = (start_date, end_date, tuple(sources), text_query.strip().lower(), page_size)
+    cursor_state = st.session_state.get('financeiro_full_table_cursors')
+    if cursor_state is None or cursor_state[0] != scan_token:
+        cursor_state = (scan_token, [None])
+        st.session_state.financeiro_full_table_cursors = cursor_state
+    cursors = cursor_state[1]
+
+    with st.spinner("Carregando bloco da tabela..."):
+        df_page, next_cursor = load_full_table_page(start_date, end_date, sources, text_query, cursors[-1], page_size)
+
+    if df_page.empty:
+        st.warning("Nenhuma linha encontrada para o período e filtros selecionados.")
+        return
+
+    df_page = df_page[FULL_TABLE_COLUMNS]
+    render_number_table(
+        df_page,
+        FULL_TABLE_FORMATS,
+        hide_index=True,
+        width='stretch',
+        height=600, # Rolagem dentro do bloco
+        column_config={'data': st.column_config.DatetimeColumn("data", format="DD/MM/YYYY")}
+    )
+
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        st.button("← Anterior", key="financeiro_full_table_prev", disabled=len(cursors) == 1, on_click=_pop_full_table_cursor)
+    with col_info:
+        origin = "dados do período em memória" if full_table_uses_local_store(start_date, end_date) else "BigQuery"
+        first_row = (len(cursors) - 1) * page_size + 1
+        st.caption(
+            f"Bloco {len(cursors)} · linhas {first_row:,} a {first_row + len(df_page) - 1:,} · origem: {origin}".replace(',', '.')
+        )
+    with col_next:
+        st.button(
+            "Próximo →", key="financeiro_full_table_next", disabled=next_cursor is None,
+            on_click=_push_full_table_cursor, args=(next_cursor,)
+        )
+
+    # Exportação do bloco visível (dados crus, sem formatação)
+    render_export_controls(
+        df_page,
+        f"financeiro_tabela_completa_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}_bloco_{len(cursors)}",
+        key="financeiro_full_table",
+        data_version=scan_token + (len(cursors),)
+    )
+
+
+# --- Registro das visualizações (botões de navegação, dado necessário e desenho) ---
+# 'load': função (início, fim) -> dado da aba, em cache por período (None = aba que carrega
+# o próprio dado, como a tabela completa, que busca um bloco por vez)
+VIEWS = [
+    {"id": "overview", "label": "Visão Geral", "load": get_performance_cube, "render": render_overview_view},
+    {"id": "manager", "label": "Por Gestor", "load": load_manager_view, "render": render_manager_view},
+    {"id": "project", "label": "Por Projeto", "load": load_project_view, "render": render_project_view},
+    {"id": "daily", "label": "Análise Diária", "load": get_performance_cube, "render": render_daily_view},
+    {"id": "full_table", "label": "Tabela Completa", "load": None, "render": render_full_table_view},
+]
+VIEWS_BY_ID = {view['id']: view for view in VIEWS}
+
+
+@st.fragment
+def financeiro_views(start_date, end_date):
+    """
+    Botões de navegação e o conteúdo da visualização ativa. Trocar de aba reexecuta
+    só este fragmento e carrega apenas o dado da aba escolhida.
+    """
+    # --- Renderiza os botões de navegação ---
+    with st.container():
+        st.markdown(
+            """
+            <div style='
+                display: flex; 
+                gap: 10px; 
+                margin-bottom: 20px; 
+                flex-wrap: wrap; 
+                padding: 10px; 
+                border: 1px solid #e0e0e0; 
+                border-radius: 8px;
+                background-color: #f9f9f9;
+                justify-content: center; /* Centraliza os botões no container */
+            '>
+            """,
+            unsafe_allow_html=True
+        )
+        cols = st.columns(len(VIEWS)) # Cria colunas para cada botão
+
+        for i, view in enumerate(VIEWS):
+            is_active = (st.session_state.active_view == view['id'])
+            button_type = "primary" if is_active else "secondary"
+
+            with cols[i]:
+                st.button( # Renderiza o botão dentro da coluna
+                    label=view['label'],
+                    key=f"tab_button_{view['id']}",
+                    help=f"Ver {view['label']}",
+                    type=button_type, # Tipo do botão para destaque
+                    on_click=set_active_view,
+                    args=(view['id'],)
+                )
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("---") # Separador para o conteúdo abaixo dos botões
+
+    # --- Conteúdo dinâmico baseado na visualização ativa ---
+    active_view = VIEWS_BY_ID.get(st.session_state.active_view, VIEWS[0])
+    view_data = None
+    if active_view['load'] is not None:
+        with st.spinner(f"Carregando {active_view['label']}..."):
+            view_data = active_view['load'](start_date, end_date)
+    active_view['render'](view_data, start_date, end_date)
+
+
+financeiro_views(start_date, end_date)
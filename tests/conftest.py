@@ -0,0 +1,24 @@
+# tests/conftest.py
+import os
+import re
+import sys
+
+import pandas as pd
+import pytest
+
+# Os testes importam utils.py (e as páginas) a partir da raiz do repositório
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import utils  # noqa: E402
+
+
+@pytest.fixture
+def make_performance_frame():
+    """Monta um frame no PERFORMANCE_SCHEMA a partir de poucas linhas (colunas ausentes viram 0 / 'N/A')."""
+    return lambda rows: utils.apply_performance_schema(pd.DataFrame(rows))
+
+
+@pytest.fixture
+def sql_parameters():
+    """Nomes dos parâmetros (@nome) usados num SQL."""
+    return lambda query_sql: set(re.findall(r"@(\w+)", query_sql))
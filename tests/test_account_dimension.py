@@ -0,0 +1,59 @@
+# tests/test_account_dimension.py
+import pandas as pd
+import pytest
+
+import utils
+
+
+class FakeClient:
+    """Cliente BigQuery falso: devolve os frames de `results` em ordem (exceções são levantadas)."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.queries = []
+
+    def query(self, query_sql):
+        self.queries.append(query_sql)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return type('Job', (), {'to_dataframe': lambda job: result})()
+
+
+@pytest.fixture
+def local_dimension(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'LOCAL_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(utils, 'ACCOUNT_DIMENSION_PATH', str(tmp_path / 'account_names.parquet'))
+    utils._write_account_dimension(pd.DataFrame({
+        'account_name': ['conta a', 'conta b'],
+        'ultima_data': pd.to_datetime(['2024-03-01', '2024-03-10']),
+    }))
+    utils._refresh_account_dimension.clear()
+    yield
+    utils._refresh_account_dimension.clear()
+
+
+def test_account_dimension_merges_new_accounts(local_dimension, monkeypatch):
+    fake = FakeClient(pd.DataFrame({'account_name': ['conta b', 'conta c'], 'ultima_data': ['2024-03-12', '2024-03-11']}))
+    monkeypatch.setattr(utils, 'client', fake, raising=False)
+
+    df_accounts = utils.get_bigquery_distinct_account_names()
+
+    assert "date >= '2024-03-07'" in fake.queries[0] # Marca d'água menos o lookback
+    assert df_accounts['account_name'].tolist() == ['conta a', 'conta b', 'conta c']
+    assert not df_accounts.attrs.get('stale', False)
+    assert utils._read_account_dimension()['ultima_data'].max() == pd.Timestamp('2024-03-12')
+
+
+def test_failed_query_keeps_the_dimension_and_marks_it_stale(local_dimension, monkeypatch):
+    fake = FakeClient(RuntimeError("quota"), pd.DataFrame(columns=['account_name', 'ultima_data']))
+    monkeypatch.setattr(utils, 'client', fake, raising=False)
+
+    df_accounts = utils.get_bigquery_distinct_account_names()
+
+    assert df_accounts.attrs['stale']
+    assert df_accounts['account_name'].tolist() == ['conta a', 'conta b']
+    assert utils._read_account_dimension()['ultima_data'].max() == pd.Timestamp('2024-03-10') # Marca d'água intacta
+    # A falha não fica no cache: a chamada seguinte consulta de novo
+    assert not utils.get_bigquery_distinct_account_names().attrs.get('stale', False)
+    assert len(fake.queries) == 2
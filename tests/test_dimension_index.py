@@ -0,0 +1,35 @@
+# tests/test_dimension_index.py
+import numpy as np
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def filter_frame(make_performance_frame):
+    return make_performance_frame({
+        'data': ['2026-01-01'] * 6,
+        'source': [utils.ADMANAGER_SOURCE, utils.ADMANAGER_SOURCE, utils.ADMANAGER_META_SOURCE, 'Meta Ads', utils.ADMANAGER_SOURCE, 'Meta Ads'],
+        'dominio': ['b.com', 'a.com', 'a.com', None, 'c.com', 'b.com'],
+        'network_code': ['1', '2', '1', None, '1', '3'],
+        'pais': ['BR', 'BR', 'US', None, 'BR', 'US'],
+    })
+
+
+def test_dimension_index_values_and_rows(filter_frame):
+    index = utils.DimensionIndex(filter_frame)
+    assert index.values('dominio') == ['N/A', 'a.com', 'b.com', 'c.com']
+    assert index.rows('dominio', ['b.com', 'c.com', 'inexistente']).tolist() == [0, 4, 5]
+    assert index.rows('pais', []).tolist() == []
+    assert index.options('dominio', utils.ADMANAGER_SOURCES) == ['a.com', 'b.com', 'c.com']
+
+
+@pytest.mark.parametrize('domains, network_codes', [
+    (['a.com', 'b.com'], ['1']),
+    (['c.com'], ['1', '2', '3']),
+    ([], ['1']),
+])
+def test_dimension_index_mask_matches_filter_rule(filter_frame, domains, network_codes):
+    index = utils.DimensionIndex(filter_frame)
+    expected = utils.build_admanager_filter_mask(filter_frame, domains, network_codes)
+    np.testing.assert_array_equal(index.admanager_filter_mask(domains, network_codes), expected)
@@ -0,0 +1,95 @@
+# tests/test_full_table.py
+import datetime
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+def test_full_table_sql_keyset_is_unique_per_row(sql_parameters):
+    snapshot_sql = utils.build_full_table_snapshot_sql(datetime.date(2026, 1, 1), datetime.date(2026, 6, 30))
+    page_sql = utils.build_full_table_page_sql('proj.dataset.anon_table')
+
+    assert 'ROW_NUMBER() OVER (PARTITION BY data ORDER BY' in snapshot_sql
+    assert '`proj.dataset.anon_table`' in page_sql
+    assert 'ORDER BY data, row_num' in page_sql
+    assert 'FULL OUTER JOIN' not in page_sql # Os blocos leem a tabela materializada
+    assert sql_parameters(page_sql) == {'sources', 'text_query', 'after_data', 'after_row_num', 'page_limit'}
+
+
+def test_full_table_page_loader_sends_every_parameter(monkeypatch, sql_parameters):
+    captured = {}
+
+    def fake_query(query_sql, query_params=()):
+        captured['sql'], captured['params'] = query_sql, query_params
+        return pd.DataFrame()
+
+    monkeypatch.setattr(utils, 'run_bigquery_query', fake_query)
+    utils._load_full_table_page_bigquery.clear()
+    utils._load_full_table_page_bigquery('proj.dataset.anon_table', ('Meta Ads',), '', ('2026-01-02', 7), 50)
+
+    assert sql_parameters(captured['sql']) == {name for name, _, _ in captured['params']}
+
+
+# --- Paginação keyset com linhas duplicadas ---
+@pytest.fixture
+def duplicated_rows_frame(make_performance_frame):
+    """Três linhas idênticas no mesmo dia, entre linhas distintas."""
+    duplicate = {'data': '2026-01-02', 'source': 'Meta Ads', 'utm_campaign_norm': 'dup', 'total_custo': 1.0}
+    return make_performance_frame([
+        {'data': '2026-01-01', 'source': 'Meta Ads', 'utm_campaign_norm': 'x', 'total_custo': 5.0},
+        duplicate, duplicate, duplicate,
+        {'data': '2026-01-02', 'source': 'Meta Ads', 'utm_campaign_norm': 'y', 'total_custo': 2.0},
+        {'data': '2026-01-03', 'source': 'Meta Ads', 'utm_campaign_norm': 'z', 'total_custo': 3.0},
+    ])
+
+
+def read_all_pages(start_date, end_date, page_size):
+    pages, cursor = [], None
+    while True:
+        df_page, cursor = utils.load_full_table_page(start_date, end_date, ['Meta Ads'], after=cursor, page_size=page_size)
+        pages.append(df_page)
+        if cursor is None:
+            return pd.concat(pages, ignore_index=True)
+
+
+@pytest.mark.parametrize('page_size', [1, 2, 3, 4])
+def test_local_keyset_paging_keeps_duplicate_rows(monkeypatch, duplicated_rows_frame, page_size):
+    monkeypatch.setattr(utils, 'load_data_for_period', lambda start_date, end_date: duplicated_rows_frame)
+    utils._full_table_local_order.clear()
+
+    df_all = read_all_pages(datetime.date(2026, 1, 1), datetime.date(2026, 1, 31), page_size)
+
+    assert len(df_all) == len(duplicated_rows_frame)
+    assert (df_all['utm_campaign_norm'] == 'dup').sum() == 3
+    assert df_all['data'].is_monotonic_increasing
+
+
+@pytest.mark.parametrize('page_size', [1, 2, 3, 4])
+def test_bigquery_keyset_paging_keeps_duplicate_rows(monkeypatch, duplicated_rows_frame, page_size):
+    # Tabela materializada como o BigQuery a numera: ROW_NUMBER por dia (data em texto, como no SQL)
+    snapshot = duplicated_rows_frame.assign(data=lambda d: d['data'].dt.strftime('%Y-%m-%d'))
+    snapshot['row_num'] = snapshot.groupby('data').cumcount() + 1
+
+    def fake_query(query_sql, query_params=()):
+        params = {name: value for name, _, value in query_params}
+        rows = snapshot[snapshot['source'].isin(params['sources'])]
+        if params['after_data'] is not None:
+            rows = rows[
+                (rows['data'] > params['after_data'])
+                | ((rows['data'] == params['after_data']) & (rows['row_num'] > params['after_row_num']))
+            ]
+        rows = rows.sort_values(['data', 'row_num']).head(params['page_limit'])
+        return rows.assign(data=pd.to_datetime(rows['data']))
+
+    monkeypatch.setattr(utils, '_full_table_snapshot', lambda start_date, end_date: 'proj.dataset.anon_table')
+    monkeypatch.setattr(utils, 'run_bigquery_query', fake_query)
+    monkeypatch.setattr(utils, 'get_usd_to_brl_rate', lambda: 1.0)
+    utils._load_full_table_page_bigquery.clear()
+
+    df_all = read_all_pages(datetime.date(2026, 1, 1), datetime.date(2026, 6, 30), page_size)
+
+    assert len(df_all) == len(snapshot)
+    assert (df_all['utm_campaign_norm'] == 'dup').sum() == 3
+    assert 'row_num' not in df_all.columns
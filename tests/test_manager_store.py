@@ -0,0 +1,123 @@
+# tests/test_manager_store.py
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def manager_store():
+    df_daily = pd.DataFrame({
+        'data': pd.to_datetime(['2026-01-01', '2026-01-01', '2026-01-02', '2026-01-03', '2026-01-03']),
+        'Gestor': ['Ana', 'Bia', 'Ana', 'Ana', 'Bia'],
+        'utm_campaign_norm': ['p1', 'p2', 'p1', 'p3', 'p2'],
+        'total_receita': [100.0, 50.0, 30.0, 20.0, 0.0],
+        'total_custo': [40.0, 0.0, 10.0, 25.0, 5.0],
+        'total_impressoes': [10.0, 5.0, 3.0, 2.0, 1.0],
+        'total_cliques': [1.0, 1.0, 1.0, 1.0, 1.0],
+        'total_leads': 0.0,
+        'total_mensagens': 0.0,
+    })
+    return utils.ManagerDailyStore(df_daily, datetime.date(2026, 1, 1), datetime.date(2026, 1, 3))
+
+
+def test_manager_store_ranking_window(manager_store):
+    df_ranking = manager_store.ranking(datetime.date(2026, 1, 2), datetime.date(2026, 1, 3)).set_index('Gestor')
+
+    assert df_ranking.loc['Ana', 'Total_Faturamento'] == 50.0
+    assert df_ranking.loc['Ana', 'Total_Custo'] == 35.0
+    assert df_ranking.loc['Bia', 'Total_Faturamento'] == 0.0
+    assert df_ranking.loc['Bia', 'ROI_Percentual'] == pytest.approx(-100.0)
+
+
+def test_manager_store_zero_cost_roi(manager_store):
+    df_ranking = manager_store.ranking(datetime.date(2026, 1, 1), datetime.date(2026, 1, 1)).set_index('Gestor')
+    assert df_ranking.loc['Bia', 'ROI_Percentual'] == 0.0 # Receita sem custo: 0 no ranking
+
+
+def test_manager_store_totals_and_project_rows(manager_store):
+    totals = manager_store.totals(datetime.date(2026, 1, 1), datetime.date(2026, 1, 3), managers=['Ana'])
+    assert totals['total_receita'] == 150.0
+    assert totals['total_custo'] == 75.0
+    assert len(manager_store.project_rows(datetime.date(2026, 1, 3), datetime.date(2026, 1, 3))) == 2
+    assert manager_store.covers(datetime.date(2026, 1, 2), datetime.date(2026, 1, 3))
+    assert not manager_store.covers(datetime.date(2025, 12, 31), datetime.date(2026, 1, 3))
+
+
+def test_manager_store_registry_builds_once_across_threads(manager_store, monkeypatch):
+    builds = []
+
+    def slow_build(start_date, end_date, sheets_version):
+        builds.append(sheets_version)
+        time.sleep(0.05) # Outras sessões chegam enquanto o store é montado
+        return manager_store
+
+    monkeypatch.setattr(utils, '_build_manager_daily_store', slow_build)
+    utils._manager_store_registry.clear()
+    window = (datetime.date(2026, 1, 2), datetime.date(2026, 1, 3), 'v1')
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        stores = list(pool.map(lambda _: utils.get_manager_daily_store(*window), range(16)))
+    utils._manager_store_registry.clear()
+
+    assert builds == ['v1']
+    assert all(store is manager_store for store in stores)
+
+
+# --- Projetos distintos (bitmaps por gestor) ---
+def test_manager_store_distinct_projects(manager_store):
+    start, end = datetime.date(2026, 1, 1), datetime.date(2026, 1, 3)
+    df_ranking = manager_store.ranking(datetime.date(2026, 1, 2), end).set_index('Gestor')
+
+    assert df_ranking.loc['Ana', 'Total_Projetos'] == 2
+    assert manager_store.distinct_projects(start, end, combined=True) == 3
+    assert manager_store.distinct_projects(start, end, managers=['Bia'], combined=True) == 1
+
+
+def random_daily_with_managers(n_days, n_managers, n_projects, n_rows, seed=0):
+    """Linhas dia × gestor × projeto aleatórias; cada projeto pertence a um único gestor."""
+    rng = np.random.default_rng(seed)
+    projects = rng.integers(0, n_projects, n_rows)
+    return pd.DataFrame({
+        'data': pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, n_days, n_rows), unit='D'),
+        'Gestor': [f"g{project % n_managers}" for project in projects],
+        'utm_campaign_norm': [f"p{project}" for project in projects],
+        **{col: 1.0 for col in utils.PERFORMANCE_METRIC_COLUMNS},
+    })
+
+
+def expected_distinct(df_daily, start, end, managers=None):
+    window = df_daily[(df_daily['data'] >= pd.Timestamp(start)) & (df_daily['data'] <= pd.Timestamp(end))]
+    if managers is not None:
+        window = window[window['Gestor'].isin(managers)]
+    return window.groupby('Gestor')['utm_campaign_norm'].nunique(), window['utm_campaign_norm'].nunique()
+
+
+@pytest.mark.parametrize('bitmap_max_bytes', [utils.MANAGER_STORE_BITMAP_MAX_BYTES, 0]) # 0: contagem pelas linhas
+def test_manager_store_distinct_projects_match_pandas(monkeypatch, bitmap_max_bytes):
+    monkeypatch.setattr(utils, 'MANAGER_STORE_BITMAP_MAX_BYTES', bitmap_max_bytes)
+    df_daily = random_daily_with_managers(n_days=40, n_managers=7, n_projects=300, n_rows=5000)
+    store = utils.ManagerDailyStore(df_daily, datetime.date(2026, 1, 1), datetime.date(2026, 2, 9))
+
+    for start, end, managers in [
+        (datetime.date(2026, 1, 1), datetime.date(2026, 2, 9), None),
+        (datetime.date(2026, 1, 10), datetime.date(2026, 1, 16), ['g1', 'g4']),
+        (datetime.date(2026, 3, 1), datetime.date(2026, 3, 2), None), # Janela sem dias
+    ]:
+        per_manager, combined = expected_distinct(df_daily, start, end, managers)
+        counts = pd.Series(store.distinct_projects(start, end), index=store.managers)
+        assert counts.reindex(per_manager.index).tolist() == per_manager.tolist()
+        assert store.distinct_projects(start, end, managers=managers, combined=True) == combined
+
+
+def test_manager_store_bitmap_size_is_days_times_projects():
+    # Um ano, 3000 projetos e 20 gestores: ~365 × 3000 / 8 bytes (a matriz densa seria 20× maior)
+    df_daily = random_daily_with_managers(n_days=365, n_managers=20, n_projects=3000, n_rows=200_000)
+    store = utils.ManagerDailyStore(df_daily, datetime.date(2026, 1, 1), datetime.date(2026, 12, 31))
+
+    assert store.project_bitmap_bytes <= 365 * (3000 // 8 + 20)
+    assert store.distinct_projects(datetime.date(2026, 1, 1), datetime.date(2026, 12, 31), combined=True) == df_daily['utm_campaign_norm'].nunique()
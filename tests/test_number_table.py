@@ -0,0 +1,47 @@
+# tests/test_number_table.py
+import numpy as np
+import pandas as pd
+
+import utils
+
+
+TABLE_FORMATS = {
+    'receita': {'currency': True, 'decimal_places': 2},
+    'roi': {'percentage': True, 'decimal_places': 1},
+    'cliques': {'decimal_places': 0},
+}
+
+
+def test_format_number_series_matches_format_number():
+    values = pd.Series([1234.56, -0.5, np.nan, np.inf, 1e6])
+    expected = [utils.format_number(value, currency=True, decimal_places=2) for value in values]
+    assert utils.format_number_series(values, currency=True, decimal_places=2).tolist() == expected
+
+
+def test_render_number_table_shows_pt_br_text_and_keeps_numbers(monkeypatch):
+    rendered = {}
+    monkeypatch.setattr(utils.st, 'dataframe', lambda data, **kwargs: rendered.update(data=data, kwargs=kwargs))
+    df = pd.DataFrame({'site': ['a', 'b'], 'receita': [1234.56, 98765.4], 'roi': [12.34, np.inf], 'cliques': [1500, 20]})
+
+    utils.render_number_table(df, TABLE_FORMATS, hide_index=True)
+
+    styler = rendered['data']
+    html = styler.to_html()
+    for text in ['R$ 1.234,56', 'R$ 98.765,40', '12,3%', 'Inf%', '1.500']:
+        assert text in html
+    assert rendered['kwargs'] == {'hide_index': True}
+    # Ordenação e exportação seguem com os números crus
+    assert styler.data['receita'].tolist() == [1234.56, 98765.4]
+    assert df['receita'].dtype == 'float64'
+
+
+def test_render_number_table_formats_styled_tables(monkeypatch):
+    rendered = {}
+    monkeypatch.setattr(utils.st, 'dataframe', lambda data, **kwargs: rendered.update(data=data))
+    df = pd.DataFrame({'receita': [-1234.5, 10.0]})
+
+    utils.render_number_table(utils.style_table(df, column_css={'receita': utils.sign_color_css(df['receita'])}), TABLE_FORMATS)
+
+    html = rendered['data'].to_html()
+    assert 'R$ -1.234,50' in html
+    assert 'color' in html # CSS do style_table preservado
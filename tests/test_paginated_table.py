@@ -0,0 +1,37 @@
+# tests/test_paginated_table.py
+from streamlit.testing.v1 import AppTest
+
+
+def paginated_table_app():
+    import pandas as pd
+    import utils
+
+    df = pd.DataFrame({'site': [f"site{i:03d}" for i in range(300)], 'receita': [float(i) for i in range(300)]})
+    utils.render_paginated_table(df, {'receita': {'currency': True}}, key="t", data_version="v1", default_sort='receita')
+
+
+def run_on_page(page):
+    app = AppTest.from_function(paginated_table_app).run()
+    app.number_input(key="t_page").set_value(page).run()
+    assert app.number_input(key="t_page").value == page
+    return app
+
+
+def test_new_sort_order_goes_back_to_first_page():
+    app = run_on_page(3)
+    app.toggle(key="t_ascending").set_value(True).run()
+    assert app.number_input(key="t_page").value == 1
+
+    app.number_input(key="t_page").set_value(2).run()
+    app.text_input(key="t_filter").set_value("site1").run()
+    assert app.number_input(key="t_page").value == 1
+
+
+def test_new_page_size_goes_back_to_first_page():
+    app = run_on_page(2)
+    app.selectbox(key="t_page_size").set_value(50).run()
+    assert app.number_input(key="t_page").value == 1
+
+    app.number_input(key="t_page").set_value(4).run()
+    app.run() # Rerun sem mudanças mantém a página
+    assert app.number_input(key="t_page").value == 4
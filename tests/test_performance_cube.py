@@ -0,0 +1,48 @@
+# tests/test_performance_cube.py
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def cube(make_performance_frame):
+    start = datetime.date(2024, 1, 1)
+    return utils.PerformanceCube.from_performance_frame(make_performance_frame({
+        'data': pd.to_datetime([start + datetime.timedelta(days=i % 40) for i in range(400)]),
+        'source': ['admanager' if i % 2 else 'facebook' for i in range(400)],
+        'dominio': [f"site{i % 7}.com" for i in range(400)],
+        'pais': [f"P{i % 5}" for i in range(400)],
+        'total_receita': [float(i) for i in range(400)],
+        'total_custo': [float(i % 13) for i in range(400)],
+    }))
+
+
+def test_cube_rollup_matches_facts(cube):
+    by_domain = cube.rollup(['dominio']).set_index('dominio')['total_receita']
+    expected = cube.facts.groupby('dominio', observed=True)['total_receita'].sum()
+    pd.testing.assert_series_equal(by_domain.sort_index(), expected.sort_index(), check_names=False)
+    assert cube.rollup(['dominio']) is cube.rollup(['dominio']) # Memorizado
+    assert cube.totals({'pais': ['P1']})['total_receita'] == cube.facts.loc[cube.facts['pais'] == 'P1', 'total_receita'].sum()
+
+
+def test_cube_memo_is_safe_across_threads(cube, monkeypatch):
+    # Limite baixo: as memórias são esvaziadas o tempo todo enquanto outras threads as percorrem
+    monkeypatch.setattr(utils, '_CUBE_MEMO_LIMIT', 3)
+    queries = [(['dominio', 'pais'], None), (['dominio'], None), (['pais'], None), (['data'], {'pais': ['P2']}), ((), None)]
+
+    def run(i):
+        by, where = queries[i % len(queries)]
+        cube.time_series('week', where)
+        return float(cube.rollup(by, where)['total_receita'].sum())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        totals = list(pool.map(run, range(400)))
+
+    all_revenue = cube.facts['total_receita'].sum()
+    p2_revenue = cube.facts.loc[cube.facts['pais'] == 'P2', 'total_receita'].sum()
+    assert totals == [p2_revenue if i % len(queries) == 3 else all_revenue for i in range(400)]
+    assert len(cube._rollups) <= 3
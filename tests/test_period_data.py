@@ -0,0 +1,56 @@
+# tests/test_period_data.py
+import datetime
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def period_frame(monkeypatch):
+    """load_data_for_period sobre um resultado falso do BigQuery (receita em USD, cotação 5)."""
+    monkeypatch.setattr(utils, 'get_data_from_bigquery', lambda query_sql: pd.DataFrame({
+        'data': ['2024-03-01', '2024-03-01', '2024-03-02'],
+        'source': [utils.ADMANAGER_SOURCE, 'Meta Ads', utils.ADMANAGER_SOURCE],
+        'dominio': ['a.com', 'N/A', 'b.com'],
+        'network_code': ['1', 'N/A', '2'],
+        'total_receita': [10.0, 0.0, 4.0],
+        'total_custo': [0.0, 7.0, 0.0],
+    }))
+    monkeypatch.setattr(utils, 'get_usd_to_brl_rate', lambda: 5.0)
+    start_date, end_date = datetime.date(2024, 3, 1), datetime.date(2024, 3, 2)
+    utils._load_period_frame.clear()
+    utils._filtered_period_frame.clear()
+    yield start_date, end_date
+    utils._load_period_frame.clear()
+    utils._filtered_period_frame.clear()
+
+
+def test_cached_period_frame_survives_page_transforms(period_frame):
+    df = utils.load_data_for_period(*period_frame)
+    expected = df.copy()
+
+    # Escritas in-place nos dados compartilhados falham em vez de alterar o cache
+    with pytest.raises(ValueError):
+        df.loc[0, 'total_custo'] = 99.0
+    with pytest.raises(ValueError):
+        df.loc[0, 'source'] = 'Meta Ads'
+
+    # Transformações típicas das páginas sobre o frame recebido
+    df['total_receita'] = df['total_receita'] * 2
+    df['lucro'] = df['total_receita'] - df['total_custo']
+    df.drop(columns=['pais'], inplace=True)
+
+    pd.testing.assert_frame_equal(utils.load_data_for_period(*period_frame), expected)
+    assert expected['total_receita'].tolist() == [50.0, 0.0, 20.0] # Convertida para BRL uma única vez
+
+
+def test_filtered_period_frame_is_read_only(period_frame):
+    df = utils.get_filtered_period_data(*period_frame, ('a.com',), ('1',))
+    assert df['dominio'].tolist() == ['a.com', 'N/A']
+
+    df['total_receita'] = 0.0
+    with pytest.raises(ValueError):
+        df.loc[df.index[0], 'total_custo'] = 1.0
+    assert utils.get_filtered_period_data(*period_frame, ('a.com',), ('1',))['total_receita'].tolist() == [50.0, 0.0]
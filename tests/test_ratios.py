@@ -0,0 +1,32 @@
+# tests/test_ratios.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def test_safe_ratio_zero_division_rules():
+    result = utils.safe_ratio(np.array([10.0, 0.0, 6.0, np.nan]), np.array([0.0, 0.0, 3.0, 2.0]), zero_division=np.inf)
+    assert np.isinf(result[0])
+    assert result[1] == 0.0 # 0 / 0 -> 0
+    assert result[2] == 2.0
+    assert result[3] == 0.0 # NaN tratado como 0
+
+
+def test_safe_ratio_keeps_series_index_and_scalars():
+    series = pd.Series([1.0, 2.0], index=['a', 'b'])
+    assert list(utils.safe_ratio(series, 2.0).index) == ['a', 'b']
+    assert utils.safe_ratio(5.0, 0.0) == 0.0
+
+
+@pytest.mark.parametrize('zero_division', [0.0, np.inf])
+def test_calculate_roi_with_zero_cost(zero_division):
+    roi = utils.calculate_roi(pd.Series([150.0, 100.0, 0.0]), pd.Series([100.0, 0.0, 0.0]), zero_division=zero_division)
+    assert roi.iloc[0] == pytest.approx(50.0)
+    assert roi.iloc[1] == zero_division # Receita sem custo
+    assert roi.iloc[2] == 0.0 # Sem receita e sem custo
+
+
+def test_calculate_roi_with_zero_cost_as_nan():
+    assert np.isnan(utils.calculate_roi(100.0, 0.0, zero_division=np.nan))
@@ -0,0 +1,33 @@
+# tests/test_time_grain.py
+import datetime
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.mark.parametrize('n_days, grain', [
+    (1, 'day'), (62, 'day'), (63, 'week'), (183, 'week'), (184, 'month'), (400, 'month')
+])
+def test_choose_time_grain(n_days, grain):
+    start = datetime.date(2026, 1, 1)
+    assert utils.choose_time_grain(start, start + datetime.timedelta(days=n_days - 1)) == grain
+
+
+def test_bucket_dates():
+    dates = pd.to_datetime(['2026-03-04 15:00', '2026-03-08 00:00', '2026-02-28 09:30'])
+    assert utils.bucket_dates(dates, 'day').tolist() == list(pd.to_datetime(['2026-03-04', '2026-03-08', '2026-02-28']))
+    assert utils.bucket_dates(dates, 'week').tolist() == list(pd.to_datetime(['2026-03-02', '2026-03-02', '2026-02-23']))
+    assert utils.bucket_dates(dates, 'month').tolist() == list(pd.to_datetime(['2026-03-01', '2026-03-01', '2026-02-01']))
+
+
+def test_resample_time_series_sums_each_period():
+    df = pd.DataFrame({
+        'data': pd.to_datetime(['2026-03-02', '2026-03-05', '2026-03-09', '2026-04-01']),
+        'total_receita': [1.0, 2.0, 3.0, 4.0],
+    })
+    df_weekly = utils.resample_time_series(df, 'week', ['total_receita'])
+    assert df_weekly['data'].tolist() == list(pd.to_datetime(['2026-03-02', '2026-03-09', '2026-03-30']))
+    assert df_weekly['total_receita'].tolist() == [3.0, 3.0, 4.0]
+    assert utils.resample_time_series(df, 'month', ['total_receita'])['total_receita'].tolist() == [6.0, 4.0]
@@ -0,0 +1,32 @@
+# tests/test_top_n.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def test_top_n_with_others_sums_the_tail():
+    df = pd.DataFrame({'dominio': ['a', 'b', 'c', 'd'], 'receita': [5.0, 20.0, np.nan, 10.0], 'custo': [1.0, 2.0, 3.0, 4.0]})
+    df_top = utils.top_n_with_others(df, 'dominio', 'receita', 2, sum_cols=['receita', 'custo'])
+
+    assert df_top['dominio'].tolist() == ['b', 'd', 'Outros (2)']
+    assert df_top['receita'].tolist() == [20.0, 10.0, 5.0] # NaN da cauda ignorado na soma
+    assert df_top['custo'].tolist() == [2.0, 4.0, 4.0]
+    assert df['dominio'].tolist() == ['a', 'b', 'c', 'd'] # Entrada intacta
+
+
+@pytest.mark.parametrize('n', [3, 10, None])
+def test_top_n_with_others_without_tail(n):
+    df = pd.DataFrame({'dominio': pd.Categorical(['a', 'b', 'c']), 'receita': [1.0, 3.0, 2.0]})
+    df_top = utils.top_n_with_others(df, 'dominio', 'receita', n)
+
+    assert df_top['dominio'].tolist() == ['b', 'c', 'a']
+    assert not df_top['dominio'].astype(str).str.startswith(utils.OTHERS_LABEL).any()
+
+
+def test_top_n_with_others_categorical_label():
+    df = pd.DataFrame({'Gestor': pd.Categorical(['x', 'y', 'z']), 'receita': [1.0, 2.0, 3.0]})
+    df_top = utils.top_n_with_others(df, 'Gestor', 'receita', 1)
+    assert df_top['Gestor'].tolist() == ['z', 'Outros (2)']
+    assert df_top['receita'].tolist() == [3.0, 3.0]
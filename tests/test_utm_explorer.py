@@ -0,0 +1,40 @@
+# tests/test_utm_explorer.py
+import datetime
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.mark.parametrize('depth', range(len(utils.UTM_TREE_LEVELS)))
+def test_utm_children_loader_sends_every_parameter(monkeypatch, sql_parameters, depth):
+    captured = {}
+
+    def fake_query(query_sql, query_params=()):
+        captured['sql'], captured['params'] = query_sql, query_params
+        return pd.DataFrame()
+
+    monkeypatch.setattr(utils, 'run_bigquery_query', fake_query)
+    utils._load_utm_children_usd.clear()
+    path = tuple(f"nivel{i}" for i in range(depth))
+    utils._load_utm_children_usd(datetime.date(2026, 1, 1), datetime.date(2026, 1, 31), path, ('a.com',), ('1',), utils.ADMANAGER_SOURCES, 10)
+
+    assert f"IFNULL({utils.UTM_TREE_LEVELS[depth]}, 'N/A') AS node" in captured['sql']
+    assert sql_parameters(captured['sql']) == {name for name, _, _ in captured['params']}
+
+
+def test_utm_children_converts_revenue_and_fills_metrics(monkeypatch):
+    df_usd = pd.DataFrame({
+        'node': ['google', 'Outros (3)'], 'is_others': [False, True],
+        **{col: [1.0, None] for col in utils.PERFORMANCE_METRIC_COLUMNS},
+        'total_receita': [10.0, 2.0],
+    })
+    monkeypatch.setattr(utils, '_load_utm_children_usd', lambda *args: df_usd.copy())
+    monkeypatch.setattr(utils, 'get_usd_to_brl_rate', lambda: 5.0)
+
+    df_children = utils.get_utm_children(datetime.date(2026, 1, 1), datetime.date(2026, 1, 31), (), ['a.com'], ['1'], top_n=1)
+
+    assert df_children['total_receita'].tolist() == [50.0, 10.0]
+    assert df_children['total_custo'].tolist() == [1.0, 0.0]
+    assert df_usd['total_receita'].tolist() == [10.0, 2.0] # O frame do cache não é alterado
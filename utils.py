@@ -11,6 +11,18 @@ from google.oauth2 import service_account
 import json
 from streamlit.errors import StreamlitSecretNotFoundError
 import base64 # Necessário para decodificar secrets
+import hashlib
+import random
+import tempfile
+import threading
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try: # Exportação em XLSX (escrita em modo streaming); listado em requirements.txt
+    import openpyxl
+except ImportError:
+    openpyxl = None
 
 # --- IMPORTS PARA GOOGLE SHEETS ---
 import gspread # Necessário para interagir com Google Sheets
@@ -82,6 +94,9 @@ sheets_gc = None # Objeto gspread.Client
 GSHEETS_CREDENTIALS_PATH_LOCAL = 'credentials/chave-de-servico.json' 
 GSHEETS_SPREADSHEET_ID = '1yr4yCLlXAMoMMpyqFpVsZKQ7sfbf7xr3WCJ9BMqYT6k' # ID da sua planilha
 GSHEETS_SPREADSHEET_NAME = 'Controle de BMs e CONTAS de anúncio' # Apenas para mensagens de erro/informativas
+GSHEETS_BM_PREFIX = 'BM ' # Prefixo das abas de BM lidas pelo painel
+GSHEETS_MAX_RETRIES = 5 # Tentativas em erros de cota/instabilidade da API do Sheets
+GSHEETS_RETRYABLE_CODES = (429, 500, 503)
 
 # --- Lógica de Carregamento de Credenciais Google Sheets ---
 
@@ -123,8 +138,35 @@ ADX_DOMAIN_UTMS_TABLE = "`dashboard-474222.ad_manager.adx_domain_with_utms_daily
 CAMPAIGN_INSIGHTS_TABLE = "`dashboard-474222.facebook_ads_data.campaign_insights`"
 
 
+# --- Schema do DataFrame combinado (aplicado uma única vez em load_data_for_period) ---
+# Métricas: float64 sem nulos (0 quando ausente).
+PERFORMANCE_METRIC_COLUMNS = [
+    'total_impressoes', 'total_cliques', 'total_custo', 'total_receita',
+    'total_leads', 'total_mensagens'
+]
+# Dimensões: categóricas sem nulos ('N/A' quando ausente).
+PERFORMANCE_DIMENSION_COLUMNS = [
+    'source', 'pais', 'dominio', 'network_code', 'utm_campaign_norm', 'utm_source', 'utm_medium',
+    'utm_content', 'utm_term', 'utm_id'
+]
+# Valores de 'source' sujeitos aos filtros de domínio/network code
+ADMANAGER_SOURCE = 'Admanager (UTM)'
+ADMANAGER_META_SOURCE = 'Admanager (UTM) & Meta Ads'
+ADMANAGER_SOURCES = (ADMANAGER_SOURCE, ADMANAGER_META_SOURCE)
+
+PERFORMANCE_SCHEMA = {
+    'data': 'datetime64[ns]',
+    **{col: 'float64' for col in PERFORMANCE_METRIC_COLUMNS},
+    **{col: 'category' for col in PERFORMANCE_DIMENSION_COLUMNS},
+}
+
+
 # --- FUNÇÕES AUXILIARES ---
 
+# Troca ',' por '.' e vice-versa em uma única passada (separadores pt-BR)
+_PT_BR_SEPARATORS = str.maketrans({',': '.', '.': ','})
+
+
 @st.cache_data(ttl=datetime.timedelta(hours=24)) # Cache a cotação por 24 horas
 def get_usd_to_brl_rate():
     """
@@ -157,7 +199,7 @@ def format_number(value, currency=False, percentage=False, decimal_places=0, x_s
         return "Inf" + ("%" if percentage else "")
 
     # Formata o valor numérico com casas decimais e separadores brasileiros
-    formatted_value = f"{value:,.{decimal_places}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    formatted_value = f"{value:,.{decimal_places}f}".translate(_PT_BR_SEPARATORS)
     
     if percentage:
         return formatted_value + "%"
@@ -168,6 +210,481 @@ def format_number(value, currency=False, percentage=False, decimal_places=0, x_s
     else:
         return formatted_value
 
+
+def format_number_series(values, currency=False, percentage=False, decimal_places=0, x_suffix=False):
+    """
+    Versão vetorizada de format_number para colunas inteiras (Series ou arrays).
+    Usa as mesmas regras de format_number: separadores pt-BR, 'R$', '%', sufixo 'x',
+    'N/A' para NaN e 'Inf' para infinitos. Retorna uma Series de strings.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    numeric = pd.to_numeric(pd.Series(np.asarray(values), copy=False), errors='coerce').to_numpy(dtype=float)
+
+    result = np.full(numeric.shape, "N/A", dtype=object)
+    result[np.isinf(numeric)] = "Inf" + ("%" if percentage else "")
+
+    finite = np.isfinite(numeric)
+    if finite.any():
+        formatted = pd.Series(numeric[finite]).map(f"{{:,.{decimal_places}f}}".format).str.translate(_PT_BR_SEPARATORS)
+        if percentage:
+            formatted = formatted + "%"
+        elif currency:
+            formatted = "R$ " + formatted
+        elif x_suffix:
+            formatted = formatted + "x"
+        result[finite] = formatted.to_numpy()
+
+    return pd.Series(result, index=index, dtype=object)
+
+
+def format_table_numbers(df, column_formats):
+    """
+    Styler de df com o texto de exibição das colunas de column_formats ({coluna: opções de
+    format_number}) no padrão pt-BR (R$ 1.234,56). Os valores do frame seguem numéricos:
+    o st.dataframe ordena pelos números e mostra o texto do Styler.
+    df pode ser um Styler só com CSS (style_table); nele o formato é aplicado por cima.
+    """
+    styler = df.style if isinstance(df, pd.DataFrame) else df
+    for col, options in column_formats.items():
+        if col in styler.data.columns:
+            styler.format(lambda value, options=options: format_number(value, **options), subset=[col])
+    return styler
+
+
+def render_number_table(df, column_formats, **dataframe_kwargs):
+    """
+    Exibe df com st.dataframe: números crus (ordenáveis e exportáveis) com o texto pt-BR
+    de format_number como exibição (format_table_numbers).
+    O column_config recebido não deve dar formato às colunas de column_formats: o formato
+    do widget prevaleceria sobre o texto do Styler.
+    """
+    return st.dataframe(format_table_numbers(df, column_formats), **dataframe_kwargs)
+
+
+# --- CODIFICAÇÃO DE CORES DAS TABELAS (faixas por quantis, CSS montado de uma vez) ---
+HEATMAP_PALETTE = ['#ffffe5', '#f7fcb9', '#d9f0a3', '#addd8e', '#78c679', '#41ab5d', '#238443', '#005a32'] # YlGn em 8 faixas
+HEATMAP_DARK_BINS = 3 # As faixas mais escuras recebem texto branco
+HEATMAP_MAX_STYLED_ROWS = 500 # Linhas além deste limite ficam só com a formatação nativa
+_HEATMAP_CSS = np.array(
+    [
+        f"background-color: {color}; color: {'white' if i >= len(HEATMAP_PALETTE) - HEATMAP_DARK_BINS else 'black'}"
+        for i, color in enumerate(HEATMAP_PALETTE)
+    ] + [''], # Última posição: valores não finitos, sem cor
+    dtype=object
+)
+
+
+def heatmap_bin_edges(values, n_bins=len(HEATMAP_PALETTE)):
+    """
+    Limites das faixas de cor de uma coluna, por quantis (NumPy) dos valores finitos.
+    Retorna None se a coluna não tiver variação (nada a colorir).
+    """
+    values = np.asarray(values, dtype='float64')
+    finite_values = values[np.isfinite(values)]
+    if finite_values.size == 0 or finite_values.min() == finite_values.max():
+        return None
+    return np.unique(np.quantile(finite_values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+
+
+def heatmap_css(values, edges):
+    """CSS de fundo de cada valor (ndarray de strings) segundo as faixas de heatmap_bin_edges."""
+    values = np.asarray(values, dtype='float64')
+    bins = np.searchsorted(edges, values, side='left')
+    # Com quantis repetidos sobram menos faixas: espalha pela paleta inteira
+    palette_idx = bins * (len(HEATMAP_PALETTE) - 1) // max(len(edges), 1)
+    return _HEATMAP_CSS[np.where(np.isfinite(values), palette_idx, len(HEATMAP_PALETTE))]
+
+
+def sign_color_css(values, positive='color: green', negative='color: red'):
+    """CSS por sinal (positivo/negativo) de cada valor; zero e valores não finitos ficam sem cor."""
+    values = np.asarray(values, dtype='float64')
+    finite = np.isfinite(values)
+    return np.where(finite & (values > 0), positive, np.where(finite & (values < 0), negative, ''))
+
+
+def build_table_styles(df, heatmap_edges=None, column_css=None, row_css=None, max_rows=HEATMAP_MAX_STYLED_ROWS):
+    """
+    Monta o DataFrame de CSS da tabela inteira de uma vez, para Styler.apply(..., axis=None).
+    heatmap_edges: {coluna: limites de heatmap_bin_edges}; column_css: {coluna: CSS fixo ou um por linha};
+    row_css: {posição da linha: CSS} somado ao das células (ex.: linha de total).
+    Só as primeiras max_rows linhas recebem heatmap/CSS de coluna.
+    """
+    styles = np.full(df.shape, '', dtype=object)
+    n_styled = min(len(df), max_rows)
+    column_positions = {col: i for i, col in enumerate(df.columns)}
+
+    for col, edges in (heatmap_edges or {}).items():
+        if edges is not None and col in column_positions:
+            styles[:n_styled, column_positions[col]] = heatmap_css(df[col].to_numpy()[:n_styled], edges)
+    for col, css in (column_css or {}).items():
+        if col in column_positions:
+            styles[:n_styled, column_positions[col]] = np.broadcast_to(np.asarray(css, dtype=object), (len(df),))[:n_styled]
+    for position, css in (row_css or {}).items():
+        styles[position, :] = [f"{css} {cell}".strip() for cell in styles[position, :]]
+
+    return pd.DataFrame(styles, index=df.index, columns=df.columns)
+
+
+def style_table(df, **style_options):
+    """Styler de df com o CSS de build_table_styles aplicado numa única chamada vetorizada."""
+    table_styles = build_table_styles(df, **style_options)
+    return df.style.apply(lambda _: table_styles, axis=None)
+
+
+# --- TABELA PAGINADA NO SERVIDOR (filtra, ordena e envia só a página visível) ---
+TABLE_PAGE_SIZE_OPTIONS = [50, 100, 250, 500]
+
+
+def _text_filter_mask(df, columns, query):
+    """
+    Máscara das linhas em que alguma das colunas contém query (sem diferenciar maiúsculas).
+    Em colunas categóricas o teste roda uma vez por categoria e é expandido pelos códigos.
+    """
+    mask = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            category_matches = np.append(
+                series.cat.categories.astype(str).str.contains(query, case=False, regex=False), False
+            )
+            mask |= category_matches[series.cat.codes.to_numpy()] # Código -1 (nulo) cai no False final
+        else:
+            mask |= series.astype(str).str.contains(query, case=False, regex=False).to_numpy()
+    return mask
+
+
+def _table_row_order(df, sort_column, ascending, filter_columns, query):
+    """Posições (iloc) das linhas que passam no filtro, na ordem pedida."""
+    positions = np.arange(len(df))
+    if query:
+        positions = positions[_text_filter_mask(df, filter_columns, query)]
+    if sort_column:
+        values = df[sort_column].iloc[positions].reset_index(drop=True)
+        positions = positions[values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()]
+    return positions
+
+
+def render_paginated_table(df, column_formats, key, data_version=None, totals_row=None, default_sort=None, default_ascending=False, heatmap_columns=(), **dataframe_kwargs):
+    """
+    Exibe df como tabela paginada no servidor: filtro de texto, ordenação e paginação
+    acontecem aqui e só a página visível é enviada ao navegador.
+    column_formats: {coluna: opções de format_number} (ver render_number_table).
+    key: prefixo das chaves dos widgets/estado da tabela (único por página).
+    data_version: identifica o conteúdo de df (ex.: período e filtros); enquanto não mudar,
+    a ordem calculada é reaproveitada entre reruns mesmo que df seja um novo objeto.
+    totals_row: DataFrame de uma linha com os totais (calculados à parte), exibido abaixo.
+    heatmap_columns: colunas numéricas coloridas na página com as faixas (quantis) da tabela inteira.
+    """
+    columns = list(df.columns)
+    filter_columns = [
+        col for col in columns
+        if not pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_datetime64_any_dtype(df[col])
+    ]
+
+    col_filter, col_sort, col_order, col_size = st.columns([3, 2, 1, 1])
+    with col_filter:
+        query = st.text_input("Filtrar", key=f"{key}_filter", placeholder="Buscar em " + ", ".join(filter_columns))
+    with col_sort:
+        sort_column = st.selectbox(
+            "Ordenar por", columns,
+            index=columns.index(default_sort) if default_sort in columns else 0,
+            key=f"{key}_sort"
+        )
+    with col_order:
+        ascending = st.toggle("Crescente", value=default_ascending, key=f"{key}_ascending")
+    with col_size:
+        page_size = st.selectbox("Linhas", TABLE_PAGE_SIZE_OPTIONS, index=1, key=f"{key}_page_size")
+
+    # Ordem das linhas e faixas do heatmap guardadas na sessão: trocar de página não refaz nada
+    data_token = (data_version if data_version is not None else id(df), len(df))
+    cached_order = st.session_state.get(f"{key}_order")
+    if cached_order is None or cached_order[0] != (data_token, sort_column, ascending, query):
+        cached_order = ((data_token, sort_column, ascending, query), _table_row_order(df, sort_column, ascending, filter_columns, query))
+        st.session_state[f"{key}_order"] = cached_order
+        st.session_state[f"{key}_page"] = 1 # Nova ordem (dados, ordenação ou filtro): volta ao início
+    order = cached_order[1]
+    if st.session_state.get(f"{key}_last_page_size") != page_size:
+        st.session_state[f"{key}_last_page_size"] = page_size
+        st.session_state[f"{key}_page"] = 1
+
+    cached_edges = st.session_state.get(f"{key}_heatmap_edges")
+    if cached_edges is None or cached_edges[0] != data_token:
+        cached_edges = (data_token, {col: heatmap_bin_edges(df[col]) for col in heatmap_columns})
+        st.session_state[f"{key}_heatmap_edges"] = cached_edges
+    heatmap_edges = cached_edges[1]
+
+    n_pages = max(1, -(-len(order) // page_size))
+    # A página vive só no session_state (sem value= no widget): a página ajustada vale já no primeiro render
+    st.session_state[f"{key}_page"] = min(st.session_state.get(f"{key}_page", 1), n_pages)
+    page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")
+
+    df_page = df.iloc[order[(page - 1) * page_size: page * page_size]]
+    # Cores só na página visível, com as faixas (quantis) da tabela inteira
+    page_view = style_table(df_page, heatmap_edges=heatmap_edges) if heatmap_columns else df_page
+
+    render_number_table(page_view, column_formats, **dataframe_kwargs)
+    st.caption(f"{len(order):,} linhas · página {page} de {n_pages}".replace(',', '.'))
+
+    if totals_row is not None:
+        render_number_table(totals_row, column_formats, hide_index=True, width='stretch')
+
+
+# --- EXPORTAÇÃO DAS TABELAS (dados crus em blocos: sem Styler nem colunas formatadas) ---
+EXPORT_CHUNK_ROWS = 50_000 # Linhas por bloco escrito no arquivo
+XLSX_MAX_ROWS = 1_048_575 # Limite de linhas de uma planilha do Excel (sem o cabeçalho)
+EXPORT_TMP_DIR = os.path.join(tempfile.gettempdir(), 'dashboard_exports') # Arquivos gerados (só o caminho vai para a sessão)
+EXPORT_FILE_MAX_AGE = 3600 # Segundos até um arquivo de exportação abandonado ser apagado
+EXPORT_FORMATS = {
+    'csv': {'label': 'CSV', 'mime': 'text/csv'},
+    'parquet': {'label': 'Parquet', 'mime': 'application/vnd.apache.parquet'},
+    'xlsx': {'label': 'Excel (XLSX)', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+}
+
+
+def available_export_formats():
+    """Formatos de exportação disponíveis (XLSX só com o openpyxl instalado)."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'xlsx' or openpyxl is not None]
+
+
+def iter_frame_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Fatias consecutivas de df com até chunk_rows linhas (views, sem copiar o frame)."""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _xlsx_cell(value):
+    """Converte um valor do pandas/numpy para uma célula aceita pelo Excel."""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+def write_export_file(chunks, export_format, file_obj):
+    """
+    Escreve os blocos (DataFrames com as mesmas colunas) em file_obj (binário) no formato
+    pedido, um bloco por vez: a memória usada é a de um bloco, não a do arquivo inteiro.
+    Retorna o número de linhas escritas.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {export_format!r}. Use um de {list(EXPORT_FORMATS)}.")
+
+    n_rows = 0
+    if export_format == 'csv':
+        # utf-8-sig: o Excel reconhece a acentuação ao abrir o CSV
+        file_obj.write('\ufeff'.encode('utf-8'))
+        for chunk in chunks:
+            file_obj.write(chunk.to_csv(index=False, header=(n_rows == 0)).encode('utf-8'))
+            n_rows += len(chunk)
+
+    elif export_format == 'parquet':
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(file_obj, table.schema)
+                else:
+                    table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+                writer.write_table(table) # Um row group por bloco
+                n_rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    else:
+        if openpyxl is None:
+            raise RuntimeError("Exportação em XLSX requer o pacote openpyxl.")
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("dados")
+        header_written = False
+        for chunk in chunks:
+            if not header_written:
+                sheet.append([str(col) for col in chunk.columns])
+                header_written = True
+            for row in chunk.itertuples(index=False, name=None):
+                if n_rows >= XLSX_MAX_ROWS:
+                    break
+                sheet.append([_xlsx_cell(value) for value in row])
+                n_rows += 1
+            if n_rows >= XLSX_MAX_ROWS:
+                break # Limite do Excel: não lê os blocos restantes
+        workbook.save(file_obj)
+
+    return n_rows
+
+
+def _discard_export_file(path):
+    """Remove um arquivo de exportação gerado anteriormente (se ainda existir)."""
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _sweep_export_files(max_age_seconds=EXPORT_FILE_MAX_AGE):
+    """Apaga arquivos de exportação antigos deixados por sessões encerradas."""
+    if not os.path.isdir(EXPORT_TMP_DIR):
+        return
+    cutoff = time.time() - max_age_seconds
+    for name in os.listdir(EXPORT_TMP_DIR):
+        path = os.path.join(EXPORT_TMP_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def render_export_controls(data, file_stem, key, data_version=None):
+    """
+    Botão de exportação (dados crus, sem formatação) em CSV, Parquet ou XLSX.
+    data: função sem argumentos que devolve os blocos (DataFrames) do arquivo a partir do
+    loader/cubo do período, ou um DataFrame pequeno já em cache (tabelas agregadas).
+    A função só é chamada ao clicar em "Gerar arquivo"; os blocos são escritos um a um num
+    arquivo temporário em disco. A sessão guarda só o caminho do arquivo (nunca os bytes)
+    e o botão de download recebe o arquivo aberto.
+    """
+    export_state_key = f"{key}_export"
+    formats = available_export_formats()
+
+    with st.popover("⬇️ Exportar"):
+        export_format = st.radio(
+            "Formato", formats,
+            format_func=lambda fmt: EXPORT_FORMATS[fmt]['label'],
+            horizontal=True,
+            key=f"{key}_export_format"
+        )
+        if 'xlsx' not in formats:
+            st.caption("Exportação em XLSX indisponível: instale o pacote openpyxl.")
+
+        export_token = (data_version if data_version is not None else id(data), export_format)
+        if st.button("Gerar arquivo", key=f"{key}_export_build"):
+            previous = st.session_state.pop(export_state_key, None)
+            _discard_export_file(previous[1] if previous else None)
+            _sweep_export_files()
+            os.makedirs(EXPORT_TMP_DIR, exist_ok=True)
+
+            chunks = data() if callable(data) else iter_frame_chunks(data)
+            with st.spinner("Gerando arquivo..."):
+                with tempfile.NamedTemporaryFile(dir=EXPORT_TMP_DIR, suffix=f".{export_format}", delete=False) as export_file:
+                    n_rows = write_export_file(chunks, export_format, export_file)
+            st.session_state[export_state_key] = (export_token, export_file.name)
+            if export_format == 'xlsx' and n_rows >= XLSX_MAX_ROWS:
+                st.warning(f"O Excel aceita até {XLSX_MAX_ROWS:,} linhas por planilha; use CSV ou Parquet para o recorte completo.".replace(',', '.'))
+
+        exported = st.session_state.get(export_state_key)
+        if exported is not None and exported[0] == export_token and os.path.exists(exported[1]):
+            with open(exported[1], 'rb') as export_file:
+                st.download_button(
+                    f"Baixar {EXPORT_FORMATS[export_format]['label']}",
+                    data=export_file,
+                    file_name=f"{file_stem}.{export_format}",
+                    mime=EXPORT_FORMATS[export_format]['mime'],
+                    on_click='ignore',
+                    key=f"{key}_export_download"
+                )
+
+
+# --- TOP-N COM 'OUTROS' (tabelas e gráficos pequenos, qualquer que seja a cauda) ---
+OTHERS_LABEL = 'Outros'
+TOP_N_OPTIONS = [10, 20, 50, None] # None = todos
+
+
+def top_n_selector(key, label="Exibir", default=20):
+    """Selectbox do N das tabelas/gráficos com 'Outros' (None = todas as linhas)."""
+    return st.selectbox(
+        label, TOP_N_OPTIONS,
+        index=TOP_N_OPTIONS.index(default),
+        format_func=lambda n: "Todos" if n is None else f"Top {n}",
+        key=key
+    )
+
+
+def top_n_with_others(df, label_col, value_col, n, sum_cols=None, others_label=OTHERS_LABEL):
+    """
+    As n linhas de maior value_col, em ordem decrescente, mais uma linha '<others_label> (k)'
+    com a soma de sum_cols (padrão: value_col) das k linhas restantes.
+    A seleção é parcial (np.argpartition, linear no tamanho de df): só as n escolhidas são ordenadas.
+    Colunas fora de sum_cols ficam nulas na linha 'Outros'; razões (ROI, ROAS, ...) devem ser
+    recalculadas sobre as somas. Com n None ou df sem cauda, retorna só as linhas ordenadas.
+    Retorna sempre um frame novo.
+    """
+    if n is None or len(df) <= n:
+        return df.sort_values(value_col, ascending=False, kind='stable', na_position='last').reset_index(drop=True)
+
+    values = np.nan_to_num(df[value_col].to_numpy(dtype='float64'), nan=-np.inf)
+    top_positions = np.argpartition(-values, n - 1)[:n]
+    top_positions = top_positions[np.argsort(-values[top_positions], kind='stable')]
+    is_tail = np.ones(len(df), dtype=bool)
+    is_tail[top_positions] = False
+
+    # Linha extra (nula) ao fim das n escolhidas, preenchida com as somas da cauda
+    df_top = df.iloc[top_positions].reset_index(drop=True).reindex(range(n + 1))
+    df_top[label_col] = df_top[label_col].astype(object) # Categórica não aceita o rótulo novo
+    df_top.loc[n, label_col] = f"{others_label} ({int(is_tail.sum())})"
+    for col, total in df.loc[is_tail, list(sum_cols or [value_col])].sum().items(): # Soma ignora nulos
+        df_top.loc[n, col] = total
+    return df_top
+
+
+def _wrap_like_input(result, *inputs):
+    """
+    Devolve o resultado no mesmo "formato" das entradas: Series (com o índice
+    da primeira Series recebida), float para escalares ou ndarray nos demais casos.
+    """
+    for value in inputs:
+        if isinstance(value, pd.Series):
+            return pd.Series(result, index=value.index)
+    if result.ndim == 0:
+        return float(result)
+    return result
+
+
+def safe_ratio(numerator, denominator, scale=1.0, zero_division=0.0):
+    """
+    Divide numerator por denominator (Series, arrays ou escalares) de forma vetorizada.
+    Regras de divisão por zero:
+      - 0 / 0 resulta em 0;
+      - x / 0 (x != 0) resulta em zero_division (ex.: 0, np.nan ou np.inf).
+    NaNs nas entradas são tratados como 0, como nos fillna(0) das páginas.
+    """
+    num = np.nan_to_num(np.asarray(numerator, dtype=float), nan=0.0)
+    den = np.nan_to_num(np.asarray(denominator, dtype=float), nan=0.0)
+    num, den = np.broadcast_arrays(num, den)
+
+    has_denominator = den != 0
+    result = np.full(num.shape, zero_division, dtype=float)
+    np.divide(num, den, out=result, where=has_denominator)
+    result = np.where(has_denominator, result * scale, result)
+    result = np.where(~has_denominator & (num == 0), 0.0, result)
+    return _wrap_like_input(result, numerator, denominator)
+
+
+def calculate_roi(revenue, cost, zero_division=np.nan):
+    """
+    ROI percentual ((receita - custo) / custo * 100) vetorizado.
+    Custo zero com receita zero resulta em 0; custo zero com receita resulta em zero_division.
+    """
+    revenue_arr = np.nan_to_num(np.asarray(revenue, dtype=float), nan=0.0)
+    cost_arr = np.nan_to_num(np.asarray(cost, dtype=float), nan=0.0)
+    result = safe_ratio(revenue_arr - cost_arr, cost_arr, scale=100.0, zero_division=zero_division)
+    return _wrap_like_input(np.asarray(result), revenue, cost)
+
+
+def calculate_roas(revenue, cost, zero_division=np.nan):
+    """
+    ROAS (receita / custo) vetorizado, com as mesmas regras de divisão por zero do ROI.
+    """
+    return safe_ratio(revenue, cost, zero_division=zero_division)
+
+
 def calculate_percentage_delta(current_value, previous_value):
     """
     Calcula a variação percentual entre o valor atual e o anterior.
@@ -186,23 +703,74 @@ def calculate_percentage_delta(current_value, previous_value):
     return delta
 
 
-def calculate_business_metrics(df, default_taxa_adwork_percent=TAXA_ADWORK_PERCENT):
+def conforms_to_performance_schema(df):
     """
-    Calcula todas as métricas de negócio e mídia a partir de um DataFrame.
-    MODIFICAÇÃO: 'total_leads' agora é a soma de leads e mensagens.
+    Verifica (apenas pelos dtypes, sem percorrer os dados) se df já segue o PERFORMANCE_SCHEMA.
+    Colunas extras são ignoradas.
     """
-    numeric_cols_to_fill = [
-        'total_impressoes', 'total_cliques', 'total_custo',
-        'total_receita', 'total_leads', 'total_mensagens'
-    ]
+    for col, dtype in PERFORMANCE_SCHEMA.items():
+        if col not in df.columns:
+            return False
+        if dtype == 'category':
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                return False
+        elif df[col].dtype != np.dtype(dtype):
+            return False
+    return True
+
 
-    df_processed = df.copy()
+def apply_performance_schema(df):
+    """
+    Converte df para o PERFORMANCE_SCHEMA: cria colunas ausentes, converte 'data' para datetime,
+    métricas para float64 (nulos -> 0) e dimensões para category (nulos -> 'N/A').
+    Colunas fora do schema são mantidas como estão.
+    """
+    df_typed = df.copy()
+
+    if 'data' in df_typed.columns:
+        df_typed['data'] = pd.to_datetime(df_typed['data'])
+    else:
+        df_typed['data'] = pd.Series(index=df_typed.index, dtype='datetime64[ns]')
 
-    for col in numeric_cols_to_fill:
-        if col in df_processed.columns:
-            df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce').fillna(0)
+    for col in PERFORMANCE_METRIC_COLUMNS:
+        if col in df_typed.columns:
+            df_typed[col] = pd.to_numeric(df_typed[col], errors='coerce').fillna(0).astype('float64')
         else:
-            df_processed[col] = 0.0
+            df_typed[col] = 0.0
+
+    for col in PERFORMANCE_DIMENSION_COLUMNS:
+        if col in df_typed.columns:
+            df_typed[col] = df_typed[col].astype(object).where(df_typed[col].notna(), 'N/A').astype(str).astype('category')
+        else:
+            df_typed[col] = pd.Categorical(['N/A'] * len(df_typed))
+
+    return df_typed
+
+
+def ensure_performance_schema(df):
+    """
+    Retorna df sem cópia quando ele já segue o schema; caso contrário aplica o schema.
+    """
+    if conforms_to_performance_schema(df):
+        return df
+    return apply_performance_schema(df)
+
+
+def calculate_business_metrics(df, default_taxa_adwork_percent=TAXA_ADWORK_PERCENT):
+    """
+    Calcula todas as métricas de negócio e mídia a partir de um DataFrame.
+    MODIFICAÇÃO: 'total_leads' agora é a soma de leads e mensagens.
+    Frames vindos de load_data_for_period já seguem o schema e não são copiados.
+    """
+    df_processed = df
+    missing_metrics = [col for col in PERFORMANCE_METRIC_COLUMNS if col not in df_processed.columns]
+    if missing_metrics or any(df_processed[col].dtype != np.float64 for col in PERFORMANCE_METRIC_COLUMNS if col in df_processed.columns):
+        df_processed = df_processed.copy()
+        for col in PERFORMANCE_METRIC_COLUMNS:
+            if col in df_processed.columns:
+                df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce').fillna(0)
+            else:
+                df_processed[col] = 0.0
 
     total_impressoes = df_processed['total_impressoes'].sum()
     total_cliques = df_processed['total_cliques'].sum()
@@ -220,21 +788,16 @@ def calculate_business_metrics(df, default_taxa_adwork_percent=TAXA_ADWORK_PERCE
     custo_taxa_adwork = total_receita * default_taxa_adwork_percent
     lucro_liquido = total_receita - total_custo - custo_taxa_adwork
 
-    roi = 0.0
-    roas = 0.0
-    if total_custo != 0:
-        roi = ((total_receita - total_custo) / total_custo) * 100
-        roas = (total_receita / total_custo)
-    elif total_receita > 0: # Custo zero, mas receita positiva, ROAS/ROI é indefinido
-        roi = np.nan
-        roas = np.nan
-        
-    cpm = (total_custo / total_impressoes * 1000) if total_impressoes != 0 else 0
-    cpc = (total_custo / total_cliques) if total_cliques != 0 else 0
-    ctr = (total_cliques / total_impressoes * 100) if total_impressoes != 0 else 0
+    # Custo zero com receita positiva: ROI/ROAS indefinidos (NaN)
+    roi = calculate_roi(total_receita, total_custo, zero_division=np.nan)
+    roas = calculate_roas(total_receita, total_custo, zero_division=np.nan)
+
+    cpm = safe_ratio(total_custo, total_impressoes, scale=1000)
+    cpc = safe_ratio(total_custo, total_cliques)
+    ctr = safe_ratio(total_cliques, total_impressoes, scale=100)
     
     # MODIFICAÇÃO AQUI: CPL usa a nova métrica combinada
-    cpl = (total_custo / total_leads_combined) if total_leads_combined != 0 else 0
+    cpl = safe_ratio(total_custo, total_leads_combined)
 
     return {
         'total_impressoes': total_impressoes,
@@ -254,13 +817,29 @@ def calculate_business_metrics(df, default_taxa_adwork_percent=TAXA_ADWORK_PERCE
     }
 
 # --- Função para Carregar Dados do BigQuery (Generalizada) ---
-@st.cache_data(ttl=3600)
-def get_data_from_bigquery(query_sql):
+def build_query_parameters(query_params):
     """
-    Executa uma consulta SQL no BigQuery e retorna os resultados em um DataFrame Pandas.
+    Converte tuplas (nome, tipo, valor) nos parâmetros de consulta do BigQuery.
+    Tipos 'ARRAY<T>' viram ArrayQueryParameter; os demais, ScalarQueryParameter.
+    As tuplas (e não os objetos do BigQuery) são o que entra na chave do cache.
+    """
+    parameters = []
+    for name, param_type, value in query_params:
+        if param_type.startswith('ARRAY<') and param_type.endswith('>'):
+            parameters.append(bigquery.ArrayQueryParameter(name, param_type[6:-1], list(value)))
+        else:
+            parameters.append(bigquery.ScalarQueryParameter(name, param_type, value))
+    return parameters
+
+
+def run_bigquery_query(query_sql, query_params=()):
+    """
+    Executa uma consulta SQL (opcionalmente parametrizada) no BigQuery, sem cache.
+    Retorna o DataFrame do resultado ou um DataFrame vazio em caso de erro.
     """
     try:
-        query_job = client.query(query_sql)
+        job_config = bigquery.QueryJobConfig(query_parameters=build_query_parameters(query_params)) if query_params else None
+        query_job = client.query(query_sql, job_config=job_config)
         with st.spinner("Carregando dados do BigQuery..."): # Mantém spinner para esta operação
             df = query_job.to_dataframe()
             if 'data' in df.columns:
@@ -273,18 +852,23 @@ def get_data_from_bigquery(query_sql):
 
 
 @st.cache_data(ttl=3600)
-def load_data_for_period(start_date, end_date):
+def get_data_from_bigquery(query_sql, query_params=()):
     """
-    Carrega dados do BigQuery para o período especificado, unindo dados de Admanager
-    e insights de campanha (Meta Ads) via FULL OUTER JOIN.
-    Assume que revenue da tabela adx_domain_utms_daily está em USD e spend da campaign_insights está em BRL.
-    Converte receita do Admanager de USD para BRL.
-    Retorna o DataFrame completo.
+    Executa uma consulta SQL no BigQuery e retorna os resultados em um DataFrame Pandas.
+    query_params: tupla de (nome, tipo, valor) para consultas parametrizadas (@nome no SQL).
+    """
+    return run_bigquery_query(query_sql, query_params)
+
+
+def build_combined_performance_sql(start_date, end_date):
+    """
+    SQL da base combinada (Admanager + Meta Ads via FULL OUTER JOIN) no grão de UTM.
+    Usada por load_data_for_period e como CTE das consultas agregadas no servidor.
     """
     start_date_str = start_date.strftime('%Y-%m-%d')
     end_date_str = end_date.strftime('%Y-%m-%d')
 
-    query_combined = f"""
+    return f"""
     WITH AdX_Formatted AS (
         SELECT
             FORMAT_DATE('%Y-%m-%d', adx.date) AS data,
@@ -354,78 +938,380 @@ def load_data_for_period(start_date, end_date):
     ON
         adx.data = ci.data AND adx.utm_campaign_norm = ci.campaign_name_norm
     """
-    
+
+
+def convert_revenue_to_brl(df):
+    """
+    Converte in-place a receita do Admanager (total_receita) de USD para BRL.
+    Use só em frames novos (recém-consultados), nunca em frames compartilhados do cache.
+    """
+    if df.empty:
+        return df
+    usd_to_brl_rate = get_usd_to_brl_rate()
+    if usd_to_brl_rate and usd_to_brl_rate != 0:
+        df['total_receita'] *= usd_to_brl_rate
+    else:
+        st.warning("Não foi possível obter a taxa de câmbio USD-BRL. A receita Admanager pode não estar convertida corretamente para BRL.")
+    return df
+
+
+def freeze_frame(df):
+    """
+    Marca os arrays de df como somente leitura e retorna df: escritas in-place
+    (.loc[...] = ..., inplace=True) sobre ele e sobre suas cópias rasas levantam ValueError.
+    Usada nos frames que o cache_resource compartilha entre sessões.
+    """
+    for values in df._mgr.arrays: # Blocos: ndarray ou array de extensão (categórica, datas) sobre um ndarray
+        np.asarray(getattr(values, '_ndarray', values)).setflags(write=False)
+    return df
+
+
+@st.cache_resource(ttl=3600)
+def _load_period_frame(start_date, end_date):
+    """Frame do período (ver load_data_for_period), consultado uma vez e compartilhado entre sessões."""
+    query_combined = build_combined_performance_sql(start_date, end_date)
+
     df_combined = get_data_from_bigquery(query_combined)
 
-    if not df_combined.empty:
-        # Converter a receita do Admanager de USD para BRL
-        usd_to_brl_rate = get_usd_to_brl_rate()
-        if usd_to_brl_rate and usd_to_brl_rate != 0:
-            df_combined['total_receita'] = pd.to_numeric(df_combined['total_receita'], errors='coerce').fillna(0)
-            df_combined['total_receita'] *= usd_to_brl_rate
-        else:
-            st.warning("Não foi possível obter a taxa de câmbio USD-BRL. A receita Admanager pode não estar convertida corretamente para BRL.")
-            
-    # --- Conversões finais de tipos de dados e tratamento de NaNs ---
-    numeric_cols = [
-        'total_impressoes', 'total_cliques', 'total_custo', 'total_receita',
-        'total_leads', 'total_mensagens'
-    ]
-    for col in numeric_cols:
-        df_combined[col] = pd.to_numeric(df_combined[col], errors='coerce').fillna(0)
+    # --- Conversões de tipos e tratamento de NaNs: feitos UMA vez aqui, via schema ---
+    df_combined = apply_performance_schema(df_combined)
 
-    string_cols = [
-        'source', 'pais', 'dominio', 'network_code', 'utm_campaign_norm', 'utm_source', 'utm_medium', 
-        'utm_content', 'utm_term', 'utm_id'
-    ]
-    for col in string_cols:
-        if col not in df_combined.columns:
-            df_combined[col] = 'N/A'
-        df_combined[col] = df_combined[col].fillna('N/A').astype(str)
+    # Converter a receita do Admanager de USD para BRL (o frame do schema é novo, ainda não compartilhado)
+    return freeze_frame(convert_revenue_to_brl(df_combined))
+
+
+def load_data_for_period(start_date, end_date):
+    """
+    Carrega dados do BigQuery para o período especificado, unindo dados de Admanager
+    e insights de campanha (Meta Ads) via FULL OUTER JOIN.
+    Assume que revenue da tabela adx_domain_utms_daily está em USD e spend da campaign_insights está em BRL.
+    Converte receita do Admanager de USD para BRL.
+    Retorna o DataFrame completo.
+    Os dados são compartilhados entre sessões (cache_resource, sem cópia por rerun): cada chamada
+    recebe uma cópia rasa, em que atribuir ou remover colunas não afeta o cache, sobre arrays
+    somente leitura (freeze_frame), em que escritas in-place levantam ValueError.
+    """
+    return _load_period_frame(start_date, end_date).copy(deep=False)
+
+
+def build_admanager_filter_mask(df, selected_domains, selected_network_codes, admanager_sources=ADMANAGER_SOURCES):
+    """
+    Monta a máscara booleana (ndarray) dos filtros de domínio e network code.
+    Linhas de admanager_sources só são mantidas se domínio E network code estiverem selecionados;
+    linhas das demais fontes (ex.: Meta Ads) são sempre mantidas.
+    """
+    is_admanager = df['source'].isin(admanager_sources).to_numpy()
+    is_selected = (
+        df['dominio'].isin(selected_domains).to_numpy()
+        & df['network_code'].isin(selected_network_codes).to_numpy()
+    )
+    return ~is_admanager | is_selected
+
+
+# Dimensões indexadas para os filtros das páginas
+INDEXED_DIMENSIONS = ['source', 'dominio', 'network_code', 'pais']
+
+
+class DimensionIndex:
+    """
+    Índice das dimensões categóricas de um frame do schema, construído uma vez por período.
+    Para cada dimensão guarda os valores ordenados e, para cada valor, as posições das linhas
+    (posições agrupadas por valor + offsets), de modo que filtrar custe o tamanho da seleção
+    e não o tamanho do frame.
+    """
+
+    def __init__(self, df, dimensions=INDEXED_DIMENSIONS):
+        df = ensure_performance_schema(df)
+        self.n_rows = len(df)
+        self._values = {}
+        self._code_by_value = {}
+        self._codes = {}
+        self._positions = {}
+        self._offsets = {}
+        self._options_cache = {}
+
+        for dim in dimensions:
+            categorical = df[dim].cat
+            categories = np.asarray(categorical.categories, dtype=object)
+            codes = categorical.codes.to_numpy()
+
+            # Recodifica para a ordem alfabética dos valores (opções já saem ordenadas)
+            order = np.argsort(categories.astype(str), kind='stable')
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            sorted_codes = rank[codes].astype(np.int32)
+
+            counts = np.bincount(sorted_codes, minlength=len(categories))
+            self._values[dim] = categories[order]
+            self._code_by_value[dim] = {value: code for code, value in enumerate(categories[order])}
+            self._codes[dim] = sorted_codes
+            self._positions[dim] = np.argsort(sorted_codes, kind='stable')
+            self._offsets[dim] = np.concatenate([[0], np.cumsum(counts)])
+
+    def values(self, dim):
+        """Valores presentes na dimensão, em ordem alfabética."""
+        offsets = self._offsets[dim]
+        present = offsets[1:] > offsets[:-1]
+        return self._values[dim][present].tolist()
+
+    def rows(self, dim, values):
+        """Posições (ordenadas) das linhas cujo valor de dim está em values."""
+        offsets = self._offsets[dim]
+        positions = self._positions[dim]
+        chunks = []
+        for value in values:
+            code = self._code_by_value[dim].get(value)
+            if code is not None and offsets[code + 1] > offsets[code]:
+                chunks.append(positions[offsets[code]:offsets[code + 1]])
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(chunks))
+
+    def options(self, dim, source_values):
+        """
+        Valores de dim presentes nas linhas das fontes em source_values (opções dos filtros).
+        Calculado uma vez por combinação e reaproveitado nos reruns.
+        """
+        key = (dim, tuple(source_values))
+        if key not in self._options_cache:
+            source_rows = self.rows('source', source_values)
+            present_codes = np.unique(self._codes[dim][source_rows])
+            self._options_cache[key] = tuple(self._values[dim][present_codes].tolist())
+        return list(self._options_cache[key])
+
+    def admanager_filter_mask(self, selected_domains, selected_network_codes, admanager_sources=ADMANAGER_SOURCES):
+        """
+        Mesma regra de build_admanager_filter_mask, combinando as listas de posições do índice.
+        """
+        keep = np.ones(self.n_rows, dtype=bool)
+        keep[self.rows('source', admanager_sources)] = False
+
+        in_domains = np.zeros(self.n_rows, dtype=bool)
+        in_domains[self.rows('dominio', selected_domains)] = True
+        network_rows = self.rows('network_code', selected_network_codes)
+        keep[network_rows[in_domains[network_rows]]] = True
+        return keep
+
+
+@st.cache_resource(ttl=3600)
+def get_dimension_index(start_date, end_date):
+    """
+    Índice de dimensões (DimensionIndex) do frame de load_data_for_period para o período.
+    Construído uma vez por período e compartilhado entre sessões.
+    """
+    return DimensionIndex(load_data_for_period(start_date, end_date))
+
+
+@st.cache_resource(ttl=3600, max_entries=32)
+def _filtered_period_frame(start_date, end_date, selected_domains, selected_network_codes, admanager_sources):
+    """Recorte do período para a seleção (ver get_filtered_period_data), compartilhado entre sessões."""
+    df = _load_period_frame(start_date, end_date)
+    mask = get_dimension_index(start_date, end_date).admanager_filter_mask(
+        selected_domains, selected_network_codes, admanager_sources
+    )
+    if mask.all():
+        return df
+    return freeze_frame(df[mask])
+
+
+def get_filtered_period_data(start_date, end_date, selected_domains, selected_network_codes, admanager_sources=ADMANAGER_SOURCES):
+    """
+    Retorna o recorte de load_data_for_period para a seleção de domínios/network codes.
+    Quando nada é filtrado, os dados são os do próprio frame em cache; caso contrário a máscara
+    booleana gera UMA cópia das linhas selecionadas, feita uma vez por seleção e compartilhada pelo cache.
+    Como em load_data_for_period, cada chamada recebe uma cópia rasa sobre arrays somente leitura.
+    Passe as seleções como tuplas ordenadas para que seleções iguais compartilhem o cache.
+    """
+    return _filtered_period_frame(
+        start_date, end_date, selected_domains, selected_network_codes, admanager_sources
+    ).copy(deep=False)
+
+
+# --- NOVA FUNÇÃO: Busca nomes de conta do BigQuery (dimensão incremental) ---
+LOCAL_CACHE_DIR = os.path.join('.cache', 'dashboard') # Compartilhado entre sessões (e réplicas, se o volume for comum)
+ACCOUNT_DIMENSION_PATH = os.path.join(LOCAL_CACHE_DIR, 'account_names.parquet')
+ACCOUNT_DIMENSION_LOOKBACK_DAYS = 3 # Reprocessa os últimos dias (dados que chegam atrasados)
+
+
+def _read_account_dimension():
+    """Lê a dimensão local de contas (account_name, ultima_data). Retorna None se não existir."""
+    try:
+        return pd.read_parquet(ACCOUNT_DIMENSION_PATH)
+    except Exception: # Arquivo ausente ou corrompido: refaz a carga completa
+        return None
+
+
+def _write_account_dimension(df_accounts):
+    """Grava a dimensão local de contas (escrita atômica via os.replace)."""
+    try:
+        os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+        df_accounts.to_parquet(ACCOUNT_DIMENSION_PATH + '.tmp', index=False)
+        os.replace(ACCOUNT_DIMENSION_PATH + '.tmp', ACCOUNT_DIMENSION_PATH)
+    except Exception as e:
+        st.warning(f"⚠️ Não foi possível salvar a dimensão local de contas: {e}")
 
-    return df_combined
 
-# --- NOVA FUNÇÃO: Busca nomes de conta do BigQuery ---
 @st.cache_data(ttl=3600) # Cache por 1 hora
-def get_bigquery_distinct_account_names():
+def _refresh_account_dimension():
     """
-    Busca nomes de conta distintos da tabela campaign_insights do BigQuery.
-    Retorna um DataFrame Pandas com a coluna 'account_name'.
+    Atualiza a dimensão local de contas com as partições a partir da marca d'água e a retorna.
+    Erros da consulta são propagados (e não entram no cache): a marca d'água só avança com
+    uma consulta bem-sucedida.
     """
-    if not client: # Verifica se o cliente BigQuery foi inicializado
-        st.error("O cliente BigQuery não foi inicializado. Verifique a configuração de credenciais.")
-        return pd.DataFrame()
+    df_dimension = _read_account_dimension()
+    date_filter = ""
+    if df_dimension is not None and not df_dimension.empty:
+        high_water_mark = pd.to_datetime(df_dimension['ultima_data']).max().date()
+        date_filter = f"AND date >= '{(high_water_mark - timedelta(days=ACCOUNT_DIMENSION_LOOKBACK_DAYS)).strftime('%Y-%m-%d')}'"
 
     query = f"""
-        SELECT DISTINCT
-            account_name
+        SELECT
+            account_name,
+            MAX(date) AS ultima_data
         FROM
             {CAMPAIGN_INSIGHTS_TABLE}
         WHERE
             account_name IS NOT NULL
+            {date_filter}
+        GROUP BY
+            account_name
     """
-    
+    # Consulta direta (run_bigquery_query devolveria um frame vazio em caso de erro,
+    # indistinguível de "nenhuma conta nova")
+    df_new_accounts = client.query(query).to_dataframe()
+
+    if df_new_accounts.empty:
+        # Sem novidades: segue com a dimensão local
+        return df_dimension if df_dimension is not None else pd.DataFrame()
+
+    df_new_accounts['ultima_data'] = pd.to_datetime(df_new_accounts['ultima_data'])
+    if df_dimension is not None and not df_dimension.empty:
+        df_new_accounts = pd.concat([df_dimension, df_new_accounts], ignore_index=True)
+    df_dimension = df_new_accounts.groupby('account_name', as_index=False)['ultima_data'].max()
+
+    _write_account_dimension(df_dimension)
+    return df_dimension
+
+
+def get_bigquery_distinct_account_names():
+    """
+    Busca nomes de conta distintos da tabela campaign_insights do BigQuery.
+    A dimensão é mantida em disco com a última data em que cada conta apareceu; a cada
+    atualização só as partições a partir da marca d'água (menos ACCOUNT_DIMENSION_LOOKBACK_DAYS)
+    são consultadas, então o custo não cresce com o histórico da tabela.
+    Se a consulta falhar, retorna a dimensão local marcada como desatualizada
+    (attrs['stale'] = True) e a próxima chamada tenta de novo.
+    Retorna um DataFrame Pandas com a coluna 'account_name'.
+    """
+    if not client: # Verifica se o cliente BigQuery foi inicializado
+        st.error("O cliente BigQuery não foi inicializado. Verifique a configuração de credenciais.")
+        return pd.DataFrame()
+
     try:
-        df_bq_accounts = get_data_from_bigquery(query)
-        return df_bq_accounts
+        return _refresh_account_dimension()
     except Exception as e:
-        st.error(f"❌ Erro ao buscar account_names do BigQuery: {e}")
+        st.warning(f"⚠️ Erro ao buscar account_names do BigQuery: {e}. Usando a dimensão local de contas (desatualizada).")
+        df_dimension = _read_account_dimension()
+        df_dimension = df_dimension if df_dimension is not None else pd.DataFrame()
+        df_dimension.attrs['stale'] = True
+        return df_dimension
+
+
+def _call_sheets_with_backoff(request, *args, **kwargs):
+    """
+    Executa uma chamada à API do Google Sheets repetindo com backoff exponencial (com jitter)
+    em erros de cota (429) ou instabilidade (500/503). Outros erros são propagados.
+    """
+    for attempt in range(GSHEETS_MAX_RETRIES):
+        try:
+            return request(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            if e.code not in GSHEETS_RETRYABLE_CODES or attempt == GSHEETS_MAX_RETRIES - 1:
+                raise
+            time.sleep(min(2 ** attempt + random.random(), 32))
+
+
+def _sheet_values_to_frame(values):
+    """
+    Converte os valores de uma aba (lista de linhas, 1ª linha = cabeçalho) em DataFrame de uma vez,
+    completando as linhas curtas com '' (a API omite células vazias no fim da linha).
+    """
+    if not values or not values[0]:
         return pd.DataFrame()
+    header = values[0]
+    duplicated_headers = sorted({h for h in header if header.count(h) > 1})
+    if duplicated_headers:
+        raise ValueError(f"cabeçalhos duplicados: {duplicated_headers}")
+    width = len(header)
+    rows = [row[:width] + [''] * (width - len(row)) for row in values[1:]]
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows, columns=header)
 
-# --- NOVA FUNÇÃO: Carrega dados das abas 'BM ' do Google Sheets e faz junção com nomes de conta do BigQuery ---
-@st.cache_data(ttl=3600) 
-def load_manager_sheets_data():
+
+# --- Snapshot local da planilha de gestores (revalidado pela data de modificação) ---
+GSHEETS_SNAPSHOT_PATH = os.path.join(LOCAL_CACHE_DIR, 'manager_sheets_snapshot.pkl')
+GSHEETS_SNAPSHOT_MARKER_PATH = os.path.join(LOCAL_CACHE_DIR, 'manager_sheets_snapshot.json')
+GSHEETS_REVISION_CHECK_TTL = 60 # Segundos entre checagens da revisão da planilha
+
+
+@st.cache_resource
+def _open_manager_spreadsheet():
+    """Abre a planilha de gestores uma vez por processo (o objeto guarda apenas metadados)."""
+    return _call_sheets_with_backoff(sheets_gc.open_by_key, GSHEETS_SPREADSHEET_ID)
+
+
+@st.cache_data(ttl=GSHEETS_REVISION_CHECK_TTL)
+def get_manager_sheets_revision():
     """
-    Carrega e consolida dados de abas 'BM ' de uma planilha do Google Sheets,
-    e verifica a existência das Contas de Anúncio no BigQuery.
-    Retorna um DataFrame Pandas com os dados consolidados e a flag de existência no BQ.
+    Revisão atual da planilha de gestores (modifiedTime do Drive), obtida com uma chamada leve.
+    Retorna None se não for possível consultá-la (nesse caso vale o snapshot local existente).
     """
     if not sheets_gc:
-        st.warning("⚠️ O cliente para Google Sheets não foi inicializado. Funções que dependem dele não operarão.")
-        return pd.DataFrame()
+        return None
+    try:
+        return _call_sheets_with_backoff(_open_manager_spreadsheet().get_lastUpdateTime)
+    except Exception:
+        return None
+
+
+def _read_sheets_snapshot(revision):
+    """
+    Lê o snapshot local das abas 'BM ' se ele for da revisão pedida
+    (revision=None aceita o último snapshot salvo). Retorna None se não houver snapshot válido.
+    """
+    try:
+        with open(GSHEETS_SNAPSHOT_MARKER_PATH, encoding='utf-8') as f:
+            marker = json.load(f)
+        if revision is not None and marker.get('revision') != revision:
+            return None
+        return pd.read_pickle(GSHEETS_SNAPSHOT_PATH)
+    except Exception: # Snapshot ausente ou corrompido: baixa de novo
+        return None
+
+
+def _write_sheets_snapshot(df_sheets, revision):
+    """Grava o snapshot e o marcador de revisão (escrita atômica via os.replace)."""
+    if revision is None:
+        return
+    try:
+        os.makedirs(LOCAL_CACHE_DIR, exist_ok=True)
+        df_sheets.to_pickle(GSHEETS_SNAPSHOT_PATH + '.tmp')
+        os.replace(GSHEETS_SNAPSHOT_PATH + '.tmp', GSHEETS_SNAPSHOT_PATH)
+        with open(GSHEETS_SNAPSHOT_MARKER_PATH + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'revision': revision, 'saved_at': datetime.datetime.now().isoformat()}, f)
+        os.replace(GSHEETS_SNAPSHOT_MARKER_PATH + '.tmp', GSHEETS_SNAPSHOT_MARKER_PATH)
+    except OSError as e:
+        st.warning(f"⚠️ Não foi possível salvar o snapshot local da planilha de gestores: {e}")
+
 
+def _download_manager_sheets():
+    """
+    Baixa e consolida as abas 'BM ' da planilha do Google Sheets.
+    Retorna um DataFrame com as linhas de todas as abas e a coluna 'BM_Origem'.
+    """
     try:
-        spreadsheet = sheets_gc.open_by_key(GSHEETS_SPREADSHEET_ID) 
+        spreadsheet = _open_manager_spreadsheet()
     except gspread.exceptions.SpreadsheetNotFound:
         st.error(f"ERRO: Planilha com ID '{GSHEETS_SPREADSHEET_ID}' (nome: '{GSHEETS_SPREADSHEET_NAME}') não encontrada ou o Service Account não tem acesso.")
         st.error(f"Verifique se a planilha foi compartilhada com o e-mail da Service Account como 'Editor'.")
@@ -434,36 +1320,67 @@ def load_manager_sheets_data():
         st.error(f"❌ Erro ao abrir a planilha do Google Sheets: {e}")
         return pd.DataFrame()
 
-    all_worksheets = spreadsheet.worksheets()
     all_bm_data = []
 
     with st.spinner(f"Carregando dados da planilha '{GSHEETS_SPREADSHEET_NAME}'..."):
-        for ws in all_worksheets:
-            if ws.title.startswith("BM "):
-                try:
-                    records = ws.get_all_records()
-                    if records:
-                        df = pd.DataFrame(records)
-                        df['BM_Origem'] = ws.title
-                        all_bm_data.append(df)
-                except Exception as e:
-                    st.warning(f"⚠️ Erro ao ler a aba '{ws.title}': {e}. Ignorando esta aba.")
+        # Uma requisição de metadados + UMA requisição batchGet com todas as abas 'BM '
+        # (em vez de um get_all_records por aba, cada um com sua ida e volta e sua cota)
+        try:
+            bm_titles = [ws.title for ws in _call_sheets_with_backoff(spreadsheet.worksheets) if ws.title.startswith(GSHEETS_BM_PREFIX)]
+            value_ranges = []
+            if bm_titles:
+                batch_response = _call_sheets_with_backoff(
+                    spreadsheet.values_batch_get,
+                    [gspread.utils.absolute_range_name(title) for title in bm_titles]
+                )
+                value_ranges = batch_response.get('valueRanges', [])
+        except Exception as e:
+            st.error(f"❌ Erro ao ler as abas 'BM ' da planilha do Google Sheets: {e}")
+            return pd.DataFrame()
+
+        for title, value_range in zip(bm_titles, value_ranges):
+            try:
+                df = _sheet_values_to_frame(value_range.get('values', []))
+                if not df.empty:
+                    df['BM_Origem'] = title
+                    all_bm_data.append(df)
+            except Exception as e:
+                st.warning(f"⚠️ Erro ao ler a aba '{title}': {e}. Ignorando esta aba.")
 
     if not all_bm_data:
         st.warning("Nenhuma aba que começa com 'BM ' foi encontrada ou continha dados na planilha do Google Sheets. Retornando DataFrame vazio para gestores.")
         return pd.DataFrame()
 
-    final_consolidated_df = pd.concat(all_bm_data, ignore_index=True)
+    return pd.concat(all_bm_data, ignore_index=True)
+
+
+# --- NOVA FUNÇÃO: Carrega dados das abas 'BM ' do Google Sheets e faz junção com nomes de conta do BigQuery ---
+@st.cache_resource(ttl=3600, max_entries=4)
+def _load_manager_sheets_for_revision(revision):
+    """
+    Snapshot consolidado das abas 'BM ' para uma revisão da planilha, com a flag de existência no BQ.
+    Usa o snapshot em disco quando a revisão confere; só baixa a planilha quando ela mudou.
+    """
+    if not sheets_gc:
+        st.warning("⚠️ O cliente para Google Sheets não foi inicializado. Funções que dependem dele não operarão.")
+        return pd.DataFrame()
+
+    df_sheets = _read_sheets_snapshot(revision)
+    if df_sheets is None:
+        df_sheets = _download_manager_sheets()
+        if df_sheets.empty:
+            return df_sheets
+        _write_sheets_snapshot(df_sheets, revision)
 
     # --- NOVO: Carregar dados de account_name do BigQuery e fazer junção ---
     df_bq_accounts = get_bigquery_distinct_account_names()
 
-    if not df_bq_accounts.empty and 'Conta de Anúncio' in final_consolidated_df.columns:
-        final_consolidated_df['Conta de Anúncio_cleaned'] = final_consolidated_df['Conta de Anúncio'].astype(str).str.lower().str.strip()
+    if not df_bq_accounts.empty and 'Conta de Anúncio' in df_sheets.columns:
+        df_sheets['Conta de Anúncio_cleaned'] = df_sheets['Conta de Anúncio'].astype(str).str.lower().str.strip()
         df_bq_accounts['account_name_clean'] = df_bq_accounts['account_name'].astype(str).str.lower().str.strip()
 
         merged_df = pd.merge(
-            final_consolidated_df,
+            df_sheets,
             df_bq_accounts[['account_name_clean']].drop_duplicates(), 
             left_on='Conta de Anúncio_cleaned',
             right_on='account_name_clean',
@@ -475,96 +1392,424 @@ def load_manager_sheets_data():
         merged_df = merged_df.drop(columns=['_merge'], errors='ignore') 
         merged_df = merged_df.drop(columns=['Conta de Anúncio_cleaned'], errors='ignore')
         return merged_df
-    elif 'Conta de Anúncio' not in final_consolidated_df.columns:
+    elif 'Conta de Anúncio' not in df_sheets.columns:
         st.warning("⚠️ A coluna 'Conta de Anúncio' não foi encontrada nos dados do Google Sheets. A junção com BigQuery não pode ser realizada.")
-        return final_consolidated_df
+        return df_sheets
     else:
         st.warning("⚠️ Não foi possível carregar nomes de conta do BigQuery para realizar a junção. Retornando apenas dados do Google Sheets.")
-        return final_consolidated_df
+        return df_sheets
+
+
+def load_manager_sheets_data():
+    """
+    Carrega e consolida dados de abas 'BM ' de uma planilha do Google Sheets,
+    e verifica a existência das Contas de Anúncio no BigQuery.
+    A revisão da planilha é conferida a cada acesso (cache curto) e o snapshot dessa revisão
+    é compartilhado entre sessões: trate o DataFrame retornado como somente leitura.
+    Retorna um DataFrame Pandas com os dados consolidados e a flag de existência no BQ.
+    """
+    return _load_manager_sheets_for_revision(get_manager_sheets_revision())
+
+
+def get_manager_sheets_version():
+    """
+    Versão do snapshot atual das abas 'BM ': a revisão (modifiedTime) da planilha ou,
+    se ela não puder ser consultada, o hash do conteúdo do snapshot.
+    Serve de chave de cache para os cálculos que dependem do mapeamento de gestores.
+    """
+    revision = get_manager_sheets_revision()
+    if revision is not None:
+        return revision
+    df_manager_accounts = load_manager_sheets_data()
+    if df_manager_accounts.empty:
+        return 'empty'
+    row_hashes = pd.util.hash_pandas_object(df_manager_accounts.astype(str), index=False)
+    return hashlib.sha1(row_hashes.to_numpy().tobytes()).hexdigest()
+
+
+# --- Totais de receita (consulta agregada leve, sem carregar as linhas de UTM) ---
+REVENUE_TOTAL_GRAINS = {'day': 'DAY', 'month': 'MONTH'}
+
+
+def _query_revenue_totals_usd(start_date, end_date, grain):
+    """
+    Soma a receita do Admanager (USD) por dia ou mês direto no BigQuery.
+    Retorna poucas linhas: data (início do dia/mês) e total_receita_usd.
+    """
+    if grain not in REVENUE_TOTAL_GRAINS:
+        raise ValueError(f"Grão inválido para totais de receita: {grain!r}. Use um de {list(REVENUE_TOTAL_GRAINS)}.")
+
+    query_totals = f"""
+    SELECT
+        FORMAT_DATE('%Y-%m-%d', DATE_TRUNC(adx.date, {REVENUE_TOTAL_GRAINS[grain]})) AS data,
+        SUM(adx.revenue) AS total_receita_usd
+    FROM
+        {ADX_DOMAIN_UTMS_TABLE} AS adx
+    WHERE
+        adx.date BETWEEN '{start_date.strftime('%Y-%m-%d')}' AND '{end_date.strftime('%Y-%m-%d')}'
+    GROUP BY
+        data
+    ORDER BY
+        data
+    """
+    return get_data_from_bigquery(query_totals)
+
 
-# --- NOVO: Função para obter o faturamento total do mês anterior ---
 @st.cache_data(ttl=3600)
+def _load_open_revenue_totals_usd(start_date, end_date, grain):
+    """Totais de períodos que incluem o mês corrente (ainda mudam): cache de 1 hora."""
+    return _query_revenue_totals_usd(start_date, end_date, grain)
+
+
+@st.cache_data(ttl=datetime.timedelta(days=30)) # Meses fechados não mudam
+def _load_closed_revenue_totals_usd(start_date, end_date, grain):
+    """Totais de períodos totalmente anteriores ao mês corrente: cache longo."""
+    return _query_revenue_totals_usd(start_date, end_date, grain)
+
+
+def get_revenue_totals(start_date, end_date, grain='month'):
+    """
+    Retorna a receita total (BRL) por dia ou mês do período: colunas data e total_receita.
+    A cotação USD-BRL é aplicada na chamada, então o cache guarda só os valores em USD.
+    """
+    current_month_start = datetime.date.today().replace(day=1)
+    if end_date < current_month_start:
+        df_totals = _load_closed_revenue_totals_usd(start_date, end_date, grain)
+    else:
+        df_totals = _load_open_revenue_totals_usd(start_date, end_date, grain)
+
+    if df_totals.empty:
+        return pd.DataFrame({'data': pd.Series(dtype='datetime64[ns]'), 'total_receita': pd.Series(dtype='float64')})
+
+    return convert_revenue_to_brl(pd.DataFrame({
+        'data': df_totals['data'],
+        'total_receita': pd.to_numeric(df_totals['total_receita_usd'], errors='coerce').fillna(0.0)
+    }))
+
+
 def get_previous_month_overall_faturamento(current_period_start_date):
     """
     Calcula o faturamento total (receita) para o mês calendário completo
     imediatamente anterior ao current_period_start_date.
+    Usa a consulta agregada mensal (get_revenue_totals) em vez de carregar o mês inteiro.
     """
     # Calcula as datas para o mês completo anterior
     last_day_of_previous_month = current_period_start_date - timedelta(days=1) 
     start_day_of_previous_month = last_day_of_previous_month.replace(day=1)
 
-    # Carrega os dados de performance para o mês anterior
-    df_prev_month_performance = load_data_for_period(start_day_of_previous_month, last_day_of_previous_month)
+    df_prev_month_totals = get_revenue_totals(start_day_of_previous_month, last_day_of_previous_month, grain='month')
 
-    if df_prev_month_performance.empty:
+    if df_prev_month_totals.empty:
         st.warning(f"Nenhum dado encontrado para o mês anterior ({start_day_of_previous_month.strftime('%Y-%m-%d')} a {last_day_of_previous_month.strftime('%Y-%m-%d')}) para calcular o faturamento total.")
         return 0.0 # Retorna 0 se não houver dados para o mês anterior
-    
+
     # Soma a receita total para o mês anterior
-    overall_faturamento_prev_month = df_prev_month_performance['total_receita'].sum()
-    return overall_faturamento_prev_month
+    return float(df_prev_month_totals['total_receita'].sum())
+
+
+# --- CUBO LEVE DOS CARDS (fonte × domínio × network code, agregado no BigQuery) ---
+KPI_CUBE_DIMENSIONS = ['source', 'dominio', 'network_code']
+
+
+@st.cache_data(ttl=3600)
+def _load_kpi_rollup_usd(start_date, end_date):
+    """
+    Métricas do período somadas no servidor por fonte × domínio × network code
+    (poucas centenas de linhas em vez do grão de UTM). Receita ainda em USD.
+    """
+    dimensions_sql = ', '.join(KPI_CUBE_DIMENSIONS)
+    measures_sql = ',\n        '.join(f"SUM({col}) AS {col}" for col in PERFORMANCE_METRIC_COLUMNS)
+    query_rollup = f"""
+    WITH base AS ({build_combined_performance_sql(start_date, end_date)})
+    SELECT
+        {dimensions_sql},
+        {measures_sql}
+    FROM
+        base
+    GROUP BY
+        {dimensions_sql}
+    """
+    return get_data_from_bigquery(query_rollup)
+
+
+@st.cache_resource(ttl=3600)
+def get_kpi_cube(start_date, end_date):
+    """
+    PerformanceCube leve do período para os cards, metas e opções de filtro:
+    responde select/totals/rollup nas dimensões de KPI_CUBE_DIMENSIONS sem esperar
+    a carga completa de load_data_for_period. Receita em BRL; somente leitura.
+    """
+    df_rollup = convert_revenue_to_brl(apply_performance_schema(_load_kpi_rollup_usd(start_date, end_date)))
+    return PerformanceCube(df_rollup)
+
+
+@st.cache_resource(ttl=3600)
+def get_kpi_dimension_index(start_date, end_date):
+    """Índice de dimensões do cubo leve (opções dos filtros de domínio/network code)."""
+    return DimensionIndex(get_kpi_cube(start_date, end_date).facts, dimensions=KPI_CUBE_DIMENSIONS)
+
+
+# --- TABELA COMPLETA EM BLOCOS (paginação keyset: frame local ou BigQuery) ---
+FULL_TABLE_SOURCES = [ADMANAGER_SOURCE, ADMANAGER_META_SOURCE, 'Meta Ads']
+FULL_TABLE_TEXT_COLUMNS = ['dominio', 'pais', 'network_code', 'utm_campaign_norm']
+FULL_TABLE_LOCAL_MAX_DAYS = 62 # Janelas até aqui usam o frame do período (já carregado pelas outras páginas)
+FULL_TABLE_PAGE_CACHE_ENTRIES = 16 # Blocos do BigQuery mantidos em cache (memória limitada a N blocos)
+
+
+def full_table_uses_local_store(start_date, end_date):
+    """Janelas curtas são paginadas sobre o frame do período; as longas, direto no BigQuery."""
+    return (end_date - start_date).days + 1 <= FULL_TABLE_LOCAL_MAX_DAYS
+
+
+def build_full_table_snapshot_sql(start_date, end_date):
+    """
+    SQL da base combinada da janela com a chave do keyset: (data, row_num), onde row_num numera
+    as linhas de cada dia pela impressão digital do conteúdo. Linhas idênticas recebem números
+    distintos, então a chave é única e nenhum bloco perde ou repete linhas.
+    """
+    return f"""
+    WITH base AS ({build_combined_performance_sql(start_date, end_date)})
+    SELECT
+        base.*,
+        ROW_NUMBER() OVER (PARTITION BY data ORDER BY FARM_FINGERPRINT(TO_JSON_STRING(base))) AS row_num
+    FROM base
+    """
+
+
+def build_full_table_page_sql(snapshot_table):
+    """
+    SQL parametrizado de um bloco da tabela materializada da janela (ver _full_table_snapshot),
+    ordenado por (data, row_num): cada bloco começa logo após a última linha do anterior (sem OFFSET)
+    e só lê a tabela já calculada, sem refazer o JOIN da janela.
+    """
+    text_match_sql = ' OR '.join(
+        f"STRPOS(LOWER(IFNULL({col}, '')), @text_query) > 0" for col in FULL_TABLE_TEXT_COLUMNS
+    )
+    return f"""
+    SELECT *
+    FROM `{snapshot_table}`
+    WHERE
+        source IN UNNEST(@sources)
+        AND (@text_query = '' OR {text_match_sql})
+        AND (
+            @after_data IS NULL
+            OR data > @after_data
+            OR (data = @after_data AND row_num > @after_row_num)
+        )
+    ORDER BY data, row_num
+    LIMIT @page_limit
+    """
+
+
+@st.cache_resource(ttl=3600)
+def _full_table_snapshot(start_date, end_date):
+    """
+    Executa a base combinada da janela UMA vez e devolve o id da tabela de resultado do job
+    (tabela temporária do BigQuery, válida por 24h); os blocos são lidos dela.
+    Erros não ficam em cache: a próxima chamada tenta de novo.
+    """
+    query_job = client.query(build_full_table_snapshot_sql(start_date, end_date))
+    query_job.result()
+    destination = query_job.destination
+    return f"{destination.project}.{destination.dataset_id}.{destination.table_id}"
+
+
+@st.cache_data(ttl=3600, max_entries=FULL_TABLE_PAGE_CACHE_ENTRIES)
+def _load_full_table_page_bigquery(snapshot_table, sources, text_query, after, page_size):
+    """Bloco da tabela materializada (page_size + 1 linhas, para saber se há próximo). Receita em USD."""
+    after_data, after_row_num = after if after is not None else (None, None)
+    query_params = (
+        ('sources', 'ARRAY<STRING>', tuple(sources)),
+        ('text_query', 'STRING', text_query),
+        ('after_data', 'STRING', after_data),
+        ('after_row_num', 'INT64', after_row_num),
+        ('page_limit', 'INT64', page_size + 1),
+    )
+    return run_bigquery_query(build_full_table_page_sql(snapshot_table), query_params)
+
+
+@st.cache_resource(ttl=3600)
+def _full_table_local_order(start_date, end_date):
+    """Posições das linhas do frame do período em ordem de (data, posição): a chave do keyset local."""
+    df = load_data_for_period(start_date, end_date)
+    return np.argsort(df['data'].to_numpy(), kind='stable')
+
+
+def load_full_table_page(start_date, end_date, sources, text_query='', after=None, page_size=TABLE_PAGE_SIZE_OPTIONS[-1]):
+    """
+    Um bloco da tabela completa do período (grão de UTM), filtrado por fonte e por texto
+    (domínio, país, network code ou campanha) e paginado por keyset.
+    after: cursor devolvido pelo bloco anterior (None = primeiro bloco); o conteúdo do cursor
+    depende da origem (posição na ordem local ou (data, row_num) no BigQuery).
+    Retorna (df_bloco, próximo_cursor), com próximo_cursor None no último bloco.
+    Só o bloco pedido é trazido para o app, então a memória não cresce com o tamanho da janela;
+    no BigQuery, a janela é calculada uma vez (_full_table_snapshot) e os blocos leem o resultado.
+    Receita em BRL; o frame retornado é novo e pode ser alterado.
+    """
+    text_query = text_query.strip().lower()
+
+    if full_table_uses_local_store(start_date, end_date):
+        df = load_data_for_period(start_date, end_date)
+        if df.empty:
+            return df, None
+        order = _full_table_local_order(start_date, end_date)
+        mask = df['source'].isin(list(sources)).to_numpy()
+        if text_query:
+            mask &= _text_filter_mask(df, FULL_TABLE_TEXT_COLUMNS, text_query)
+        ranks = np.flatnonzero(mask[order]) # Posições na ordem (data, posição) que passam no filtro
+        first = 0 if after is None else np.searchsorted(ranks, after, side='right')
+        page_ranks = ranks[first:first + page_size]
+        next_after = int(page_ranks[-1]) if first + page_size < len(ranks) else None
+        return df.iloc[order[page_ranks]].reset_index(drop=True), next_after
+
+    try:
+        snapshot_table = _full_table_snapshot(start_date, end_date)
+    except Exception as e:
+        st.error(f"❌ Erro ao materializar a tabela completa no BigQuery: {e}")
+        return pd.DataFrame(), None
+
+    df_page = _load_full_table_page_bigquery(snapshot_table, tuple(sources), text_query, after, page_size)
+    next_after = None
+    if len(df_page) > page_size:
+        df_page = df_page.iloc[:page_size]
+        last_row = df_page.iloc[-1]
+        next_after = (last_row['data'].strftime('%Y-%m-%d'), int(last_row['row_num']))
+    df_page = convert_revenue_to_brl(apply_performance_schema(df_page.drop(columns='row_num', errors='ignore')))
+    return df_page, next_after
+
+
+# --- EXPLORADOR DE UTMs (árvore agregada um nível por vez no BigQuery) ---
+UTM_TREE_LEVELS = ['utm_source', 'utm_medium', 'utm_campaign_norm', 'utm_content']
+UTM_TREE_LABELS = {'utm_source': 'Source', 'utm_medium': 'Medium', 'utm_campaign_norm': 'Campaign', 'utm_content': 'Content'}
+UTM_TREE_NODE_CACHE_ENTRIES = 256 # Nós (consultas de filhos) mantidos em cache
+
+
+def build_utm_children_sql(start_date, end_date, depth):
+    """
+    SQL parametrizado dos filhos de um nó da árvore de UTMs: soma as métricas por valor
+    do nível UTM_TREE_LEVELS[depth], restrito ao caminho do nó (@utm_source, @utm_medium, ...)
+    e à regra dos filtros de domínio/network code (ver build_admanager_filter_mask).
+    Só os @top_n filhos de maior receita voltam como linhas próprias; a cauda volta somada
+    numa linha 'Outros (k)' (is_others). @top_n nulo devolve todos os filhos.
+    """
+    child = UTM_TREE_LEVELS[depth]
+    path_conditions_sql = ''.join(
+        f"\n            AND IFNULL({dim}, 'N/A') = @{dim}" for dim in UTM_TREE_LEVELS[:depth]
+    )
+    children_measures_sql = ',\n            '.join(f"SUM({col}) AS {col}" for col in PERFORMANCE_METRIC_COLUMNS)
+    measures_sql = ',\n        '.join(f"SUM({col}) AS {col}" for col in PERFORMANCE_METRIC_COLUMNS)
+    return f"""
+    WITH base AS ({build_combined_performance_sql(start_date, end_date)}),
+    children AS (
+        SELECT
+            IFNULL({child}, 'N/A') AS node,
+            {children_measures_sql}
+        FROM
+            base
+        WHERE
+            (
+                source NOT IN UNNEST(@admanager_sources)
+                OR (dominio IN UNNEST(@domains) AND network_code IN UNNEST(@network_codes))
+            ){path_conditions_sql}
+        GROUP BY
+            node
+    ),
+    bucketed AS (
+        SELECT
+            ranked.*,
+            IF(@top_n IS NULL OR node_rank <= @top_n, node_rank, @top_n + 1) AS bucket
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (ORDER BY total_receita DESC, node) AS node_rank
+            FROM children
+        ) AS ranked
+    )
+    SELECT
+        IF(bucket > IFNULL(@top_n, bucket), CONCAT(@others_label, ' (', CAST(COUNT(*) AS STRING), ')'), ANY_VALUE(node)) AS node,
+        bucket > IFNULL(@top_n, bucket) AS is_others,
+        {measures_sql}
+    FROM
+        bucketed
+    GROUP BY
+        bucket
+    ORDER BY
+        bucket
+    """
+
+
+@st.cache_data(ttl=3600, max_entries=UTM_TREE_NODE_CACHE_ENTRIES)
+def _load_utm_children_usd(start_date, end_date, path, selected_domains, selected_network_codes, admanager_sources, top_n):
+    """Filhos de um nó (top_n linhas por valor do próximo nível + 'Outros'). Receita ainda em USD."""
+    query_params = (
+        ('admanager_sources', 'ARRAY<STRING>', tuple(admanager_sources)),
+        ('domains', 'ARRAY<STRING>', tuple(selected_domains)),
+        ('network_codes', 'ARRAY<STRING>', tuple(selected_network_codes)),
+        ('top_n', 'INT64', top_n),
+        ('others_label', 'STRING', OTHERS_LABEL),
+    ) + tuple((dim, 'STRING', value) for dim, value in zip(UTM_TREE_LEVELS, path))
+    return run_bigquery_query(build_utm_children_sql(start_date, end_date, len(path)), query_params)
+
+
+def get_utm_children(start_date, end_date, path, selected_domains, selected_network_codes, admanager_sources=ADMANAGER_SOURCES, top_n=None):
+    """
+    Agregados dos filhos do nó `path` (tupla de valores a partir de utm_source) da árvore
+    source → medium → campaign → content. Só o nó pedido é consultado, com cache por nó:
+    abrir um nó não carrega as linhas no grão de UTM do período.
+    top_n: limita os filhos aos de maior receita, com a cauda somada numa linha 'Outros'
+    (is_others=True), calculada no próprio BigQuery.
+    Retorna um frame novo com 'node', 'is_others' e as métricas (receita em BRL), ordenado por receita.
+    """
+    df_children = _load_utm_children_usd(
+        start_date, end_date, tuple(path),
+        tuple(sorted(selected_domains)), tuple(sorted(selected_network_codes)), tuple(admanager_sources), top_n
+    )
+    if df_children.empty:
+        return df_children
+    # cache_data devolve uma cópia a cada chamada: o frame pode ser alterado aqui
+    df_children[PERFORMANCE_METRIC_COLUMNS] = df_children[PERFORMANCE_METRIC_COLUMNS].fillna(0).astype('float64')
+    return convert_revenue_to_brl(df_children)
 
 
 # --- FUNÇÃO PRINCIPAL: Agrega os dados de performance por Gestor ---
-@st.cache_data(ttl=3600) 
-def get_manager_ranking_data(df_ad_performance_input: pd.DataFrame): 
+@st.cache_resource(ttl=3600, max_entries=32)
+def get_manager_ranking_data(start_date, end_date, sheets_version=None):
     """
     Agrega as métricas por gestor para gerar o ranking e retorna também
     o DataFrame de performance diária com a coluna 'Gestor' adicionada.
-    df_ad_performance_input: DataFrame com dados de performance já carregados do BigQuery.
-    Retorna: (df_ranking, df_daily_performance_with_managers)
+    A chave de cache é (start_date, end_date, sheets_version): os dados de performance são
+    carregados aqui dentro, então nenhum DataFrame precisa ser hasheado a cada rerun.
+    Os gestores são atribuídos no BigQuery (mapeamento enviado como parâmetros), que devolve só o
+    grão (data, Gestor, projeto); se isso falhar, usa o período completo com o mapeamento local,
+    reduzido ao mesmo grão e às mesmas colunas.
+    sheets_version: versão do snapshot das abas 'BM ' (get_manager_sheets_version).
+    Retorna: (df_ranking, df_daily_performance_with_managers), compartilhados e somente leitura.
     """
-    if df_ad_performance_input.empty:
-        st.warning("⚠️ DataFrame de performance vazio fornecido para agregação de gestores.")
-        return pd.DataFrame(), pd.DataFrame() # Retorna dois DataFrames vazios
-    
-    # 2. Carregar dados dos gestores do Google Sheets
-    df_manager_accounts = load_manager_sheets_data()
+    # 2. Mapeamento compilado conta -> gestor do snapshot atual do Google Sheets
+    manager_map = get_account_manager_map(sheets_version)
 
-    if df_manager_accounts.empty:
+    if manager_map.empty:
         st.warning("⚠️ Nenhum dado de gestores/contas encontrado na planilha do Google Sheets. O ranking de gestores pode estar incompleto.")
         return pd.DataFrame(), pd.DataFrame() # Retorna dois DataFrames vazios
 
-    # Usar os dados de performance de entrada
-    merged_df = df_ad_performance_input.copy()
-
-    # Preparar chaves de junção
-    df_manager_accounts['Conta de Anúncio_cleaned'] = df_manager_accounts['Conta de Anúncio'].astype(str).str.lower().str.strip()
+    df_performance = load_manager_performance_from_bigquery(start_date, end_date, sheets_version)
 
-    # Realizar a junção dos dados de performance com os dados dos gestores
-    merged_df = pd.merge(
-        merged_df, 
-        df_manager_accounts[['BM_Origem', 'Responsável', 'Conta de Anúncio', 'Conta de Anúncio_cleaned']],
-        left_on='utm_campaign_norm',
-        right_on='Conta de Anúncio_cleaned',
-        how='left'
-    )
-    
-    # Preencher gestores não atribuídos explicitamente no sheets
-    if 'Responsável' in merged_df.columns:
-        merged_df['Gestor'] = merged_df['Responsável'].fillna('Não Atribuído')
-    else:
-        merged_df['Gestor'] = 'Não Atribuído' # Fallback
-    
-    # Remover colunas auxiliares de junção e da planilha que não serão mais usadas
-    merged_df = merged_df.drop(columns=['Conta de Anúncio_cleaned', 'Responsável', 'BM_Origem', 'Conta de Anúncio'], errors='ignore')
+    if df_performance is None:
+        # Atribuição local sobre o período completo, reduzida ao mesmo grão/colunas do BigQuery
+        df_performance = aggregate_manager_performance(load_data_for_period(start_date, end_date), manager_map)
 
-    # Garantir que as colunas numéricas são float para cálculos
-    numeric_cols_for_agg = ['total_impressoes', 'total_cliques', 'total_custo', 'total_receita']
-    for col in numeric_cols_for_agg:
-        if col not in merged_df.columns: 
-            merged_df[col] = 0.0
-        merged_df[col] = pd.to_numeric(merged_df[col], errors='coerce').fillna(0) # Garante após o merge
+    if df_performance.empty:
+        st.warning("⚠️ DataFrame de performance vazio fornecido para agregação de gestores.")
+        return pd.DataFrame(), pd.DataFrame() # Retorna dois DataFrames vazios
 
-    # Calcular Lucro Bruto
-    merged_df['Lucro_Bruto'] = merged_df['total_receita'] - merged_df['total_custo']
+    merged_df = df_performance.assign(
+        Lucro_Bruto=df_performance['total_receita'] - df_performance['total_custo'] # Calcular Lucro Bruto
+    )
 
-    # --- Armazenar o DataFrame diário com gestores antes de agrupar ---
-    df_daily_performance_with_managers = merged_df.copy()
+    # --- Armazenar o DataFrame diário com gestores antes de agrupar (somente leitura) ---
+    df_daily_performance_with_managers = merged_df
 
     # Agrupar por Gestor e calcular métricas agregadas para o ranking
-    df_ranking = merged_df.groupby('Gestor').agg(
-        Total_Projetos=('utm_campaign_norm', 'nunique'), # <<<<< ADICIONE ESTA LINHA
+    df_ranking = merged_df.groupby('Gestor', observed=True).agg(
+        Total_Projetos=('utm_campaign_norm', 'nunique'),
         Total_Faturamento=('total_receita', 'sum'),
         Total_Custo=('total_custo', 'sum'),
         Lucro_Bruto=('Lucro_Bruto', 'sum'), 
@@ -572,16 +1817,25 @@ def get_manager_ranking_data(df_ad_performance_input: pd.DataFrame):
         Total_Cliques=('total_cliques', 'sum'),
     ).reset_index()
 
-    # Calcular ROI e ROAS após a agregação
-    df_ranking['ROI_Percentual'] = (df_ranking['Lucro_Bruto'] / df_ranking['Total_Custo'] * 100).replace([np.inf, -np.inf], np.nan).fillna(0)
-    df_ranking['ROAS'] = (df_ranking['Total_Faturamento'] / df_ranking['Total_Custo']).replace([np.inf, -np.inf], np.nan).fillna(0)
+    return finalize_manager_ranking(df_ranking), df_daily_performance_with_managers
+
+
+def finalize_manager_ranking(df_ranking):
+    """
+    Completa o ranking agregado por gestor (somas já calculadas) com ROI, ROAS,
+    comissão, fundo de reserva e lucro líquido final. Retorna uma cópia: df_ranking pode ser o
+    ranking compartilhado do cache (get_manager_ranking_data) e não é alterado.
+    """
+    df_ranking = df_ranking.copy() # Uma linha por gestor: a cópia é barata
+    # Calcular ROI e ROAS após a agregação (custo zero -> 0)
+    df_ranking['ROI_Percentual'] = calculate_roi(df_ranking['Total_Faturamento'], df_ranking['Total_Custo'], zero_division=0.0)
+    df_ranking['ROAS'] = calculate_roas(df_ranking['Total_Faturamento'], df_ranking['Total_Custo'], zero_division=0.0)
     
     # Calcular Comissao, Fundo Reserva, Lucro Liquido Final para cada gestor
     df_ranking['Comissao'] = df_ranking['Total_Faturamento'] * COMISSAO_PERCENT
     df_ranking['Fundo_Reserva'] = df_ranking['Lucro_Bruto'] * FUNDO_RESERVA_PERCENT
     df_ranking['Lucro_Liquido_Final'] = df_ranking['Lucro_Bruto'] - df_ranking['Comissao'] - df_ranking['Fundo_Reserva']
-
-    return df_ranking, df_daily_performance_with_managers
+    return df_ranking
 
 # Em utils.py
 
@@ -601,7 +1855,7 @@ def get_project_ranking_data(df):
             return pd.DataFrame() # Retorna um DataFrame vazio para evitar quebrar o app
 
     # Agrega as métricas base por Projeto (utm_campaign_norm) e Gestor
-    df_agg = df.groupby(['utm_campaign_norm', 'Gestor']).agg(
+    df_agg = df.groupby(['utm_campaign_norm', 'Gestor'], observed=True).agg(
         Total_Receita=('total_receita', 'sum'),
         Total_Custo=('total_custo', 'sum')
     ).reset_index()
@@ -615,9 +1869,7 @@ def get_project_ranking_data(df):
     df_agg['Lucro_Liquido_Final'] = df_agg['Lucro_Bruto'] - df_agg['Comissao'] - (df_agg['Lucro_Bruto'] * FUNDO_RESERVA_PERCENT)
 
     # Recalcula o ROI (Retorno sobre Investimento) baseado nos valores agregados
-    df_agg['ROI_Percentual'] = (
-        (df_agg['Lucro_Bruto'] / df_agg['Total_Custo']) * 100
-    ).replace([np.inf, -np.inf], np.nan).fillna(0) # Trata divisão por zero, substituindo por 0 ou NaN
+    df_agg['ROI_Percentual'] = calculate_roi(df_agg['Total_Receita'], df_agg['Total_Custo'], zero_division=0.0) # Custo zero -> 0
 
     # Renomeia colunas para o display final
     df_agg = df_agg.rename(columns={
@@ -630,3 +1882,485 @@ def get_project_ranking_data(df):
     final_cols = ['Projeto', 'Gestor', 'Investimento', 'Receita', 'Lucro_Bruto', 'Comissao', 'Lucro_Liquido_Final', 'ROI_Percentual']
     return df_agg[final_cols]
 
+
+# --- Mapeamento Conta de Anúncio -> Gestor (a partir do Google Sheets) ---
+UNASSIGNED_MANAGER = 'Não Atribuído'
+
+
+@st.cache_resource(ttl=3600, max_entries=4)
+def get_account_manager_map(sheets_version=None):
+    """
+    Compila o mapeamento {conta de anúncio normalizada (lower/strip): Responsável} das abas 'BM ',
+    uma vez por snapshot da planilha (sheets_version só entra na chave de cache).
+    O mapeamento é compartilhado entre sessões (somente leitura).
+    Contas repetidas entre abas são resolvidas de forma determinística: vence a aba de menor
+    nome (BM_Origem) que tenha Responsável preenchido, independente da ordem das abas.
+    """
+    df_manager_accounts = load_manager_sheets_data()
+    if df_manager_accounts.empty or 'Conta de Anúncio' not in df_manager_accounts.columns or 'Responsável' not in df_manager_accounts.columns:
+        return pd.Series(dtype=object)
+
+    df_accounts = pd.DataFrame({
+        'conta': df_manager_accounts['Conta de Anúncio'].astype(str).str.lower().str.strip(),
+        'aba': df_manager_accounts['BM_Origem'].astype(str) if 'BM_Origem' in df_manager_accounts.columns else '',
+        'gestor': df_manager_accounts['Responsável']
+    }).dropna(subset=['gestor'])
+    df_accounts = df_accounts.sort_values(['conta', 'aba'], kind='stable').drop_duplicates('conta', keep='first')
+    return pd.Series(df_accounts['gestor'].to_numpy(), index=df_accounts['conta'].to_numpy())
+
+
+def map_projects_to_managers(projects, manager_map):
+    """
+    Atribui o Gestor de cada linha a partir da coluna categórica de projetos (utm_campaign_norm).
+    O mapeamento é aplicado às categorias (uma vez por valor distinto) e expandido pelos códigos.
+    """
+    projects = projects.astype('category')
+    manager_by_category = pd.Series(projects.cat.categories, dtype=object).map(manager_map).fillna(UNASSIGNED_MANAGER).to_numpy()
+    manager_categories = pd.unique(manager_by_category)
+    category_codes = pd.Categorical(manager_by_category, categories=manager_categories).codes
+    return pd.Series(
+        pd.Categorical.from_codes(category_codes[projects.cat.codes.to_numpy()], categories=manager_categories),
+        index=projects.index
+    )
+
+
+# Grão das linhas de performance por gestor (mesmo nos dois caminhos de atribuição)
+MANAGER_PERFORMANCE_GRAIN = ['data', 'Gestor', 'utm_campaign_norm']
+
+
+def finish_manager_performance(df_managers):
+    """
+    Padroniza o frame de performance por gestor: schema de performance aplicado
+    (dimensões ausentes como 'N/A') e Gestor categórico, com as mesmas colunas
+    qualquer que seja o caminho de atribuição (BigQuery ou local).
+    """
+    df_managers = ensure_performance_schema(df_managers)
+    df_managers = df_managers.assign(Gestor=df_managers['Gestor'].astype(object).fillna(UNASSIGNED_MANAGER).astype('category'))
+    return df_managers[list(PERFORMANCE_SCHEMA) + ['Gestor']]
+
+
+def aggregate_manager_performance(df_performance, manager_map):
+    """
+    Atribuição local: Gestor via lookup nos códigos de utm_campaign_norm (contas não mapeadas
+    ficam como 'Não Atribuído') e soma no grão MANAGER_PERFORMANCE_GRAIN, como no BigQuery.
+    """
+    df_performance = ensure_performance_schema(df_performance)
+    df_managers = (
+        df_performance
+        .assign(Gestor=map_projects_to_managers(df_performance['utm_campaign_norm'], manager_map))
+        .groupby(MANAGER_PERFORMANCE_GRAIN, observed=True)[PERFORMANCE_METRIC_COLUMNS].sum()
+        .reset_index()
+    )
+    return finish_manager_performance(df_managers)
+
+
+def load_manager_performance_from_bigquery(start_date, end_date, sheets_version):
+    """
+    Atribui os gestores no servidor: o mapeamento conta -> gestor do snapshot da planilha vai
+    como parâmetros da consulta (dois arrays alinhados), sem gravar tabela alguma, e a base
+    combinada é agregada no grão MANAGER_PERFORMANCE_GRAIN.
+    Retorna o DataFrame (receita já em BRL, mesmo formato de aggregate_manager_performance)
+    ou None se a consulta falhar ou vier vazia (o chamador usa a atribuição local).
+    """
+    manager_map = get_account_manager_map(sheets_version)
+    if not client or manager_map.empty:
+        return None
+
+    metric_sums = ',\n        '.join(f"SUM(c.{col}) AS {col}" for col in PERFORMANCE_METRIC_COLUMNS)
+    query_managers = f"""
+    WITH Combined AS (
+        {build_combined_performance_sql(start_date, end_date)}
+    ),
+    Managers AS (
+        SELECT conta, @responsaveis[OFFSET(pos)] AS responsavel
+        FROM UNNEST(@contas) AS conta WITH OFFSET AS pos
+    )
+    SELECT
+        c.data,
+        COALESCE(m.responsavel, @unassigned_manager) AS Gestor,
+        c.utm_campaign_norm,
+        {metric_sums}
+    FROM
+        Combined AS c
+    LEFT JOIN
+        Managers AS m
+    ON
+        c.utm_campaign_norm = m.conta
+    GROUP BY
+        c.data, Gestor, c.utm_campaign_norm
+    """
+    query_params = (
+        ('contas', 'ARRAY<STRING>', tuple(manager_map.index.astype(str))),
+        ('responsaveis', 'ARRAY<STRING>', tuple(manager_map.astype(str))),
+        ('unassigned_manager', 'STRING', UNASSIGNED_MANAGER),
+    )
+    with st.spinner("Agregando dados de gestores no BigQuery..."):
+        df_managers = run_bigquery_query(query_managers, query_params)
+    if df_managers.empty:
+        return None
+    return convert_revenue_to_brl(finish_manager_performance(df_managers))
+
+
+# --- GRÃO TEMPORAL DOS GRÁFICOS (dia, semana ou mês conforme o tamanho da janela) ---
+TIME_GRAIN_LABELS = {'day': 'Dia', 'week': 'Semana', 'month': 'Mês'}
+TIME_GRAIN_ADJECTIVES = {'day': 'Diário', 'week': 'Semanal', 'month': 'Mensal'}
+TIME_GRAIN_TICKFORMATS = {'day': '%d/%m/%Y', 'week': '%d/%m/%Y', 'month': '%m/%Y'}
+TIME_GRAIN_MAX_DAILY_DAYS = 62 # Até ~2 meses: um ponto por dia
+TIME_GRAIN_MAX_WEEKLY_DAYS = 183 # Até ~6 meses: um ponto por semana; acima disso, por mês
+
+
+def choose_time_grain(start_date, end_date):
+    """Escolhe o grão dos gráficos ('day', 'week' ou 'month') pelo tamanho da janela."""
+    n_days = (end_date - start_date).days + 1
+    if n_days <= TIME_GRAIN_MAX_DAILY_DAYS:
+        return 'day'
+    if n_days <= TIME_GRAIN_MAX_WEEKLY_DAYS:
+        return 'week'
+    return 'month'
+
+
+def time_grain_selector(start_date, end_date, key):
+    """Seletor do grão dos gráficos; 'Automático' usa choose_time_grain. Retorna o grão escolhido."""
+    auto_grain = choose_time_grain(start_date, end_date)
+    choice = st.selectbox(
+        "Agrupar gráficos por",
+        ['auto'] + list(TIME_GRAIN_LABELS),
+        format_func=lambda grain: f"Automático ({TIME_GRAIN_LABELS[auto_grain]})" if grain == 'auto' else TIME_GRAIN_LABELS[grain],
+        key=key
+    )
+    return auto_grain if choice == 'auto' else choice
+
+
+def bucket_dates(dates, grain):
+    """Leva cada data ao início do seu período: o próprio dia, a segunda-feira da semana ou o dia 1 do mês."""
+    dates = pd.Series(pd.to_datetime(dates)).dt.normalize()
+    if grain == 'week':
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')
+    if grain == 'month':
+        return dates.dt.to_period('M').dt.to_timestamp()
+    return dates
+
+
+def resample_time_series(df, grain, measures, date_col='data'):
+    """Soma as medidas por período do grão (o grão diário devolve o próprio frame)."""
+    if grain == 'day' or df.empty:
+        return df
+    return (
+        df.assign(**{date_col: bucket_dates(df[date_col], grain).to_numpy()})
+        .groupby(date_col, as_index=False)[list(measures)].sum()
+    )
+
+
+# --- CUBO OLAP EM MEMÓRIA (data × domínio × país × network × source × projeto) ---
+# Gestor fica fora do cubo: as visões por gestor usam o store diário (chaveado pela versão da planilha)
+CUBE_DIMENSIONS = ['data', 'source', 'dominio', 'pais', 'network_code', 'utm_campaign_norm']
+CUBE_MEASURES = PERFORMANCE_METRIC_COLUMNS
+_CUBE_MEMO_LIMIT = 64 # Limite de consultas/seleções memorizadas por cubo
+
+
+class PerformanceCube:
+    """
+    Cubo com as medidas aditivas do período no menor grão necessário às páginas
+    (as UTMs de source/medium/content/term ficam de fora e são somadas).
+    Roll-ups e recortes são memorizados; uma consulta nova é respondida a partir do
+    menor agregado já calculado que contenha as dimensões pedidas.
+    Os frames retornados são compartilhados: trate-os como somente leitura.
+    O cubo vem do cache_resource e é usado por várias sessões ao mesmo tempo: as memórias
+    só são lidas e alteradas sob self._memo_lock (os cálculos rodam fora dele).
+    """
+
+    def __init__(self, facts):
+        self.facts = facts
+        self._memo_lock = threading.Lock()
+        self._rollups = {}
+        self._selections = {}
+        self._time_series = {}
+
+    @classmethod
+    def from_performance_frame(cls, df):
+        """Constrói o cubo a partir de um frame do schema de load_data_for_period."""
+        df = ensure_performance_schema(df)
+        facts = df.groupby(CUBE_DIMENSIONS, observed=True, sort=False)[CUBE_MEASURES].sum().reset_index()
+        return cls(facts)
+
+    @staticmethod
+    def _where_key(where):
+        if not where:
+            return ()
+        return tuple(sorted((dim, tuple(sorted(map(str, values)))) for dim, values in where.items()))
+
+    def _recall(self, memo, key):
+        with self._memo_lock:
+            return memo.get(key)
+
+    def _remember(self, memo, key, value):
+        with self._memo_lock:
+            if key not in memo and len(memo) >= _CUBE_MEMO_LIMIT:
+                memo.clear()
+            # Se outra sessão calculou a mesma chave antes, todas passam a usar o mesmo objeto
+            return memo.setdefault(key, value)
+
+    def select(self, selected_domains, selected_network_codes, admanager_sources=ADMANAGER_SOURCES):
+        """
+        Sub-cubo com a regra dos filtros de domínio/network code (ver build_admanager_filter_mask).
+        """
+        key = (tuple(sorted(selected_domains)), tuple(sorted(selected_network_codes)), tuple(admanager_sources))
+        selection = self._recall(self._selections, key)
+        if selection is not None:
+            return selection
+        mask = build_admanager_filter_mask(self.facts, selected_domains, selected_network_codes, admanager_sources)
+        return self._remember(self._selections, key, PerformanceCube(self.facts if mask.all() else self.facts[mask]))
+
+    def rollup(self, by=(), where=None):
+        """
+        Soma as medidas agrupando por `by` (lista de dimensões), restrito a `where`
+        ({dimensão: valores permitidos}). Sem `by`, retorna uma linha com os totais.
+        """
+        by = list(by)
+        where_key = self._where_key(where)
+        key = (tuple(by), where_key)
+        memo_frame = self._recall(self._rollups, key)
+        if memo_frame is not None:
+            return memo_frame
+
+        # Menor agregado já calculado (sem filtro) que contenha as dimensões necessárias
+        needed = set(by) | {dim for dim, _ in where_key}
+        with self._memo_lock:
+            memo_items = list(self._rollups.items())
+        source = self.facts
+        for (memo_by, memo_where), memo_frame in memo_items:
+            if not memo_where and needed <= set(memo_by) and len(memo_frame) < len(source):
+                source = memo_frame
+
+        if where:
+            mask = np.ones(len(source), dtype=bool)
+            for dim, values in where.items():
+                mask &= source[dim].isin(list(values)).to_numpy()
+            source = source[mask]
+
+        if by:
+            result = source.groupby(by, observed=True)[CUBE_MEASURES].sum().reset_index()
+        else:
+            result = source[CUBE_MEASURES].sum().to_frame().T.reset_index(drop=True)
+        return self._remember(self._rollups, key, result)
+
+    def totals(self, where=None):
+        """Totais das medidas (Series) para o recorte `where`."""
+        return self.rollup((), where).iloc[0]
+
+    def time_series(self, grain='day', where=None):
+        """
+        Medidas por período ('day', 'week' ou 'month') a partir do roll-up diário memorizado;
+        a série no grão pedido também é memorizada.
+        """
+        key = (grain, self._where_key(where))
+        series = self._recall(self._time_series, key)
+        if series is not None:
+            return series
+        daily = self.rollup(['data'], where)
+        return self._remember(self._time_series, key, resample_time_series(daily, grain, CUBE_MEASURES))
+
+
+@st.cache_resource(ttl=3600)
+def get_performance_cube(start_date, end_date):
+    """
+    Cubo (PerformanceCube) do período, construído uma vez por janela carregada e compartilhado.
+    Depende só dos dados do período (nada da planilha de gestores), então a chave (início, fim) basta.
+    """
+    return PerformanceCube.from_performance_frame(load_data_for_period(start_date, end_date))
+
+
+# --- STORE DIÁRIO POR GESTOR (somas de prefixo por dia) ---
+MANAGER_STORE_TTL = 3600 # Segundos de validade de um store montado
+MANAGER_STORE_REGISTRY_SIZE = 8 # Stores já montados consultados antes de montar um novo
+MANAGER_STORE_MEASURES = ['total_receita', 'total_custo', 'total_impressoes', 'total_cliques']
+MANAGER_STORE_BITMAP_MAX_BYTES = 64 * 1024 * 1024 # Acima disso, projetos distintos são contados nas linhas do store
+
+
+class ManagerDailyStore:
+    """
+    Medidas aditivas por dia × gestor (receita, custo, impressões, cliques e nº de linhas)
+    guardadas como somas de prefixo ao longo dos dias. Totais de qualquer janela saem de
+    uma subtração (prefixo[fim] - prefixo[início]), em O(dias × gestores).
+    Projetos distintos ficam num bitmap exato por dia, com 1 bit por par (gestor, projeto): cada
+    gestor indexa só os próprios projetos, então o bitmap ocupa dias × pares / 8 bytes (e não
+    dias × gestores × projetos). A contagem de uma janela é o OR dos bitmaps dos dias seguido de
+    popcount, sem voltar às linhas. Acima de MANAGER_STORE_BITMAP_MAX_BYTES o bitmap não é montado
+    e as contagens saem das linhas da janela.
+    O grão dia × gestor × projeto, ordenado por dia, fica disponível para o ranking de projetos.
+    """
+
+    def __init__(self, df_daily_with_managers, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+
+        self.projects = (
+            df_daily_with_managers
+            .groupby(['data', 'Gestor', 'utm_campaign_norm'], observed=True)[PERFORMANCE_METRIC_COLUMNS].sum()
+            .reset_index()
+            .sort_values('data', kind='stable', ignore_index=True)
+        )
+        self.days = pd.DatetimeIndex(self.projects['data'].unique())
+        self.managers = pd.Index(self.projects['Gestor'].astype(object).unique())
+
+        day_idx = self.days.get_indexer(self.projects['data'])
+        manager_idx = self.managers.get_indexer(self.projects['Gestor'].astype(object))
+        values = np.column_stack([self.projects[MANAGER_STORE_MEASURES].to_numpy(dtype='float64'), np.ones(len(self.projects))])
+
+        # daily[d, g, m]: soma do dia d para o gestor g; a última medida conta as linhas (presença)
+        self._daily = np.zeros((len(self.days), len(self.managers), values.shape[1]))
+        np.add.at(self._daily, (day_idx, manager_idx), values)
+        self._prefix = np.concatenate([np.zeros((1,) + self._daily.shape[1:]), np.cumsum(self._daily, axis=0)])
+        self._project_day_positions = self.days.get_indexer(self.projects['data'])
+
+        # Pares (gestor, projeto) ordenados por gestor: os bits de cada gestor ocupam um trecho
+        # próprio de bytes do bitmap do dia (offsets em _byte_offsets)
+        project_codes = self.projects['utm_campaign_norm'].astype('category').cat.codes.to_numpy().astype(np.int64)
+        n_projects = int(project_codes.max()) + 1 if len(project_codes) else 1
+        pairs, row_pair = np.unique(manager_idx * n_projects + project_codes, return_inverse=True)
+        pair_managers = pairs // n_projects
+        self._pair_projects = pairs % n_projects # Código global do projeto de cada par
+        self._pair_offsets = np.searchsorted(pair_managers, np.arange(len(self.managers) + 1))
+        self._byte_offsets = np.concatenate([[0], np.cumsum((np.diff(self._pair_offsets) + 7) // 8)])
+        self.project_bitmap_bytes = len(self.days) * int(self._byte_offsets[-1])
+
+        self._project_bitmaps = None
+        if self.project_bitmap_bytes <= MANAGER_STORE_BITMAP_MAX_BYTES:
+            # bitmaps[d, byte]: bit do par com linhas no dia d (escrito direto, sem matriz booleana densa)
+            local_bits = row_pair - self._pair_offsets[manager_idx]
+            self._project_bitmaps = np.zeros((len(self.days), int(self._byte_offsets[-1])), dtype=np.uint8)
+            np.bitwise_or.at(
+                self._project_bitmaps,
+                (day_idx, self._byte_offsets[manager_idx] + local_bits // 8),
+                (0x80 >> (local_bits % 8)).astype(np.uint8) # Mesma ordem de bits de np.packbits
+            )
+
+    def covers(self, start_date, end_date):
+        """Indica se a janela pedida está contida no período carregado no store."""
+        return self.start_date <= start_date and end_date <= self.end_date
+
+    def _day_bounds(self, start_date, end_date):
+        lo = self.days.searchsorted(pd.Timestamp(start_date), side='left')
+        hi = self.days.searchsorted(pd.Timestamp(end_date), side='right')
+        return lo, hi
+
+    def _manager_mask(self, managers):
+        if managers is None:
+            return np.ones(len(self.managers), dtype=bool)
+        return self.managers.isin(list(managers))
+
+    def project_rows(self, start_date, end_date):
+        """Linhas dia × gestor × projeto da janela (fatia contígua, sem reagrupar)."""
+        first, last = np.searchsorted(self._project_day_positions, self._day_bounds(start_date, end_date))
+        return self.projects.iloc[first:last]
+
+    def ranking(self, start_date, end_date):
+        """Ranking por gestor da janela, com as mesmas colunas de get_manager_ranking_data."""
+        lo, hi = self._day_bounds(start_date, end_date)
+        window = self._prefix[hi] - self._prefix[lo]
+        present = window[:, -1] > 0
+
+        df_ranking = pd.DataFrame({
+            'Gestor': self.managers[present],
+            'Total_Faturamento': window[present, 0],
+            'Total_Custo': window[present, 1],
+            'Lucro_Bruto': window[present, 0] - window[present, 1],
+            'Total_Impressoes': window[present, 2],
+            'Total_Cliques': window[present, 3],
+        })
+        df_ranking.insert(1, 'Total_Projetos', self.distinct_projects(start_date, end_date)[present])
+        return finalize_manager_ranking(df_ranking)
+
+    def distinct_projects(self, start_date, end_date, managers=None, combined=False):
+        """
+        Projetos distintos da janela por gestor (array na ordem de self.managers), ou o total
+        de projetos distintos dos gestores escolhidos com combined=True.
+        """
+        if self._project_bitmaps is None:
+            return self._distinct_projects_from_rows(start_date, end_date, managers, combined)
+
+        lo, hi = self._day_bounds(start_date, end_date)
+        if hi > lo:
+            window_bitmap = np.bitwise_or.reduce(self._project_bitmaps[lo:hi], axis=0)
+        else:
+            window_bitmap = np.zeros(self._project_bitmaps.shape[1], dtype=np.uint8)
+        if not combined:
+            return np.add.reduceat(np.bitwise_count(window_bitmap).astype('int64'), self._byte_offsets[:-1])
+
+        # Pares ativos dos gestores escolhidos -> códigos globais (um projeto pode ter mais de um gestor)
+        set_bits = np.flatnonzero(np.unpackbits(window_bitmap))
+        bit_managers = np.searchsorted(self._byte_offsets, set_bits // 8, side='right') - 1
+        chosen = self._manager_mask(managers)[bit_managers]
+        active_pairs = self._pair_offsets[bit_managers[chosen]] + set_bits[chosen] - 8 * self._byte_offsets[bit_managers[chosen]]
+        return int(np.unique(self._pair_projects[active_pairs]).size)
+
+    def _distinct_projects_from_rows(self, start_date, end_date, managers, combined):
+        """Mesma contagem de distinct_projects a partir das linhas da janela (sem bitmap)."""
+        rows = self.project_rows(start_date, end_date)
+        row_managers = rows['Gestor'].astype(object)
+        if combined:
+            return int(rows.loc[self._manager_mask(managers)[self.managers.get_indexer(row_managers)], 'utm_campaign_norm'].nunique())
+        counts = rows.groupby(row_managers)['utm_campaign_norm'].nunique()
+        return counts.reindex(self.managers, fill_value=0).to_numpy(dtype='int64')
+
+    def daily_series(self, start_date, end_date, managers=None, grain='day'):
+        """
+        Receita e custo por dia da janela somados sobre os gestores escolhidos (None = todos);
+        com grain='week' ou 'month' os dias são somados por período.
+        """
+        lo, hi = self._day_bounds(start_date, end_date)
+        window = self._daily[lo:hi][:, self._manager_mask(managers)].sum(axis=1)
+        present = window[:, -1] > 0
+        df_series = pd.DataFrame({
+            'data': self.days[lo:hi][present],
+            'total_receita': window[present, 0],
+            'total_custo': window[present, 1],
+        })
+        return resample_time_series(df_series, grain, ['total_receita', 'total_custo'])
+
+    def totals(self, start_date, end_date, managers=None):
+        """Totais da janela (Series com MANAGER_STORE_MEASURES) para os gestores escolhidos."""
+        lo, hi = self._day_bounds(start_date, end_date)
+        window = (self._prefix[hi] - self._prefix[lo])[self._manager_mask(managers)].sum(axis=0)
+        return pd.Series(window[:-1], index=MANAGER_STORE_MEASURES)
+
+
+@st.cache_resource(ttl=MANAGER_STORE_TTL, max_entries=MANAGER_STORE_REGISTRY_SIZE)
+def _build_manager_daily_store(start_date, end_date, sheets_version):
+    """Constrói o store a partir da agregação por gestor do período (get_manager_ranking_data)."""
+    _, df_daily_with_managers = get_manager_ranking_data(start_date, end_date, sheets_version)
+    if df_daily_with_managers.empty:
+        return None
+    return ManagerDailyStore(df_daily_with_managers, start_date, end_date)
+
+
+@st.cache_resource
+def _manager_store_registry():
+    """
+    Stores já montados (compartilhados entre sessões): trava e lista de (sheets_version, montado_em, store).
+    A trava vive junto da lista para que toda sessão use a mesma.
+    """
+    return threading.Lock(), []
+
+
+def get_manager_daily_store(start_date, end_date, sheets_version):
+    """
+    Store diário por gestor que cobre a janela pedida. Um store já montado (mesma versão da
+    planilha, dentro da validade) que contenha a janela é reaproveitado; caso contrário é
+    montado um store só para a janela pedida, sem carregar dias além dela.
+    Retorna None se não houver dados de gestores.
+    """
+    registry_lock, registry = _manager_store_registry()
+    # Busca, montagem e inserção sob a trava: sessões simultâneas não alteram a lista ao mesmo
+    # tempo e a segunda sessão reaproveita o store montado pela primeira
+    with registry_lock:
+        now = time.time()
+        for version, built_at, store in registry:
+            if version == sheets_version and now - built_at < MANAGER_STORE_TTL and store.covers(start_date, end_date):
+                return store
+
+        store = _build_manager_daily_store(start_date, end_date, sheets_version)
+        if store is not None:
+            registry.insert(0, (sheets_version, now, store))
+            del registry[MANAGER_STORE_REGISTRY_SIZE:]
+        return store